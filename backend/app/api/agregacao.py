@@ -1,66 +1,162 @@
-from fastapi import APIRouter, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status, Query
 from pydantic import BaseModel
-from typing import Optional, List
+from sqlalchemy.orm import Session
+from typing import Annotated, Optional, List
+from datetime import datetime
 import pika
 import os
 import json
+from app.api.deps import get_db
+from app.crud.tarefa import atualizar_status_tarefa, get_tarefa, registrar_tarefa
+from app.core.respostas import resposta_arquivo_json
+from app.core.cache_http import CACHE_MAX_AGE_RESULTADOS, cabecalhos_cache, etag_arquivo, resposta_nao_modificada
 
 router = APIRouter(prefix="/agregacao", tags=["Agregação"])
 
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "localhost")
 RABBITMQ_QUEUE = os.getenv("RABBITMQ_QUEUE", "processos")
 
-class PotenciaMaximaParams(BaseModel):
-    inversor_id: int
-    data_inicio: str
-    data_fim: str
+def publicar_na_fila(tipo, parametros, tarefa_id=None):
+    """Envia uma solicitação de processamento para a fila do worker"""
+    mensagem = json.dumps({
+        "tipo": tipo,
+        "parametros": parametros,
+        "tarefa_id": tarefa_id
+    })
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
+    channel = connection.channel()
+    channel.queue_declare(queue=RABBITMQ_QUEUE, durable=True)
+    channel.basic_publish(
+        exchange='',
+        routing_key=RABBITMQ_QUEUE,
+        body=mensagem.encode('utf-8'),
+        properties=pika.BasicProperties(delivery_mode=2)
+    )
+    connection.close()
 
-@router.post("/potencia_maxima", status_code=status.HTTP_202_ACCEPTED)
-def potencia_maxima(params: PotenciaMaximaParams):
-    try:
-        mensagem = json.dumps({
-            "tipo": "potencia_maxima",
-            "parametros": params.dict()
-        })
-        connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
-        channel = connection.channel()
-        channel.queue_declare(queue=RABBITMQ_QUEUE, durable=True)
-        channel.basic_publish(
-            exchange='',
-            routing_key=RABBITMQ_QUEUE,
-            body=mensagem.encode('utf-8'),
-            properties=pika.BasicProperties(delivery_mode=2)
-        )
-        connection.close()
-        return {"msg": "Solicitação de potência máxima enviada para processamento assíncrono."}
+def enfileirar_tarefa(tipo, parametros, db: Session):
+    """
+    Registra a solicitação e a envia para a fila. Se uma solicitação igual já está
+    pendente ou executando, não envia de novo: devolve a mesma tarefa.
+    Retorna (tarefa, criada).
+    """
+    tarefa, criada = registrar_tarefa(db, tipo, parametros)
+    if criada:
+        try:
+            publicar_na_fila(tipo, parametros, tarefa.id)
+        except Exception as e:
+            atualizar_status_tarefa(db, tarefa.id, "erro", erro=str(e))
+            raise
+    return tarefa, criada
+
+def resposta_tarefa(mensagem, tarefa, criada):
+    if criada:
+        return {"msg": mensagem, "tarefa_id": tarefa.id}
+    return {"msg": "Solicitação igual já em processamento: acompanhando a mesma tarefa.", "tarefa_id": tarefa.id}
+
+def consultar_agregacao(tipo, parametros, response: Response, db: Session):
+    """
+    Responde uma agregação na própria requisição quando o custo estimado é pequeno.
+    Acima do limite, envia a solicitação para a fila e responde 202, como nos POSTs.
+    """
+    from app.workers.process_agregacao import (
+        AGREGACAO_SINCRONA_LIMITE, calcular_agregacao, estimar_custo_agregacao
+    )
+    try:
+        datetime.fromisoformat(parametros['data_inicio'])
+        datetime.fromisoformat(parametros['data_fim'])
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Datas devem estar no formato ISO (AAAA-MM-DD ou AAAA-MM-DDTHH:MM:SS)")
+    try:
+        custo = estimar_custo_agregacao(db, tipo, parametros)
+        if custo <= AGREGACAO_SINCRONA_LIMITE:
+            resultado = calcular_agregacao(db, tipo, parametros)
+            return {"tipo": tipo, "parametros": parametros, "resultado": resultado}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao calcular agregação: {str(e)}")
+    try:
+        tarefa, _ = enfileirar_tarefa(tipo, parametros, db)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao enviar para fila: {str(e)}")
+    response.status_code = status.HTTP_202_ACCEPTED
+    return {
+        "msg": "Período muito grande para resposta imediata. Solicitação enviada para processamento assíncrono.",
+        "tarefa_id": tarefa.id,
+        "custo_estimado": custo,
+        "limite_sincrono": AGREGACAO_SINCRONA_LIMITE
+    }
 
-class MediaTemperaturaParams(BaseModel):
-    inversor_id: int
+def solicitar_agregacao(tipo, parametros, mensagem, response: Response, db: Session):
+    """
+    Envia a agregação para a fila, a menos que o mesmo cálculo já esteja salvo e
+    nenhuma medição envolvida tenha mudado: nesse caso responde 200 com o nome do arquivo.
+    """
+    from app.workers.cache_resultados import buscar_no_cache, chave_cache
+    try:
+        nome_arquivo = buscar_no_cache(db, chave_cache(db, tipo, parametros))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Datas devem estar no formato ISO (AAAA-MM-DD ou AAAA-MM-DDTHH:MM:SS)")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao consultar cache: {str(e)}")
+    if nome_arquivo:
+        response.status_code = status.HTTP_200_OK
+        return {"msg": "Resultado já calculado para estes parâmetros.", "nome_arquivo": nome_arquivo}
+    try:
+        return resposta_tarefa(mensagem, *enfileirar_tarefa(tipo, parametros, db))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao enviar para fila: {str(e)}")
+
+class InversoresParams(BaseModel):
+    """Um inversor (inversor_id), uma lista (inversor_ids) ou todos os inversores de uma usina (usina_id)"""
+    inversor_id: Optional[int] = None
+    inversor_ids: Optional[List[int]] = None
+    usina_id: Optional[int] = None
     data_inicio: str
     data_fim: str
 
+def parametros_inversores(params: InversoresParams):
+    """
+    Valida a seleção de inversores e devolve os parâmetros sem os campos vazios:
+    com um único inversor_id a solicitação (e o resultado) continua igual à de antes.
+    """
+    informados = [campo for campo in ("inversor_id", "inversor_ids", "usina_id") if getattr(params, campo) is not None]
+    if len(informados) != 1:
+        raise HTTPException(status_code=400, detail="Informe apenas um entre inversor_id, inversor_ids e usina_id")
+    if params.inversor_ids is not None and not params.inversor_ids:
+        raise HTTPException(status_code=400, detail="inversor_ids não pode ser vazio")
+    parametros = params.dict(exclude_none=True)
+    if params.inversor_ids is not None:
+        # Mesma lista em outra ordem ou com repetição é a mesma solicitação (cache e tarefas)
+        parametros["inversor_ids"] = sorted(set(params.inversor_ids))
+    return parametros
+
+class PotenciaMaximaParams(InversoresParams):
+    pass
+
+@router.post("/potencia_maxima", status_code=status.HTTP_202_ACCEPTED)
+def potencia_maxima(response: Response, params: PotenciaMaximaParams, db: Session = Depends(get_db)):
+    return solicitar_agregacao(
+        "potencia_maxima", parametros_inversores(params),
+        "Solicitação de potência máxima enviada para processamento assíncrono.", response, db
+    )
+
+@router.get("/potencia_maxima", status_code=status.HTTP_200_OK)
+def potencia_maxima_sincrona(response: Response, params: Annotated[PotenciaMaximaParams, Query()], db: Session = Depends(get_db)):
+    return consultar_agregacao("potencia_maxima", parametros_inversores(params), response, db)
+
+class MediaTemperaturaParams(InversoresParams):
+    pass
+
 @router.post("/media_temperatura", status_code=status.HTTP_202_ACCEPTED)
-def media_temperatura(params: MediaTemperaturaParams):
-    try:
-        mensagem = json.dumps({
-            "tipo": "media_temperatura",
-            "parametros": params.dict()
-        })
-        connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
-        channel = connection.channel()
-        channel.queue_declare(queue=RABBITMQ_QUEUE, durable=True)
-        channel.basic_publish(
-            exchange='',
-            routing_key=RABBITMQ_QUEUE,
-            body=mensagem.encode('utf-8'),
-            properties=pika.BasicProperties(delivery_mode=2)
-        )
-        connection.close()
-        return {"msg": "Solicitação de média de temperatura enviada para processamento assíncrono."}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao enviar para fila: {str(e)}")
+def media_temperatura(response: Response, params: MediaTemperaturaParams, db: Session = Depends(get_db)):
+    return solicitar_agregacao(
+        "media_temperatura", parametros_inversores(params),
+        "Solicitação de média de temperatura enviada para processamento assíncrono.", response, db
+    )
+
+@router.get("/media_temperatura", status_code=status.HTTP_200_OK)
+def media_temperatura_sincrona(response: Response, params: Annotated[MediaTemperaturaParams, Query()], db: Session = Depends(get_db)):
+    return consultar_agregacao("media_temperatura", parametros_inversores(params), response, db)
 
 class GeracaoUsinaParams(BaseModel):
     usina_id: int
@@ -68,51 +164,310 @@ class GeracaoUsinaParams(BaseModel):
     data_fim: str
 
 @router.post("/geracao_usina", status_code=status.HTTP_202_ACCEPTED)
-def geracao_usina(params: GeracaoUsinaParams):
-    try:
-        mensagem = json.dumps({
-            "tipo": "geracao_usina",
-            "parametros": params.dict()
-        })
-        connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
-        channel = connection.channel()
-        channel.queue_declare(queue=RABBITMQ_QUEUE, durable=True)
-        channel.basic_publish(
-            exchange='',
-            routing_key=RABBITMQ_QUEUE,
-            body=mensagem.encode('utf-8'),
-            properties=pika.BasicProperties(delivery_mode=2)
+def geracao_usina(response: Response, params: GeracaoUsinaParams, db: Session = Depends(get_db)):
+    return solicitar_agregacao(
+        "geracao_usina", params.dict(),
+        "Solicitação de geração da usina enviada para processamento assíncrono.", response, db
+    )
+
+@router.get("/geracao_usina", status_code=status.HTTP_200_OK)
+def geracao_usina_sincrona(response: Response, params: Annotated[GeracaoUsinaParams, Query()], db: Session = Depends(get_db)):
+    return consultar_agregacao("geracao_usina", params.dict(), response, db)
+
+class GeracaoInversorParams(InversoresParams):
+    pass
+
+@router.post("/geracao_inversor", status_code=status.HTTP_202_ACCEPTED)
+def geracao_inversor(response: Response, params: GeracaoInversorParams, db: Session = Depends(get_db)):
+    return solicitar_agregacao(
+        "geracao_inversor", parametros_inversores(params),
+        "Solicitação de geração do inversor enviada para processamento assíncrono.", response, db
+    )
+
+@router.get("/geracao_inversor", status_code=status.HTTP_200_OK)
+def geracao_inversor_sincrona(response: Response, params: Annotated[GeracaoInversorParams, Query()], db: Session = Depends(get_db)):
+    return consultar_agregacao("geracao_inversor", parametros_inversores(params), response, db)
+
+class QualidadeGeracaoParams(InversoresParams):
+    politica: str = "skip"  # preenchimento das lacunas: skip, linear ou clear_sky
+
+@router.get("/qualidade_geracao", status_code=status.HTTP_200_OK)
+def qualidade_geracao(params: Annotated[QualidadeGeracaoParams, Query()], db: Session = Depends(get_db)):
+    """
+    Geração dos inversores com cobertura, lacunas e a energia estimada para as lacunas
+    conforme a política, calculadas na mesma passada pelas medições.
+    """
+    from app.workers.motor_agregacao import resolver_inversores
+    from app.workers.process_agregacao import calcular_qualidade_geracao
+    parametros = parametros_inversores(params)
+    try:
+        data_inicio = datetime.fromisoformat(params.data_inicio)
+        data_fim = datetime.fromisoformat(params.data_fim)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Datas devem estar no formato ISO (AAAA-MM-DD ou AAAA-MM-DDTHH:MM:SS)")
+    try:
+        inversor_ids = [params.inversor_id] if params.inversor_id is not None else resolver_inversores(
+            db, params.inversor_ids, params.usina_id
         )
-        connection.close()
-        return {"msg": "Solicitação de geração da usina enviada para processamento assíncrono."}
+        return {
+            "parametros": parametros,
+            "resultado": calcular_qualidade_geracao(db, inversor_ids, data_inicio, data_fim, params.politica)
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao calcular qualidade da geração: {str(e)}")
+
+class ConsultaParams(BaseModel):
+    metricas: List[str]  # potencia_maxima, potencia_minima, potencia_media, potencia_soma, temperatura_media, geracao, quantidade_medicoes
+    data_inicio: str
+    data_fim: str
+    granularidade: str = "dia"  # 15min, hora, dia, semana ou mes
+    agrupamento: str = "inversor"  # inversor, usina ou frota
+    inversor_ids: Optional[List[int]] = None
+    usina_id: Optional[int] = None
+    aproximado: bool = False  # resposta imediata estimada sobre uma amostra das medições, com margem de erro
+    amostra_percentual: float = 1.0  # percentual das páginas de medicoes lidas no modo aproximado
+    refinar: bool = False  # no modo aproximado, envia também a consulta exata para a fila
+
+# Campos que só mudam a forma de responder: não fazem parte da consulta enviada à fila
+_CAMPOS_APROXIMACAO = {"aproximado", "amostra_percentual", "refinar"}
+
+@router.post("/consulta", status_code=status.HTTP_200_OK)
+def consulta(response: Response, params: ConsultaParams, db: Session = Depends(get_db)):
+    """
+    Agregação genérica: métricas por período (granularidade) e grupo (agrupamento).
+    Períodos em dias inteiros com granularidade diária ou maior são respondidos pelos
+    agregados diários; os demais leem as medições e, acima de AGREGACAO_SINCRONA_LIMITE
+    (inversores x dias), vão para a fila. Com aproximado=true a resposta é sempre imediata,
+    estimada sobre uma amostra, e refinar=true enfileira também o cálculo exato.
+    """
+    from app.workers.motor_agregacao import consultar_metricas_aproximadas, validar_consulta
+    from app.workers.process_agregacao import AGREGACAO_SINCRONA_LIMITE, calcular_consulta, estimar_custo_consulta
+    parametros = params.dict(exclude=_CAMPOS_APROXIMACAO)
+    try:
+        validar_consulta(params.metricas, params.granularidade, params.agrupamento)
+        data_inicio = datetime.fromisoformat(params.data_inicio)
+        data_fim = datetime.fromisoformat(params.data_fim)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if params.aproximado:
+        try:
+            resultado = consultar_metricas_aproximadas(
+                db, params.metricas, data_inicio, data_fim, params.granularidade, params.agrupamento,
+                params.inversor_ids, params.usina_id, params.amostra_percentual
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro ao calcular agregação aproximada: {str(e)}")
+        if params.refinar and resultado["aproximado"]:
+            try:
+                tarefa, _ = enfileirar_tarefa("consulta", parametros, db)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Erro ao enviar para fila: {str(e)}")
+            resultado["tarefa_id"] = tarefa.id
+        return resultado
+    try:
+        custo = estimar_custo_consulta(db, parametros)
+        if custo <= AGREGACAO_SINCRONA_LIMITE:
+            return calcular_consulta(db, parametros)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao calcular agregação: {str(e)}")
+    try:
+        tarefa, _ = enfileirar_tarefa("consulta", parametros, db)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao enviar para fila: {str(e)}")
+    response.status_code = status.HTTP_202_ACCEPTED
+    return {
+        "msg": "Consulta muito grande para resposta imediata. Solicitação enviada para processamento assíncrono.",
+        "tarefa_id": tarefa.id,
+        "custo_estimado": custo,
+        "limite_sincrono": AGREGACAO_SINCRONA_LIMITE
+    }
 
-class GeracaoInversorParams(BaseModel):
-    inversor_id: int
+def atualizar_agregados_ou_enfileirar(db: Session, response: Response, periodos, inversor_ids=None, usina_id=None):
+    """
+    Para as consultas que só leem agregados_diarios: se as células desatualizadas dos períodos
+    passam de AGREGACAO_SINCRONA_LIMITE, o recálculo vai para a fila e a resposta é 202 com a
+    tarefa (a consulta fica imediata quando ela terminar). Retorna None quando a consulta pode seguir.
+    """
+    from app.workers.motor_agregacao import contar_celulas_desatualizadas, resolver_inversores
+    from app.workers.process_agregacao import AGREGACAO_SINCRONA_LIMITE
+    try:
+        inversor_ids = resolver_inversores(db, inversor_ids, usina_id)
+        custo = sum(contar_celulas_desatualizadas(db, inversor_ids, inicio, fim) for inicio, fim in periodos)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao verificar agregados diários: {str(e)}")
+    if custo <= AGREGACAO_SINCRONA_LIMITE:
+        return None
+    parametros = {
+        "inversor_ids": inversor_ids,
+        "periodos": [[inicio.isoformat(), fim.isoformat()] for inicio, fim in periodos]
+    }
+    try:
+        tarefa, _ = enfileirar_tarefa("atualizar_agregados", parametros, db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao enviar para fila: {str(e)}")
+    response.status_code = status.HTTP_202_ACCEPTED
+    return {
+        "msg": "Muitos dias com medições novas para resposta imediata. Os agregados diários estão sendo atualizados; repita a consulta quando a tarefa concluir.",
+        "tarefa_id": tarefa.id,
+        "custo_estimado": custo,
+        "limite_sincrono": AGREGACAO_SINCRONA_LIMITE
+    }
+
+class PercentisParams(BaseModel):
     data_inicio: str
     data_fim: str
+    variaveis: List[str] = ["potencia_ativa", "temperatura"]
+    percentis: List[float] = [50, 95, 99]
+    agrupamento: str = "inversor"  # inversor, usina ou frota
+    inversor_ids: Optional[List[int]] = None
+    usina_id: Optional[int] = None
 
-@router.post("/geracao_inversor", status_code=status.HTTP_202_ACCEPTED)
-def geracao_inversor(params: GeracaoInversorParams):
-    try:
-        mensagem = json.dumps({
-            "tipo": "geracao_inversor",
-            "parametros": params.dict()
-        })
-        connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
-        channel = connection.channel()
-        channel.queue_declare(queue=RABBITMQ_QUEUE, durable=True)
-        channel.basic_publish(
-            exchange='',
-            routing_key=RABBITMQ_QUEUE,
-            body=mensagem.encode('utf-8'),
-            properties=pika.BasicProperties(delivery_mode=2)
+@router.post("/percentis", status_code=status.HTTP_200_OK)
+def percentis(params: PercentisParams, response: Response, db: Session = Depends(get_db)):
+    """
+    Percentis aproximados de potência e temperatura nos dias do período, combinando
+    os sketches diários (t-digest) de cada inversor: não lê as medições brutas.
+    """
+    from app.workers.motor_agregacao import consultar_percentis
+    try:
+        data_inicio = datetime.fromisoformat(params.data_inicio)
+        data_fim = datetime.fromisoformat(params.data_fim)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Datas devem estar no formato ISO (AAAA-MM-DD ou AAAA-MM-DDTHH:MM:SS)")
+    enfileirada = atualizar_agregados_ou_enfileirar(
+        db, response, [(data_inicio.date(), data_fim.date())], params.inversor_ids, params.usina_id
+    )
+    if enfileirada:
+        return enfileirada
+    try:
+        return consultar_percentis(
+            db, params.variaveis, params.percentis, data_inicio, data_fim,
+            params.agrupamento, params.inversor_ids, params.usina_id
         )
-        connection.close()
-        return {"msg": "Solicitação de geração do inversor enviada para processamento assíncrono."}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao enviar para fila: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao calcular percentis: {str(e)}")
+
+class ComparativoParams(BaseModel):
+    data_inicio: str  # período atual (dias inteiros)
+    data_fim: str
+    referencia_inicio: str  # período de comparação, ex.: a semana anterior ou o mesmo mês do ano anterior
+    referencia_fim: str
+    agrupamento: str = "usina"  # inversor, usina ou frota
+    inversor_ids: Optional[List[int]] = None
+    usina_id: Optional[int] = None
+
+@router.post("/comparativo", status_code=status.HTTP_200_OK)
+def comparativo(params: ComparativoParams, response: Response, db: Session = Depends(get_db)):
+    """
+    Compara geração, potência máxima e temperatura média entre dois períodos
+    (valor atual, de referência, diferença e variação percentual), a partir dos agregados diários.
+    """
+    from app.workers.motor_agregacao import consultar_comparativo
+    try:
+        periodo_atual = (datetime.fromisoformat(params.data_inicio).date(), datetime.fromisoformat(params.data_fim).date())
+        periodo_referencia = (
+            datetime.fromisoformat(params.referencia_inicio).date(),
+            datetime.fromisoformat(params.referencia_fim).date()
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Datas devem estar no formato ISO (AAAA-MM-DD ou AAAA-MM-DDTHH:MM:SS)")
+    enfileirada = atualizar_agregados_ou_enfileirar(
+        db, response, [periodo_atual, periodo_referencia], params.inversor_ids, params.usina_id
+    )
+    if enfileirada:
+        return enfileirada
+    try:
+        return consultar_comparativo(
+            db, periodo_atual, periodo_referencia, params.agrupamento, params.inversor_ids, params.usina_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao calcular comparativo: {str(e)}")
+
+class JanelaParams(BaseModel):
+    data_inicio: str
+    data_fim: str
+
+class JanelasParams(BaseModel):
+    janelas: Optional[List[JanelaParams]] = None  # janelas explícitas (dias inteiros)...
+    calendario: Optional[str] = None  # ...ou cada dia, semana, mes, trimestre ou ano entre data_inicio e data_fim
+    data_inicio: Optional[str] = None
+    data_fim: Optional[str] = None
+    metricas: List[str] = ["geracao"]
+    agrupamento: str = "usina"  # inversor, usina ou frota
+    inversor_ids: Optional[List[int]] = None
+    usina_id: Optional[int] = None
+
+@router.post("/janelas", status_code=status.HTTP_200_OK)
+def relatorio_janelas(params: JanelasParams, response: Response, db: Session = Depends(get_db)):
+    """
+    Relatório de vários períodos de uma vez (ex.: a geração de cada mês de 2025 por usina),
+    calculado em uma única consulta sobre os agregados diários. Devolve uma matriz
+    janela × entidade para cada métrica.
+    """
+    from app.workers.motor_agregacao import consultar_janelas, expandir_calendario
+    if (params.janelas is None) == (params.calendario is None):
+        raise HTTPException(status_code=400, detail="Informe janelas ou calendario (com data_inicio e data_fim)")
+    if params.calendario is not None and not (params.data_inicio and params.data_fim):
+        raise HTTPException(status_code=400, detail="O calendario precisa de data_inicio e data_fim")
+    try:
+        if params.janelas is not None:
+            datas = [(j.data_inicio, j.data_fim) for j in params.janelas]
+        else:
+            datas = [(params.data_inicio, params.data_fim)]
+        datas = [(datetime.fromisoformat(inicio).date(), datetime.fromisoformat(fim).date()) for inicio, fim in datas]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Datas devem estar no formato ISO (AAAA-MM-DD ou AAAA-MM-DDTHH:MM:SS)")
+    try:
+        janelas = expandir_calendario(params.calendario, *datas[0]) if params.calendario is not None else datas
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if janelas:
+        enfileirada = atualizar_agregados_ou_enfileirar(
+            db, response, [(min(j[0] for j in janelas), max(j[1] for j in janelas))], params.inversor_ids, params.usina_id
+        )
+        if enfileirada:
+            return enfileirada
+    try:
+        return consultar_janelas(
+            db, janelas, params.metricas, params.agrupamento, params.inversor_ids, params.usina_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao calcular relatório: {str(e)}")
+
+class MapaCalorParams(BaseModel):
+    data_inicio: str
+    data_fim: str
+    metrica: str = "geracao"  # qualquer métrica de /agregacao/consulta
+    usina_id: Optional[int] = None  # sem usina_id, todas as usinas
+
+@router.get("/mapa_calor", status_code=status.HTTP_200_OK)
+def mapa_calor(params: Annotated[MapaCalorParams, Query()], db: Session = Depends(get_db)):
+    """
+    Mapa de calor hora do dia × dia de cada usina, agrupado no banco. Formato em colunas:
+    "dias" e "horas" são os eixos e "valores" de cada usina tem uma linha de 24 horas por dia.
+    """
+    from app.workers.motor_agregacao import consultar_mapa_calor
+    try:
+        dia_inicio = datetime.fromisoformat(params.data_inicio).date()
+        dia_fim = datetime.fromisoformat(params.data_fim).date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Datas devem estar no formato ISO (AAAA-MM-DD ou AAAA-MM-DDTHH:MM:SS)")
+    try:
+        return consultar_mapa_calor(db, dia_inicio, dia_fim, params.metrica, params.usina_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao calcular mapa de calor: {str(e)}")
 
 @router.get("/resultados", status_code=status.HTTP_200_OK)
 def listar_resultados(tipo: Optional[str] = None, usina_id: Optional[int] = None, inversor_id: Optional[int] = None):
@@ -124,56 +479,88 @@ def listar_resultados(tipo: Optional[str] = None, usina_id: Optional[int] = None
         raise HTTPException(status_code=500, detail=f"Erro ao obter resultados: {str(e)}")
 
 @router.get("/resultado/{nome_arquivo}", status_code=status.HTTP_200_OK)
-def obter_resultado(nome_arquivo: str):
+def obter_resultado(nome_arquivo: str, request: Request):
     try:
-        from app.workers.process_agregacao import obter_resultado_analise
-        resultado = obter_resultado_analise(nome_arquivo)
-        if resultado:
-            return resultado
+        from app.workers.process_agregacao import obter_caminho_resultado
+        caminho = obter_caminho_resultado(nome_arquivo)
+        if caminho:
+            etag = etag_arquivo(caminho)
+            nao_modificada = resposta_nao_modificada(request, etag, CACHE_MAX_AGE_RESULTADOS)
+            if nao_modificada:
+                return nao_modificada
+            # O arquivo já está em JSON: devolve os bytes sem desserializar
+            resposta = resposta_arquivo_json(caminho)
+            resposta.headers.update(cabecalhos_cache(etag, CACHE_MAX_AGE_RESULTADOS))
+            return resposta
         raise HTTPException(status_code=404, detail=f"Arquivo não encontrado: {nome_arquivo}")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao obter resultado: {str(e)}")
 
 class GerarDashParams(BaseModel):
     data_inicio: str
     data_fim: str
+    recalcular_tudo: bool = False  # ignora o dashboard anterior do período e recalcula todas as células
 
 @router.post("/gerar_dash", status_code=status.HTTP_202_ACCEPTED)
-def gerar_dash(params: GerarDashParams):
+def gerar_dash(params: GerarDashParams, db: Session = Depends(get_db)):
     """
     Gera todas as análises necessárias para o dashboard em um único arquivo consolidado.
     Recebe apenas o período (data início e fim) e processa todos os dados de forma assíncrona.
+    Se o mesmo período já está na fila ou sendo processado, a solicitação acompanha essa tarefa.
     """
     try:
-        mensagem = json.dumps({
-            "tipo": "gerar_dash",
-            "parametros": params.dict()
-        })
-        connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
-        channel = connection.channel()
-        channel.queue_declare(queue=RABBITMQ_QUEUE, durable=True)
-        channel.basic_publish(
-            exchange='',
-            routing_key=RABBITMQ_QUEUE,
-            body=mensagem.encode('utf-8'),
-            properties=pika.BasicProperties(delivery_mode=2)
+        datetime.fromisoformat(params.data_inicio)
+        datetime.fromisoformat(params.data_fim)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Datas devem estar no formato ISO (AAAA-MM-DD ou AAAA-MM-DDTHH:MM:SS)")
+    try:
+        return resposta_tarefa(
+            "Solicitação de geração do dashboard enviada para processamento assíncrono. Os dados estarão disponíveis em instantes.",
+            *enfileirar_tarefa("gerar_dash", params.dict(), db)
         )
-        connection.close()
-        return {"msg": "Solicitação de geração do dashboard enviada para processamento assíncrono. Os dados estarão disponíveis em instantes."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao enviar para fila: {str(e)}")
 
+@router.get("/tarefas/{tarefa_id}", status_code=status.HTTP_200_OK)
+def obter_tarefa(tarefa_id: str, db: Session = Depends(get_db)):
+    """Situação de uma tarefa (pendente, executando, concluida ou erro) e o arquivo do resultado"""
+    tarefa = get_tarefa(db, tarefa_id)
+    if not tarefa:
+        raise HTTPException(status_code=404, detail=f"Tarefa não encontrada: {tarefa_id}")
+    return {
+        "tarefa_id": tarefa.id,
+        "tipo": tarefa.tipo,
+        "parametros": tarefa.parametros,
+        "status": tarefa.status,
+        "nome_arquivo": tarefa.nome_arquivo,
+        "erro": tarefa.erro,
+        "criado_em": tarefa.criado_em,
+        "atualizado_em": tarefa.atualizado_em
+    }
+
 @router.get("/dash", status_code=status.HTTP_200_OK)
-def obter_dash():
+def obter_dash(request: Request):
     """
     Obtém os dados consolidados do dashboard mais recente.
     Não requer parâmetros pois sempre retorna a análise mais recente.
+    O ETag muda sempre que um novo dashboard é gerado.
     """
     try:
-        from app.workers.process_agregacao import obter_dash_mais_recente
-        resultado = obter_dash_mais_recente()
-        if resultado:
-            return resultado
+        from app.workers.process_agregacao import obter_caminho_dash_mais_recente
+        caminho = obter_caminho_dash_mais_recente()
+        if caminho:
+            # Sempre revalidar: o "mais recente" muda quando um novo dash é gerado
+            etag = etag_arquivo(caminho)
+            nao_modificada = resposta_nao_modificada(request, etag)
+            if nao_modificada:
+                return nao_modificada
+            resposta = resposta_arquivo_json(caminho)
+            resposta.headers.update(cabecalhos_cache(etag))
+            return resposta
         raise HTTPException(status_code=404, detail="Não foram encontrados dados do dashboard.")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao obter dados do dashboard: {str(e)}") 
\ No newline at end of file
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, HTTPException, Query, status
+from app.core import ao_vivo
+
+router = APIRouter(prefix="/ao_vivo", tags=["Ao vivo"])
+
+@router.get("/{inversor_id}", status_code=status.HTTP_200_OK)
+def medicoes_ao_vivo(inversor_id: int, pontos: int = Query(120, ge=1)):
+    """
+    Visão ao vivo de um inversor a partir da janela recente em memória: última medição,
+    energia da última hora e sparkline da potência com até `pontos` valores. Não consulta o banco.
+    """
+    resumo = ao_vivo.resumo_inversor(inversor_id, pontos)
+    if resumo is None:
+        raise HTTPException(status_code=404, detail=f"Sem medições recentes para o inversor {inversor_id}")
+    return resumo
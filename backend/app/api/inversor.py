@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
-from typing import List
-from app.schemas.inversor import InversorCreate, InversorRead, InversorUpdate
+from typing import List, Optional
+from app.schemas.inversor import InversorCreate, InversorRead, InversorUpdate, InversorLote, InversorStatus
+from app.schemas.lote import ResultadoLote
 from app.crud import inversor as crud_inversor
+from app.crud import ultima_medicao as crud_ultima_medicao
 from app.api.deps import get_db
+from app.core.cache_http import CACHE_MAX_AGE_ENTIDADES, cabecalhos_cache, gerar_etag, resposta_nao_modificada
 
 router = APIRouter(prefix="/inversores", tags=["Inversores"])
 
@@ -11,12 +14,41 @@ router = APIRouter(prefix="/inversores", tags=["Inversores"])
 def create_inversor(inversor: InversorCreate, db: Session = Depends(get_db)):
     return crud_inversor.create_inversor(db, inversor)
 
+@router.post("/lote", response_model=ResultadoLote)
+def upsert_inversores_lote(inversores: List[InversorLote], db: Session = Depends(get_db)):
+    """
+    Cria ou atualiza vários registros em uma única requisição.
+    Itens com id são atualizados (ou criados com esse id); itens sem id são criados.
+    Retorna o status de cada item na mesma ordem da lista enviada.
+    """
+    return crud_inversor.upsert_inversores(db, inversores)
+
 @router.get("/", response_model=List[InversorRead])
-def list_inversores(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def list_inversores(request: Request, response: Response, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    etag = gerar_etag("inversores", skip, limit, crud_inversor.get_versao_inversores(db, skip=skip, limit=limit))
+    nao_modificada = resposta_nao_modificada(request, etag, CACHE_MAX_AGE_ENTIDADES)
+    if nao_modificada:
+        return nao_modificada
+    response.headers.update(cabecalhos_cache(etag, CACHE_MAX_AGE_ENTIDADES))
     return crud_inversor.get_inversores(db, skip=skip, limit=limit)
 
+@router.get("/status", response_model=List[InversorStatus])
+def status_inversores(usina_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """
+    Última medição (potência e temperatura) de cada inversor da frota, ou de uma usina,
+    lida da tabela ultimas_medicoes em vez de procurar o maior timestamp nas medições.
+    """
+    return crud_ultima_medicao.get_status_inversores(db, usina_id)
+
 @router.get("/{inversor_id}", response_model=InversorRead)
-def get_inversor(inversor_id: int, db: Session = Depends(get_db)):
+def get_inversor(inversor_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    versao = crud_inversor.get_versao_inversor(db, inversor_id)
+    if versao is not None:
+        etag = gerar_etag("inversor", inversor_id, versao)
+        nao_modificada = resposta_nao_modificada(request, etag, CACHE_MAX_AGE_ENTIDADES)
+        if nao_modificada:
+            return nao_modificada
+        response.headers.update(cabecalhos_cache(etag, CACHE_MAX_AGE_ENTIDADES))
     db_inversor = crud_inversor.get_inversor(db, inversor_id)
     if not db_inversor:
         raise HTTPException(status_code=404, detail="Inversor não encontrado")
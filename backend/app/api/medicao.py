@@ -4,12 +4,15 @@ from typing import List, Optional
 from app.schemas.medicao import MedicaoCreate, MedicaoRead, MedicaoUpdate
 from app.crud import medicao as crud_medicao
 from app.api.deps import get_db
+from app.core import ao_vivo
 
 router = APIRouter(prefix="/medicoes", tags=["Medicoes"])
 
 @router.post("/", response_model=MedicaoRead, status_code=status.HTTP_201_CREATED)
 def create_medicao(medicao: MedicaoCreate, db: Session = Depends(get_db)):
-    return crud_medicao.create_medicao(db, medicao)
+    db_medicao = crud_medicao.create_medicao(db, medicao)
+    ao_vivo.registrar_medicao(db_medicao.inversor_id, db_medicao.timestamp, db_medicao.potencia_ativa, db_medicao.temperatura)
+    return db_medicao
 
 @router.get("/", response_model=List[MedicaoRead])
 def list_medicoes(skip: int = 0, limit: int = 100, inversor_id: Optional[int] = None, db: Session = Depends(get_db)):
@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.orm import Session
-from typing import List
-from app.schemas.usina import UsinaCreate, UsinaRead, UsinaUpdate
+from typing import List, Literal, Optional, Union
+from app.schemas.usina import UsinaCreate, UsinaRead, UsinaUpdate, UsinaLote, UsinaComInversores
+from app.schemas.inversor import InversorRead
+from app.schemas.lote import ResultadoLote
 from app.crud import usina as crud_usina
+from app.crud import inversor as crud_inversor
 from app.api.deps import get_db
+from app.core.cache_http import CACHE_MAX_AGE_ENTIDADES, cabecalhos_cache, gerar_etag, resposta_nao_modificada
 
 router = APIRouter(prefix="/usinas", tags=["Usinas"])
 
@@ -11,17 +15,80 @@ router = APIRouter(prefix="/usinas", tags=["Usinas"])
 def create_usina(usina: UsinaCreate, db: Session = Depends(get_db)):
     return crud_usina.create_usina(db, usina)
 
-@router.get("/", response_model=List[UsinaRead])
-def list_usinas(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud_usina.get_usinas(db, skip=skip, limit=limit)
+@router.post("/lote", response_model=ResultadoLote)
+def upsert_usinas_lote(usinas: List[UsinaLote], db: Session = Depends(get_db)):
+    """
+    Cria ou atualiza vários registros em uma única requisição.
+    Itens com id são atualizados (ou criados com esse id); itens sem id são criados.
+    Retorna o status de cada item na mesma ordem da lista enviada.
+    """
+    return crud_usina.upsert_usinas(db, usinas)
+
+@router.get("/", response_model=Union[List[UsinaComInversores], List[UsinaRead]])
+def list_usinas(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    include: Optional[Literal["inversores"]] = Query(None, description="Use 'inversores' para incluir os inversores de cada usina"),
+    db: Session = Depends(get_db)
+):
+    incluir_inversores = include == "inversores"
+    versoes = [crud_usina.get_versao_usinas(db, skip=skip, limit=limit)]
+    if incluir_inversores:
+        versoes.append(crud_inversor.get_versao_inversores(db, skip=0, limit=None))
+    etag = gerar_etag("usinas", skip, limit, include, *versoes)
+    nao_modificada = resposta_nao_modificada(request, etag, CACHE_MAX_AGE_ENTIDADES)
+    if nao_modificada:
+        return nao_modificada
+    response.headers.update(cabecalhos_cache(etag, CACHE_MAX_AGE_ENTIDADES))
+    usinas = crud_usina.get_usinas(db, skip=skip, limit=limit, incluir_inversores=incluir_inversores)
+    schema = UsinaComInversores if incluir_inversores else UsinaRead
+    return [schema.model_validate(usina, from_attributes=True) for usina in usinas]
+
+@router.get("/hierarquia", response_model=List[UsinaComInversores])
+def get_hierarquia(request: Request, response: Response, db: Session = Depends(get_db)):
+    """
+    Retorna a árvore completa da frota (todas as usinas com seus inversores)
+    usando apenas duas consultas ao banco.
+    """
+    etag = gerar_etag(
+        "hierarquia",
+        crud_usina.get_versao_usinas(db, skip=0, limit=None),
+        crud_inversor.get_versao_inversores(db, skip=0, limit=None)
+    )
+    nao_modificada = resposta_nao_modificada(request, etag, CACHE_MAX_AGE_ENTIDADES)
+    if nao_modificada:
+        return nao_modificada
+    response.headers.update(cabecalhos_cache(etag, CACHE_MAX_AGE_ENTIDADES))
+    return crud_usina.get_hierarquia(db)
 
 @router.get("/{usina_id}", response_model=UsinaRead)
-def get_usina(usina_id: int, db: Session = Depends(get_db)):
+def get_usina(usina_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    versao = crud_usina.get_versao_usina(db, usina_id)
+    if versao is not None:
+        etag = gerar_etag("usina", usina_id, versao)
+        nao_modificada = resposta_nao_modificada(request, etag, CACHE_MAX_AGE_ENTIDADES)
+        if nao_modificada:
+            return nao_modificada
+        response.headers.update(cabecalhos_cache(etag, CACHE_MAX_AGE_ENTIDADES))
     db_usina = crud_usina.get_usina(db, usina_id)
     if not db_usina:
         raise HTTPException(status_code=404, detail="Usina não encontrada")
     return db_usina
 
+@router.get("/{usina_id}/inversores", response_model=List[InversorRead])
+def list_inversores_da_usina(usina_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    versao_usina = crud_usina.get_versao_usina(db, usina_id)
+    if versao_usina is None:
+        raise HTTPException(status_code=404, detail="Usina não encontrada")
+    etag = gerar_etag("usina_inversores", usina_id, versao_usina, crud_inversor.get_versao_inversores_da_usina(db, usina_id))
+    nao_modificada = resposta_nao_modificada(request, etag, CACHE_MAX_AGE_ENTIDADES)
+    if nao_modificada:
+        return nao_modificada
+    response.headers.update(cabecalhos_cache(etag, CACHE_MAX_AGE_ENTIDADES))
+    return crud_inversor.get_inversores_da_usina(db, usina_id)
+
 @router.put("/{usina_id}", response_model=UsinaRead)
 def update_usina(usina_id: int, usina: UsinaUpdate, db: Session = Depends(get_db)):
     db_usina = crud_usina.update_usina(db, usina_id, usina)
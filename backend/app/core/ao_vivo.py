@@ -0,0 +1,221 @@
+"""
+Janela recente de medições de cada inversor, mantida em memória no processo da API
+para as visões ao vivo (potência atual, energia da última hora, sparkline) sem consultar
+o banco a cada requisição.
+
+Cada inversor tem um buffer circular em NumPy com as últimas AO_VIVO_TAMANHO medições.
+Os buffers são carregados na inicialização da API e alimentados pelo POST de medições.
+O que chega por outros caminhos (ingestão pelo worker, alterações e remoções) aparece
+nas marcas de ingestão: uma thread as consulta a cada AO_VIVO_INTERVALO segundos e
+recarrega os inversores alterados.
+"""
+import os
+import threading
+import warnings
+from datetime import date, timedelta
+from typing import Dict, Optional
+import numpy as np
+from sqlalchemy import text, bindparam
+from app.core.database import SessionLocal
+from app.crud.marca_ingestao import get_marcas
+from utils import ArrayTimeSeries, integrate_generation
+
+# Medições guardadas por inversor (0 desliga os buffers)
+AO_VIVO_TAMANHO = int(os.getenv("AO_VIVO_TAMANHO", "1440"))
+# Na carga, só entram medições destas últimas horas (contadas a partir da medição mais recente do banco)
+AO_VIVO_HORAS = int(os.getenv("AO_VIVO_HORAS", "24"))
+# Intervalo (segundos) entre as consultas às marcas de ingestão (0 desliga a sincronização)
+AO_VIVO_INTERVALO = float(os.getenv("AO_VIVO_INTERVALO", "5"))
+
+class BufferCircular:
+    """Últimas medições de um inversor, em ordem de timestamp, em arrays de tamanho fixo"""
+
+    def __init__(self, capacidade):
+        self.timestamps = np.zeros(capacidade, dtype="datetime64[us]")
+        self.potencia = np.full(capacidade, np.nan)
+        self.temperatura = np.full(capacidade, np.nan)
+        self.inicio = 0  # posição da medição mais antiga
+        self.tamanho = 0
+
+    def preencher(self, timestamps, potencia, temperatura):
+        """Substitui o conteúdo pelas medições informadas (ordenadas), mantendo as mais novas"""
+        quantidade = min(len(timestamps), len(self.timestamps))
+        self.timestamps[:quantidade] = np.asarray(timestamps, dtype="datetime64[us]")[len(timestamps) - quantidade:]
+        self.potencia[:quantidade] = np.asarray(potencia, dtype=float)[len(potencia) - quantidade:]
+        self.temperatura[:quantidade] = np.asarray(temperatura, dtype=float)[len(temperatura) - quantidade:]
+        self.inicio, self.tamanho = 0, quantidade
+
+    def adicionar(self, timestamp, potencia, temperatura):
+        """Acrescenta uma medição mais nova que a última. Devolve False (e ignora) se não for"""
+        timestamp = np.datetime64(timestamp, "us")
+        capacidade = len(self.timestamps)
+        if self.tamanho and timestamp <= self.timestamps[(self.inicio + self.tamanho - 1) % capacidade]:
+            return False
+        posicao = (self.inicio + self.tamanho) % capacidade
+        self.timestamps[posicao] = timestamp
+        self.potencia[posicao] = np.nan if potencia is None else potencia
+        self.temperatura[posicao] = np.nan if temperatura is None else temperatura
+        if self.tamanho < capacidade:
+            self.tamanho += 1
+        else:
+            self.inicio = (self.inicio + 1) % capacidade
+        return True
+
+    def arrays(self):
+        """Cópias (timestamps, potência, temperatura) da mais antiga para a mais nova"""
+        indices = (self.inicio + np.arange(self.tamanho)) % len(self.timestamps)
+        return self.timestamps[indices], self.potencia[indices], self.temperatura[indices]
+
+_buffers: Dict[int, BufferCircular] = {}
+_trava = threading.Lock()
+# Marcas de ingestão {(inversor_id, dia): atualizado_em} dos dias da janela, como estavam
+# na última sincronização. Um cursor pelo maior horário perderia marcas confirmadas fora de
+# ordem (clock_timestamp() é o horário da escrita, não do commit)
+_marcas = {}
+
+def registrar_medicao(inversor_id, timestamp, potencia, temperatura):
+    """Acrescenta uma medição recém-gravada ao buffer do inversor"""
+    if not AO_VIVO_TAMANHO:
+        return
+    with _trava:
+        buffer = _buffers.get(inversor_id)
+        if buffer is None:
+            buffer = _buffers[inversor_id] = BufferCircular(AO_VIVO_TAMANHO)
+        buffer.adicionar(timestamp, potencia, temperatura)
+
+_SQL_RECENTES = """
+    SELECT inversor_id, timestamp, potencia_ativa, temperatura
+    FROM (
+        SELECT inversor_id, timestamp, potencia_ativa, temperatura,
+               ROW_NUMBER() OVER (PARTITION BY inversor_id ORDER BY timestamp DESC, id DESC) AS ordem
+        FROM medicoes
+        WHERE timestamp >= :desde {filtro}
+    ) recentes
+    WHERE ordem <= :tamanho
+    ORDER BY inversor_id, timestamp, ordem DESC
+"""
+
+def carregar(db, inversor_ids=None):
+    """
+    (Re)carrega do banco os buffers dos inversores informados, ou de todos, com uma
+    consulta pelo índice de timestamp. Inversores sem medições recentes ficam sem buffer.
+    """
+    mais_recente = db.execute(text("SELECT MAX(timestamp) FROM medicoes")).scalar()
+    linhas = []
+    if mais_recente is not None:
+        sql = text(_SQL_RECENTES.format(filtro="AND inversor_id IN :inversor_ids" if inversor_ids is not None else ""))
+        parametros = {"desde": mais_recente - timedelta(hours=AO_VIVO_HORAS), "tamanho": AO_VIVO_TAMANHO}
+        if inversor_ids is not None:
+            sql = sql.bindparams(bindparam("inversor_ids", expanding=True))
+            parametros["inversor_ids"] = list(inversor_ids)
+        linhas = db.execute(sql, parametros).all()
+
+    por_inversor = {}
+    for linha in linhas:
+        por_inversor.setdefault(linha.inversor_id, []).append(linha)
+    novos = {}
+    for inversor_id, medicoes in por_inversor.items():
+        buffer = BufferCircular(AO_VIVO_TAMANHO)
+        buffer.preencher(
+            [m.timestamp for m in medicoes],
+            [np.nan if m.potencia_ativa is None else m.potencia_ativa for m in medicoes],
+            [np.nan if m.temperatura is None else m.temperatura for m in medicoes]
+        )
+        novos[inversor_id] = buffer
+    with _trava:
+        if inversor_ids is None:
+            _buffers.clear()
+        else:
+            for inversor_id in inversor_ids:
+                _buffers.pop(inversor_id, None)
+        _buffers.update(novos)
+    return len(novos)
+
+def _ler_marcas(db):
+    """Marcas dos dias que podem estar nos buffers (a partir do início da janela de carga)"""
+    mais_recente = db.execute(text("SELECT MAX(timestamp) FROM medicoes")).scalar()
+    if mais_recente is None:
+        return {}
+    return get_marcas(db, (mais_recente - timedelta(hours=AO_VIVO_HORAS)).date(), date.max)
+
+def sincronizar(db):
+    """Recarrega os inversores cujas marcas de ingestão na janela mudaram desde a última sincronização"""
+    global _marcas
+    marcas = _ler_marcas(db)
+    alterados = {inversor_id for (inversor_id, dia), atualizado_em in marcas.items() if _marcas.get((inversor_id, dia)) != atualizado_em}
+    _marcas = marcas
+    if not alterados:
+        return 0
+    return carregar(db, sorted(alterados))
+
+def _sincronizar_periodicamente(parar):
+    while not parar.wait(AO_VIVO_INTERVALO):
+        db = SessionLocal()
+        try:
+            sincronizar(db)
+        except Exception as e:
+            print(f"Erro ao sincronizar medições ao vivo: {e}")
+        finally:
+            db.close()
+
+def iniciar():
+    """
+    Carrega os buffers de todos os inversores e inicia a thread de sincronização.
+    Devolve o evento que encerra a thread.
+    """
+    global _marcas
+    parar = threading.Event()
+    if not AO_VIVO_TAMANHO:
+        return parar
+    db = SessionLocal()
+    try:
+        # A marca é lida antes das medições: o que mudar durante a carga é recarregado depois
+        _marcas = _ler_marcas(db)
+        print(f"Medições ao vivo: {carregar(db)} inversores carregados")
+    except Exception as e:
+        print(f"Erro ao carregar medições ao vivo: {e}")
+    finally:
+        db.close()
+    if AO_VIVO_INTERVALO > 0:
+        threading.Thread(target=_sincronizar_periodicamente, args=(parar,), daemon=True, name="ao_vivo").start()
+    return parar
+
+def _iso(timestamp):
+    return timestamp.astype("datetime64[us]").item().isoformat()
+
+def _valor(valor):
+    return None if np.isnan(valor) else float(valor)
+
+def resumo_inversor(inversor_id, pontos=120) -> Optional[dict]:
+    """
+    Última medição, energia da última hora (contada a partir da última medição) e
+    sparkline da potência com até `pontos` médias. None se o inversor não tem buffer.
+    """
+    with _trava:
+        buffer = _buffers.get(inversor_id)
+        if buffer is None or not buffer.tamanho:
+            return None
+        timestamps, potencia, temperatura = buffer.arrays()
+
+    ultima_hora = timestamps >= timestamps[-1] - np.timedelta64(1, "h")
+    energia = integrate_generation(ArrayTimeSeries.from_arrays(timestamps[ultima_hora], potencia[ultima_hora]))
+    # Sparkline: médias de grupos consecutivos, marcados pelo timestamp final de cada grupo
+    grupos = [g for g in np.array_split(np.arange(len(timestamps)), min(pontos, len(timestamps))) if len(g)]
+    with warnings.catch_warnings():
+        # Grupo só com potências vazias: média NaN, devolvida como None
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        medias = [np.nanmean(potencia[g]) for g in grupos]
+    return {
+        "inversor_id": inversor_id,
+        "ultima_medicao": {
+            "timestamp": _iso(timestamps[-1]),
+            "potencia_ativa": _valor(potencia[-1]),
+            "temperatura": _valor(temperatura[-1])
+        },
+        "energia_ultima_hora": energia,
+        "janela": {"inicio": _iso(timestamps[0]), "fim": _iso(timestamps[-1]), "medicoes": len(timestamps)},
+        "sparkline": {
+            "timestamps": [_iso(timestamps[g[-1]]) for g in grupos],
+            "potencia_ativa": [_valor(media) for media in medias]
+        }
+    }
@@ -0,0 +1,53 @@
+import os
+import hashlib
+from typing import Optional
+from fastapi import Request, Response
+
+# Tempo (em segundos) que o cliente pode reutilizar a resposta sem revalidar.
+# Com 0 o cliente sempre revalida, mas recebe 304 enquanto nada mudar.
+CACHE_MAX_AGE_ENTIDADES = int(os.getenv("CACHE_MAX_AGE_ENTIDADES", "0"))
+CACHE_MAX_AGE_RESULTADOS = int(os.getenv("CACHE_MAX_AGE_RESULTADOS", "3600"))
+
+def gerar_etag(*partes) -> str:
+    """
+    Gera um ETag fraco a partir das partes informadas (versões, parâmetros, etc.).
+    É fraco porque o mesmo conteúdo pode ser enviado com ou sem compressão.
+    """
+    conteudo = "|".join(str(parte) for parte in partes)
+    return f'W/"{hashlib.md5(conteudo.encode("utf-8")).hexdigest()}"'
+
+def etag_arquivo(caminho: str) -> str:
+    """Gera o ETag de um arquivo a partir do nome, tamanho e data de modificação"""
+    info = os.stat(caminho)
+    return gerar_etag(os.path.basename(caminho), info.st_size, info.st_mtime_ns)
+
+def etag_corresponde(request: Request, etag: str) -> bool:
+    """Verifica se o ETag atual está entre os enviados no cabeçalho If-None-Match"""
+    cabecalho = request.headers.get("if-none-match")
+    if not cabecalho:
+        return False
+    if cabecalho.strip() == "*":
+        return True
+    # Comparação fraca: ignora o prefixo W/ dos dois lados
+    alvo = etag[2:] if etag.startswith("W/") else etag
+    for candidato in cabecalho.split(","):
+        candidato = candidato.strip()
+        if candidato.startswith("W/"):
+            candidato = candidato[2:]
+        if candidato == alvo:
+            return True
+    return False
+
+def cabecalhos_cache(etag: str, max_age: int = 0) -> dict:
+    """Monta os cabeçalhos ETag e Cache-Control de uma resposta"""
+    controle = f"private, max-age={max_age}" if max_age > 0 else "no-cache"
+    return {"ETag": etag, "Cache-Control": controle}
+
+def resposta_nao_modificada(request: Request, etag: str, max_age: int = 0) -> Optional[Response]:
+    """
+    Retorna uma resposta 304 quando o cliente já possui a versão atual do recurso,
+    ou None quando o conteúdo precisa ser enviado.
+    """
+    if etag_corresponde(request, etag):
+        return Response(status_code=304, headers=cabecalhos_cache(etag, max_age))
+    return None
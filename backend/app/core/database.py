@@ -20,9 +20,17 @@ engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-def create_tables():
-    from app.models import Usina, Inversor, Medicao  # Garante que os modelos são importados
+def create_tables(preencher_agregados=True):
+    from app.models import Usina, Inversor, Medicao, MarcaIngestao, Tarefa, AgregadoDiario, SketchDiario, UltimaMedicao, ResultadoCache  # Garante que os modelos são importados
     Base.metadata.create_all(bind=engine)
+    if preencher_agregados:
+        # Bancos populados antes de agregados_diarios: calcula a tabela uma vez
+        from app.workers.motor_agregacao import preencher_agregados_vazios
+        db = SessionLocal()
+        try:
+            preencher_agregados_vazios(db)
+        finally:
+            db.close()
 
 def ajustar_sequencias():
     with engine.connect() as conn:
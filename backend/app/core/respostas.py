@@ -0,0 +1,19 @@
+import os
+from fastapi.responses import Response
+
+# Respostas menores que este tamanho (em bytes) não são comprimidas
+GZIP_TAMANHO_MINIMO = int(os.getenv("GZIP_TAMANHO_MINIMO", "1024"))
+GZIP_NIVEL = int(os.getenv("GZIP_NIVEL", "6"))
+
+class JSONBrutoResponse(Response):
+    """
+    Resposta para conteúdo JSON já serializado, como os arquivos de resultado
+    salvos em disco. Os bytes são enviados como estão, sem decodificar e
+    serializar novamente.
+    """
+    media_type = "application/json"
+
+def resposta_arquivo_json(caminho: str) -> JSONBrutoResponse:
+    """Lê um arquivo JSON do disco e o devolve como resposta sem reprocessá-lo"""
+    with open(caminho, 'rb') as f:
+        return JSONBrutoResponse(content=f.read())
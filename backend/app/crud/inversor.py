@@ -1,8 +1,11 @@
 from sqlalchemy.orm import Session
 from app.models.inversor import Inversor
-from app.schemas.inversor import InversorCreate, InversorUpdate
+from app.models.usina import Usina
+from app.schemas.inversor import InversorCreate, InversorUpdate, InversorLote
 from typing import List, Optional
 from app.core.database import ajustar_sequencias
+from app.crud.versao import versao_consulta, versao_linha
+from app.crud.lote import upsert_lote
 
 # Criar um inversor
 def create_inversor(db: Session, inversor: InversorCreate) -> Inversor:
@@ -15,9 +18,47 @@ def create_inversor(db: Session, inversor: InversorCreate) -> Inversor:
     db.refresh(db_inversor)
     return db_inversor
 
+# Criar ou atualizar vários inversores de uma vez (um INSERT e um commit)
+def upsert_inversores(db: Session, inversores: List[InversorLote]) -> dict:
+    itens = [inversor.dict() for inversor in inversores]
+
+    def validar(itens):
+        # Uma única consulta para todas as usinas referenciadas no lote
+        usina_ids = {item["usina_id"] for item in itens}
+        existentes = {u.id for u in db.query(Usina.id).filter(Usina.id.in_(usina_ids))}
+        return {
+            i: f"Usina {item['usina_id']} não encontrada"
+            for i, item in enumerate(itens) if item["usina_id"] not in existentes
+        }
+
+    return upsert_lote(db, Inversor, itens, validar)
+
 # Listar todos os inversores
 def get_inversores(db: Session, skip: int = 0, limit: int = 100) -> List[Inversor]:
-    return db.query(Inversor).offset(skip).limit(limit).all()
+    return _query_inversores(db, skip, limit).all()
+
+# Versão da listagem (usada no ETag), sem carregar os objetos
+def get_versao_inversores(db: Session, skip: int = 0, limit: int = 100) -> str:
+    return versao_consulta(db, _query_inversores(db, skip, limit), Inversor)
+
+# Versão de um registro (None se não existir)
+def get_versao_inversor(db: Session, inversor_id: int) -> Optional[str]:
+    return versao_linha(db, Inversor, inversor_id)
+
+def _query_inversores(db: Session, skip: int, limit: int):
+    # Ordenação fixa para que a paginação (e o ETag) sejam estáveis
+    return db.query(Inversor).order_by(Inversor.id).offset(skip).limit(limit)
+
+# Listar os inversores de uma usina
+def get_inversores_da_usina(db: Session, usina_id: int) -> List[Inversor]:
+    return _query_inversores_da_usina(db, usina_id).all()
+
+# Versão dos inversores de uma usina (usada no ETag)
+def get_versao_inversores_da_usina(db: Session, usina_id: int) -> str:
+    return versao_consulta(db, _query_inversores_da_usina(db, usina_id), Inversor)
+
+def _query_inversores_da_usina(db: Session, usina_id: int):
+    return db.query(Inversor).filter(Inversor.usina_id == usina_id).order_by(Inversor.id)
 
 # Buscar inversor por ID
 def get_inversor(db: Session, inversor_id: int) -> Optional[Inversor]:
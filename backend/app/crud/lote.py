@@ -0,0 +1,67 @@
+from sqlalchemy import text, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from typing import Callable, Dict, List, Optional
+
+# Criar ou atualizar vários registros de uma tabela com uma única transação.
+# Itens com id fazem upsert (INSERT ... ON CONFLICT DO UPDATE); itens sem id são inseridos
+# e recebem o próximo valor da sequência. Cada grupo vai ao banco em um INSERT de várias linhas.
+# `validar` recebe a lista de dados e devolve {indice: mensagem} para os itens rejeitados.
+def upsert_lote(db: Session, modelo, itens: List[dict],
+                validar: Optional[Callable[[List[dict]], Dict[int, str]]] = None) -> dict:
+    tabela = modelo.__table__
+    resultados = [{"indice": i, "id": item.get("id"), "status": None, "erro": None} for i, item in enumerate(itens)]
+
+    erros = validar(itens) if validar else {}
+    ids_vistos = set()
+    com_id, sem_id = [], []
+    for i, item in enumerate(itens):
+        if i in erros:
+            continue
+        if item.get("id") is None:
+            sem_id.append(i)
+        elif item["id"] in ids_vistos:
+            # O mesmo registro não pode ser alterado duas vezes no mesmo INSERT
+            erros[i] = f"id {item['id']} repetido no lote"
+        else:
+            ids_vistos.add(item["id"])
+            com_id.append(i)
+    for i, mensagem in erros.items():
+        resultados[i].update(status="erro", erro=mensagem)
+
+    colunas = [c.name for c in tabela.columns if c.name != "id"]
+
+    if com_id:
+        stmt = insert(tabela)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[tabela.c.id],
+            set_={coluna: stmt.excluded[coluna] for coluna in colunas}
+        ).returning(
+            tabela.c.id,
+            # xmax = 0 indica que a linha foi inserida (e não atualizada) por este comando
+            literal_column("(xmax = 0)").label("inserido"),
+            sort_by_parameter_order=True
+        )
+        linhas = db.execute(stmt, [{c: itens[i].get(c) for c in ["id"] + colunas} for i in com_id]).all()
+        for i, linha in zip(com_id, linhas):
+            resultados[i].update(id=linha.id, status="criado" if linha.inserido else "atualizado")
+        # Ids explícitos podem ter passado da sequência: ajusta antes de inserir os itens sem id
+        db.execute(text(
+            f"SELECT setval('{tabela.name}_id_seq', (SELECT COALESCE(MAX(id), 1) FROM {tabela.name}))"
+        ))
+
+    if sem_id:
+        stmt = insert(tabela).returning(tabela.c.id, sort_by_parameter_order=True)
+        linhas = db.execute(stmt, [{c: itens[i].get(c) for c in colunas} for i in sem_id]).all()
+        for i, linha in zip(sem_id, linhas):
+            resultados[i].update(id=linha.id, status="criado")
+
+    db.commit()
+
+    return {
+        "total": len(resultados),
+        "criados": sum(1 for r in resultados if r["status"] == "criado"),
+        "atualizados": sum(1 for r in resultados if r["status"] == "atualizado"),
+        "erros": sum(1 for r in resultados if r["status"] == "erro"),
+        "itens": resultados
+    }
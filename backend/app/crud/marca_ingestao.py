@@ -0,0 +1,45 @@
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+from app.models.marca_ingestao import MarcaIngestao
+
+# Marcar as células (inversor, dia) afetadas por medições criadas, alteradas ou removidas.
+# A geração de um dia depende dos pontos vizinhos (intervalos de até 24h), então o dia
+# anterior e o seguinte também são marcados. Não faz commit: a marca deve entrar na
+# mesma transação das medições, para nunca ficar visível antes (ou sem) os dados.
+def marcar_medicoes(db: Session, medicoes: Iterable[Tuple[int, datetime]]) -> None:
+    celulas = {
+        (inversor_id, timestamp.date() + timedelta(days=deslocamento))
+        for inversor_id, timestamp in medicoes
+        for deslocamento in (-1, 0, 1)
+    }
+    if not celulas:
+        return
+    stmt = insert(MarcaIngestao).values([
+        {"inversor_id": inversor_id, "dia": dia} for inversor_id, dia in sorted(celulas)
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[MarcaIngestao.inversor_id, MarcaIngestao.dia],
+        set_={"atualizado_em": func.clock_timestamp()}
+    )
+    db.execute(stmt)
+
+# Marcas das células de um intervalo de dias: {(inversor_id, dia): atualizado_em}
+def get_marcas(db: Session, dia_inicio: date, dia_fim: date) -> Dict[Tuple[int, date], datetime]:
+    linhas = db.query(MarcaIngestao).filter(
+        MarcaIngestao.dia >= dia_inicio,
+        MarcaIngestao.dia <= dia_fim
+    ).all()
+    return {(m.inversor_id, m.dia): m.atualizado_em for m in linhas}
+
+# Marcas das células de alguns inversores em um intervalo de dias: [(inversor_id, dia, atualizado_em)],
+# ordenadas por inversor e dia
+def get_marcas_inversores(db: Session, inversor_ids: List[int], dia_inicio: date, dia_fim: date) -> List[Tuple[int, date, datetime]]:
+    linhas = db.query(MarcaIngestao.inversor_id, MarcaIngestao.dia, MarcaIngestao.atualizado_em).filter(
+        MarcaIngestao.inversor_id.in_(inversor_ids),
+        MarcaIngestao.dia >= dia_inicio,
+        MarcaIngestao.dia <= dia_fim
+    ).order_by(MarcaIngestao.inversor_id, MarcaIngestao.dia).all()
+    return [(linha.inversor_id, linha.dia, linha.atualizado_em) for linha in linhas]
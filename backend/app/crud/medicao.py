@@ -3,6 +3,8 @@ from app.models.medicao import Medicao
 from app.schemas.medicao import MedicaoCreate, MedicaoUpdate
 from typing import List, Optional
 from app.core.database import ajustar_sequencias
+from app.crud.marca_ingestao import marcar_medicoes
+from app.crud.ultima_medicao import atualizar_ultimas_medicoes, recalcular_ultimas_medicoes
 
 # Criar uma medição
 def create_medicao(db: Session, medicao: MedicaoCreate) -> Medicao:
@@ -10,6 +12,8 @@ def create_medicao(db: Session, medicao: MedicaoCreate) -> Medicao:
     data.pop('id', None)  # Remove o campo id, se vier por engano
     db_medicao = Medicao(**data)
     db.add(db_medicao)
+    marcar_medicoes(db, [(db_medicao.inversor_id, db_medicao.timestamp)])
+    atualizar_ultimas_medicoes(db, [db_medicao])
     db.commit()
     ajustar_sequencias()
     db.refresh(db_medicao)
@@ -31,8 +35,14 @@ def update_medicao(db: Session, medicao_id: int, medicao: MedicaoUpdate) -> Opti
     db_medicao = get_medicao(db, medicao_id)
     if not db_medicao:
         return None
+    # Marca a posição antiga e a nova da medição
+    afetadas = [(db_medicao.inversor_id, db_medicao.timestamp)]
     for key, value in medicao.dict(exclude_unset=True).items():
         setattr(db_medicao, key, value)
+    afetadas.append((db_medicao.inversor_id, db_medicao.timestamp))
+    marcar_medicoes(db, afetadas)
+    db.flush()
+    recalcular_ultimas_medicoes(db, [inversor_id for inversor_id, _ in afetadas])
     db.commit()
     db.refresh(db_medicao)
     return db_medicao
@@ -42,6 +52,9 @@ def delete_medicao(db: Session, medicao_id: int) -> bool:
     db_medicao = get_medicao(db, medicao_id)
     if not db_medicao:
         return False
+    marcar_medicoes(db, [(db_medicao.inversor_id, db_medicao.timestamp)])
     db.delete(db_medicao)
+    db.flush()
+    recalcular_ultimas_medicoes(db, [db_medicao.inversor_id])
     db.commit()
     return True 
\ No newline at end of file
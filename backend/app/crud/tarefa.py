@@ -0,0 +1,68 @@
+import os
+import json
+import uuid
+import hashlib
+from datetime import datetime, timedelta
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from typing import Optional, Tuple
+from app.models.tarefa import Tarefa, STATUS_EM_ANDAMENTO
+
+# Tempo (em segundos) após o qual uma tarefa em andamento é considerada abandonada
+# (worker interrompido) e deixa de receber novas solicitações iguais
+TAREFA_TIMEOUT = int(os.getenv("TAREFA_TIMEOUT", "3600"))
+
+# Chave de uma solicitação: tipo e parâmetros, com as datas normalizadas
+def chave_tarefa(tipo: str, parametros: dict) -> str:
+    normalizados = dict(parametros)
+    for campo in ('data_inicio', 'data_fim'):
+        if campo in normalizados:
+            normalizados[campo] = datetime.fromisoformat(normalizados[campo]).isoformat()
+    conteudo = json.dumps({"tipo": tipo, "parametros": normalizados}, sort_keys=True)
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+# Registrar uma solicitação. Se já existe uma tarefa igual pendente ou executando,
+# devolve essa tarefa em vez de criar outra. Retorna (tarefa, criada).
+def registrar_tarefa(db: Session, tipo: str, parametros: dict) -> Tuple[Tarefa, bool]:
+    chave = chave_tarefa(tipo, parametros)
+    db.query(Tarefa).filter(
+        Tarefa.chave == chave,
+        Tarefa.status.in_(STATUS_EM_ANDAMENTO),
+        Tarefa.atualizado_em < func.clock_timestamp() - timedelta(seconds=TAREFA_TIMEOUT)
+    ).update({"status": "erro", "erro": "Tarefa abandonada", "atualizado_em": func.clock_timestamp()},
+             synchronize_session=False)
+    while True:
+        stmt = insert(Tarefa).values(
+            id=str(uuid.uuid4()), chave=chave, tipo=tipo, parametros=parametros, status="pendente"
+        ).on_conflict_do_nothing(
+            index_elements=[Tarefa.chave],
+            index_where=text("status IN ('pendente', 'executando')")
+        ).returning(Tarefa.id)
+        tarefa_id = db.execute(stmt).scalar()
+        if tarefa_id:
+            db.commit()
+            return get_tarefa(db, tarefa_id), True
+        existente = db.query(Tarefa).filter(
+            Tarefa.chave == chave,
+            Tarefa.status.in_(STATUS_EM_ANDAMENTO)
+        ).first()
+        # A tarefa em andamento pode ter terminado entre o insert e a consulta: tenta de novo
+        if existente:
+            db.commit()
+            return existente, False
+
+# Buscar tarefa por ID
+def get_tarefa(db: Session, tarefa_id: str) -> Optional[Tarefa]:
+    return db.query(Tarefa).filter(Tarefa.id == tarefa_id).first()
+
+# Atualizar a situação de uma tarefa (executando, concluida ou erro)
+def atualizar_status_tarefa(db: Session, tarefa_id: str, status: str,
+                            nome_arquivo: Optional[str] = None, erro: Optional[str] = None) -> None:
+    db.query(Tarefa).filter(Tarefa.id == tarefa_id).update({
+        "status": status,
+        "nome_arquivo": nome_arquivo,
+        "erro": erro,
+        "atualizado_em": func.clock_timestamp()
+    }, synchronize_session=False)
+    db.commit()
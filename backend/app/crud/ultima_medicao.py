@@ -0,0 +1,60 @@
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from typing import Iterable, List, Optional
+from app.models.inversor import Inversor
+from app.models.medicao import Medicao
+from app.models.ultima_medicao import UltimaMedicao
+
+# Atualizar a última medição dos inversores a partir de medições recém-gravadas. Cada linha
+# só é substituída se o timestamp novo for mais recente que o guardado. Não faz commit:
+# entra na mesma transação das medições, como as marcas de ingestão.
+def atualizar_ultimas_medicoes(db: Session, medicoes: Iterable[Medicao]) -> None:
+    ultimas = {}
+    for medicao in medicoes:
+        atual = ultimas.get(medicao.inversor_id)
+        if atual is None or medicao.timestamp >= atual.timestamp:
+            ultimas[medicao.inversor_id] = medicao
+    if not ultimas:
+        return
+    stmt = insert(UltimaMedicao).values([
+        {
+            "inversor_id": inversor_id,
+            "timestamp": medicao.timestamp,
+            "potencia_ativa": medicao.potencia_ativa,
+            "temperatura": medicao.temperatura
+        }
+        for inversor_id, medicao in sorted(ultimas.items())
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UltimaMedicao.inversor_id],
+        set_={
+            "timestamp": stmt.excluded.timestamp,
+            "potencia_ativa": stmt.excluded.potencia_ativa,
+            "temperatura": stmt.excluded.temperatura
+        },
+        where=UltimaMedicao.timestamp < stmt.excluded.timestamp
+    )
+    db.execute(stmt)
+
+# Recalcular a última medição de alguns inversores direto das medições (após alterações e
+# remoções, que podem atingir a medição guardada). Não faz commit; exige as mudanças já enviadas (flush).
+def recalcular_ultimas_medicoes(db: Session, inversor_ids: Iterable[int]) -> None:
+    for inversor_id in sorted(set(inversor_ids)):
+        db.query(UltimaMedicao).filter(UltimaMedicao.inversor_id == inversor_id).delete(synchronize_session=False)
+        ultima = select(
+            Medicao.inversor_id, Medicao.timestamp, Medicao.potencia_ativa, Medicao.temperatura
+        ).where(Medicao.inversor_id == inversor_id).order_by(Medicao.timestamp.desc(), Medicao.id.desc()).limit(1)
+        db.execute(insert(UltimaMedicao).from_select(
+            ["inversor_id", "timestamp", "potencia_ativa", "temperatura"], ultima
+        ))
+
+# Status da frota: cada inversor com sua última medição (None se ainda não tem medições)
+def get_status_inversores(db: Session, usina_id: Optional[int] = None) -> List[dict]:
+    query = db.query(
+        Inversor.id, Inversor.nome, Inversor.usina_id,
+        UltimaMedicao.timestamp, UltimaMedicao.potencia_ativa, UltimaMedicao.temperatura
+    ).outerjoin(UltimaMedicao, UltimaMedicao.inversor_id == Inversor.id)
+    if usina_id is not None:
+        query = query.filter(Inversor.usina_id == usina_id)
+    return [linha._asdict() for linha in query.order_by(Inversor.id).all()]
@@ -1,8 +1,10 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from app.models.usina import Usina
-from app.schemas.usina import UsinaCreate, UsinaUpdate
+from app.schemas.usina import UsinaCreate, UsinaUpdate, UsinaLote
 from typing import List, Optional
 from app.core.database import ajustar_sequencias
+from app.crud.versao import versao_consulta, versao_linha
+from app.crud.lote import upsert_lote
 
 # Criar uma usina
 def create_usina(db: Session, usina: UsinaCreate) -> Usina:
@@ -15,13 +17,40 @@ def create_usina(db: Session, usina: UsinaCreate) -> Usina:
     db.refresh(db_usina)
     return db_usina
 
+# Criar ou atualizar várias usinas de uma vez (um INSERT e um commit)
+def upsert_usinas(db: Session, usinas: List[UsinaLote]) -> dict:
+    return upsert_lote(db, Usina, [usina.dict() for usina in usinas])
+
 # Listar todas as usinas
-def get_usinas(db: Session, skip: int = 0, limit: int = 100) -> List[Usina]:
-    return db.query(Usina).offset(skip).limit(limit).all()
+# Com incluir_inversores, os inversores de todas as usinas vêm em uma segunda consulta (selectinload)
+def get_usinas(db: Session, skip: int = 0, limit: int = 100, incluir_inversores: bool = False) -> List[Usina]:
+    query = _query_usinas(db, skip, limit)
+    if incluir_inversores:
+        query = query.options(selectinload(Usina.inversores))
+    return query.all()
+
+# Árvore completa: todas as usinas com seus inversores, em duas consultas
+def get_hierarquia(db: Session) -> List[Usina]:
+    return get_usinas(db, skip=0, limit=None, incluir_inversores=True)
+
+# Versão da listagem (usada no ETag), sem carregar os objetos
+def get_versao_usinas(db: Session, skip: int = 0, limit: int = 100) -> str:
+    return versao_consulta(db, _query_usinas(db, skip, limit), Usina)
+
+# Versão de um registro (None se não existir)
+def get_versao_usina(db: Session, usina_id: int) -> Optional[str]:
+    return versao_linha(db, Usina, usina_id)
+
+def _query_usinas(db: Session, skip: int, limit: int):
+    # Ordenação fixa para que a paginação (e o ETag) sejam estáveis
+    return db.query(Usina).order_by(Usina.id).offset(skip).limit(limit)
 
 # Buscar usina por ID
-def get_usina(db: Session, usina_id: int) -> Optional[Usina]:
-    return db.query(Usina).filter(Usina.id == usina_id).first()
+def get_usina(db: Session, usina_id: int, incluir_inversores: bool = False) -> Optional[Usina]:
+    query = db.query(Usina).filter(Usina.id == usina_id)
+    if incluir_inversores:
+        query = query.options(selectinload(Usina.inversores))
+    return query.first()
 
 # Atualizar usina
 def update_usina(db: Session, usina_id: int, usina: UsinaUpdate) -> Optional[Usina]:
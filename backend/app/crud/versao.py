@@ -0,0 +1,26 @@
+from sqlalchemy import func, literal, literal_column
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import Query, Session
+
+# Calcular a versão das linhas retornadas por uma consulta.
+# Usa a coluna de sistema xmin do PostgreSQL, que muda a cada UPDATE da linha,
+# então inserções, alterações e remoções geram uma versão diferente.
+def versao_consulta(db: Session, query: Query, modelo) -> str:
+    tabela = modelo.__table__.name
+    sub = query.with_entities(
+        modelo.id.label("id"),
+        literal_column(f"{tabela}.xmin::text").label("xmin")
+    ).subquery()
+    total, assinatura = db.query(
+        func.count(sub.c.id),
+        func.md5(func.string_agg(
+            func.concat(sub.c.id, ':', sub.c.xmin),
+            aggregate_order_by(literal(','), sub.c.id)
+        ))
+    ).one()
+    return f"{total}-{assinatura}"
+
+# Versão de uma única linha (None se ela não existir)
+def versao_linha(db: Session, modelo, id: int):
+    tabela = modelo.__table__.name
+    return db.query(literal_column(f"{tabela}.xmin::text")).filter(modelo.id == id).scalar()
@@ -1,11 +1,26 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+from app.core.respostas import GZIP_TAMANHO_MINIMO, GZIP_NIVEL
+from app.core import ao_vivo as buffers_ao_vivo
 from app.api import usina, inversor, medicao
 from app.api import ingestao
 from app.api import agregacao
 from app.api import ia
 from app.api import processamento
+from app.api import ao_vivo
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Janela recente de medições em memória para as visões ao vivo
+    parar_ao_vivo = buffers_ao_vivo.iniciar()
+    yield
+    parar_ao_vivo.set()
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_TAMANHO_MINIMO, compresslevel=GZIP_NIVEL)
 
 app.include_router(usina.router)
 app.include_router(inversor.router)
@@ -14,7 +29,8 @@ app.include_router(ingestao.router)
 app.include_router(agregacao.router)
 app.include_router(ia.router)
 app.include_router(processamento.router)
+app.include_router(ao_vivo.router)
 
 @app.get("/")
 def read_root():
-    return {"msg": "API de monitoramento de usinas fotovoltaicas"} 
\ No newline at end of file
+    return {"msg": "API de monitoramento de usinas fotovoltaicas"}
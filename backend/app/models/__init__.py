@@ -1,3 +1,9 @@
 from .usina import Usina
 from .inversor import Inversor
-from .medicao import Medicao 
\ No newline at end of file
+from .medicao import Medicao
+from .marca_ingestao import MarcaIngestao
+from .tarefa import Tarefa
+from .agregado_diario import AgregadoDiario
+from .sketch_diario import SketchDiario
+from .ultima_medicao import UltimaMedicao
+from .resultado_cache import ResultadoCache
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, Float, Date, DateTime, ForeignKey
+from app.core.database import Base
+
+class AgregadoDiario(Base):
+    """
+    Métricas de cada célula (inversor, dia), mantidas a partir das marcas de ingestão.
+    Guarda somas e contagens em vez de médias para que possam ser combinadas em
+    semanas, meses, usinas e frota.
+    """
+    __tablename__ = "agregados_diarios"
+
+    inversor_id = Column(Integer, ForeignKey("inversores.id", ondelete="CASCADE"), primary_key=True)
+    dia = Column(Date, primary_key=True, index=True)
+    potencia_maxima = Column(Float, nullable=True)
+    potencia_minima = Column(Float, nullable=True)
+    soma_potencia = Column(Float, nullable=True)
+    n_potencia = Column(Integer, nullable=False, default=0)
+    soma_temperatura = Column(Float, nullable=True)
+    n_temperatura = Column(Integer, nullable=False, default=0)
+    quantidade_medicoes = Column(Integer, nullable=False, default=0)
+    geracao = Column(Float, nullable=False, default=0.0)
+    # Marca de ingestão da célula quando ela foi calculada (None se não havia marca)
+    marca_em = Column(DateTime, nullable=True)
@@ -0,0 +1,10 @@
+from sqlalchemy import Column, Integer, Date, DateTime, ForeignKey, text
+from app.core.database import Base
+
+class MarcaIngestao(Base):
+    """Última alteração de medições de cada célula (inversor, dia), usada para recalcular só o que mudou"""
+    __tablename__ = "marcas_ingestao"
+
+    inversor_id = Column(Integer, ForeignKey("inversores.id", ondelete="CASCADE"), primary_key=True)
+    dia = Column(Date, primary_key=True, index=True)
+    atualizado_em = Column(DateTime, nullable=False, server_default=text("clock_timestamp()"))
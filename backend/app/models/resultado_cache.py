@@ -0,0 +1,14 @@
+from sqlalchemy import Column, String, DateTime, text
+from app.core.database import Base
+
+class ResultadoCache(Base):
+    """
+    Arquivo de resultado de agregação guardado no cache. Cada arquivo tem uma linha até ser
+    apagado; a chave deixa de apontar para ele (NULL) quando um resultado mais novo a substitui.
+    """
+    __tablename__ = "resultados_cache"
+
+    nome_arquivo = Column(String, primary_key=True)
+    chave = Column(String(64), nullable=True, unique=True)
+    criado_em = Column(DateTime, nullable=False, server_default=text("clock_timestamp()"))
+    acessado_em = Column(DateTime, nullable=False, server_default=text("clock_timestamp()"), index=True)
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, Date, DateTime, LargeBinary, ForeignKey
+from app.core.database import Base
+
+class SketchDiario(Base):
+    """
+    Resumo da distribuição (t-digest, ver utils.TDigest) da potência e da temperatura
+    de cada célula (inversor, dia). Calculado junto com agregados_diarios e combinável
+    entre dias, inversores e usinas para responder percentis de qualquer período.
+    """
+    __tablename__ = "sketches_diarios"
+
+    inversor_id = Column(Integer, ForeignKey("inversores.id", ondelete="CASCADE"), primary_key=True)
+    dia = Column(Date, primary_key=True, index=True)
+    potencia_ativa = Column(LargeBinary, nullable=True)
+    temperatura = Column(LargeBinary, nullable=True)
+    # Marca de ingestão da célula quando ela foi calculada (None se não havia marca)
+    marca_em = Column(DateTime, nullable=True)
@@ -0,0 +1,26 @@
+from sqlalchemy import Column, String, Text, DateTime, Index, JSON, text
+from app.core.database import Base
+
+# Situações em que a tarefa ainda não terminou: no máximo uma por chave
+STATUS_EM_ANDAMENTO = ("pendente", "executando")
+
+class Tarefa(Base):
+    """Solicitação enviada ao worker. Solicitações iguais em andamento compartilham a mesma tarefa"""
+    __tablename__ = "tarefas"
+
+    id = Column(String(36), primary_key=True)
+    chave = Column(String(64), nullable=False, index=True)
+    tipo = Column(String, nullable=False)
+    parametros = Column(JSON, nullable=False)
+    status = Column(String, nullable=False, default="pendente")
+    nome_arquivo = Column(String, nullable=True)
+    erro = Column(Text, nullable=True)
+    criado_em = Column(DateTime, nullable=False, server_default=text("clock_timestamp()"))
+    atualizado_em = Column(DateTime, nullable=False, server_default=text("clock_timestamp()"))
+
+    __table_args__ = (
+        Index(
+            "ix_tarefas_chave_em_andamento", "chave", unique=True,
+            postgresql_where=text("status IN ('pendente', 'executando')")
+        ),
+    )
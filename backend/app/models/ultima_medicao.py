@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey
+from app.core.database import Base
+
+class UltimaMedicao(Base):
+    """Medição mais recente de cada inversor, atualizada junto com a gravação das medições"""
+    __tablename__ = "ultimas_medicoes"
+
+    inversor_id = Column(Integer, ForeignKey("inversores.id", ondelete="CASCADE"), primary_key=True)
+    timestamp = Column(DateTime, nullable=False)
+    potencia_ativa = Column(Float, nullable=True)
+    temperatura = Column(Float, nullable=True)
@@ -9,4 +9,4 @@ class Usina(Base):
     nome = Column(String, nullable=False)
     localizacao = Column(String, nullable=True)
 
-    inversores = relationship("Inversor", back_populates="usina", cascade="all, delete-orphan") 
\ No newline at end of file
+    inversores = relationship("Inversor", back_populates="usina", cascade="all, delete-orphan", order_by="Inversor.id") 
\ No newline at end of file
@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from datetime import datetime
 from typing import Optional
 
 class InversorBase(BaseModel):
@@ -12,7 +13,18 @@ class InversorCreate(InversorBase):
 class InversorUpdate(InversorBase):
     pass
 
+class InversorLote(InversorBase):
+    id: Optional[int] = None  # com id: cria ou atualiza esse registro
+
 class InversorRead(InversorBase):
     id: int
     class Config:
-        orm_mode = True 
\ No newline at end of file
+        orm_mode = True 
+
+class InversorStatus(BaseModel):
+    id: int
+    nome: str
+    usina_id: int
+    timestamp: Optional[datetime] = None  # última medição; None se o inversor ainda não tem medições
+    potencia_ativa: Optional[float] = None
+    temperatura: Optional[float] = None
@@ -0,0 +1,15 @@
+from pydantic import BaseModel
+from typing import Optional, List
+
+class ItemLoteResultado(BaseModel):
+    indice: int  # posição do item na lista enviada
+    id: Optional[int] = None
+    status: str  # "criado", "atualizado" ou "erro"
+    erro: Optional[str] = None
+
+class ResultadoLote(BaseModel):
+    total: int
+    criados: int
+    atualizados: int
+    erros: int
+    itens: List[ItemLoteResultado]
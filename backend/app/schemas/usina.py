@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import Optional, List
+from app.schemas.inversor import InversorRead
 
 class UsinaBase(BaseModel):
     nome: str
@@ -11,7 +12,13 @@ class UsinaCreate(UsinaBase):
 class UsinaUpdate(UsinaBase):
     pass
 
+class UsinaLote(UsinaBase):
+    id: Optional[int] = None  # com id: cria ou atualiza esse registro
+
 class UsinaRead(UsinaBase):
     id: int
     class Config:
-        orm_mode = True 
\ No newline at end of file
+        orm_mode = True 
+
+class UsinaComInversores(UsinaRead):
+    inversores: List[InversorRead] = []
@@ -0,0 +1,129 @@
+"""
+Cache dos resultados das agregações, endereçado pelo conteúdo da solicitação.
+
+A chave é o hash do tipo, dos parâmetros normalizados e das marcas de ingestão
+de cada célula (inversor, dia) envolvida: enquanto nenhuma medição desse recorte
+mudar, a mesma solicitação aponta para o arquivo já salvo em results_analises.
+O índice (chave -> arquivo) fica na tabela resultados_cache, compartilhada pela API e
+pelo worker, e é limitado por quantidade (os menos acessados saem primeiro) e por idade;
+ao sair do índice o arquivo do resultado também é removido, a menos que uma tarefa
+recente ainda aponte para ele.
+"""
+import os
+import json
+import hashlib
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import delete, exists, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from app.crud.marca_ingestao import get_marcas_inversores
+from app.models.resultado_cache import ResultadoCache
+from app.models.tarefa import Tarefa
+from app.workers.motor_agregacao import resolver_inversores
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BASE_DIR, 'results_analises')
+
+# Quantidade máxima de resultados no cache e idade máxima (segundos) de cada um
+CACHE_RESULTADOS_MAX = int(os.getenv("CACHE_RESULTADOS_MAX", "200"))
+CACHE_RESULTADOS_TTL = int(os.getenv("CACHE_RESULTADOS_TTL", "86400"))
+
+def normalizar_parametros(parametros):
+    """Datas no formato ISO completo, para que '2025-01-01' e '2025-01-01T00:00:00' coincidam"""
+    normalizados = dict(parametros)
+    for chave in ('data_inicio', 'data_fim'):
+        if chave in normalizados:
+            normalizados[chave] = datetime.fromisoformat(normalizados[chave]).isoformat()
+    return normalizados
+
+def inversores_da_agregacao(db, parametros):
+    if parametros.get('inversor_id') is not None:
+        return [parametros['inversor_id']]
+    return resolver_inversores(db, parametros.get('inversor_ids'), parametros.get('usina_id'))
+
+def chave_cache(db, tipo, parametros):
+    parametros = normalizar_parametros(parametros)
+    inversor_ids = inversores_da_agregacao(db, parametros)
+    marcas = get_marcas_inversores(
+        db, inversor_ids,
+        datetime.fromisoformat(parametros['data_inicio']).date(),
+        datetime.fromisoformat(parametros['data_fim']).date()
+    )
+    # Todas as marcas entram na chave: um resumo (quantidade, maior horário) não muda quando a
+    # marca de uma transação longa é confirmada depois de outra com horário mais recente
+    conteudo = json.dumps({
+        "tipo": tipo,
+        "parametros": parametros,
+        "inversores": inversor_ids,
+        "marcas": [[inversor_id, dia.isoformat(), atualizado_em.isoformat()] for inversor_id, dia, atualizado_em in marcas]
+    }, sort_keys=True)
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+def _remover_resultado(nome_arquivo):
+    caminho = os.path.join(RESULTS_DIR, nome_arquivo)
+    if os.path.isfile(caminho):
+        os.remove(caminho)
+
+def _despejar(db):
+    """
+    Apaga as entradas vencidas, substituídas ou além do limite (menos acessadas primeiro) e
+    seus arquivos, exceto os que uma tarefa atualizada dentro da validade ainda informa ao cliente
+    """
+    validade = func.clock_timestamp() - timedelta(seconds=CACHE_RESULTADOS_TTL)
+    mais_acessadas = select(ResultadoCache.nome_arquivo).where(
+        ResultadoCache.chave.isnot(None)
+    ).order_by(ResultadoCache.acessado_em.desc()).limit(CACHE_RESULTADOS_MAX)
+    referenciada = exists().where(
+        Tarefa.nome_arquivo == ResultadoCache.nome_arquivo,
+        Tarefa.atualizado_em > validade
+    )
+    # DELETE ... RETURNING: cada arquivo é apagado por um único processo
+    removidas = db.execute(
+        delete(ResultadoCache).where(
+            or_(
+                ResultadoCache.chave.is_(None),
+                ResultadoCache.criado_em <= validade,
+                ResultadoCache.nome_arquivo.not_in(mais_acessadas)
+            ),
+            ~referenciada
+        ).returning(ResultadoCache.nome_arquivo)
+    ).scalars().all()
+    db.commit()
+    for nome_arquivo in removidas:
+        _remover_resultado(nome_arquivo)
+
+def buscar_no_cache(db, chave) -> Optional[str]:
+    """Nome do arquivo já calculado para a chave, ou None"""
+    nome_arquivo = db.execute(
+        update(ResultadoCache).where(
+            ResultadoCache.chave == chave,
+            ResultadoCache.criado_em > func.clock_timestamp() - timedelta(seconds=CACHE_RESULTADOS_TTL)
+        ).values(acessado_em=func.clock_timestamp()).returning(ResultadoCache.nome_arquivo)
+    ).scalar()
+    db.commit()
+    if nome_arquivo and not os.path.isfile(os.path.join(RESULTS_DIR, nome_arquivo)):
+        # Arquivo apagado por fora do cache
+        db.query(ResultadoCache).filter(ResultadoCache.nome_arquivo == nome_arquivo).delete(synchronize_session=False)
+        db.commit()
+        return None
+    return nome_arquivo
+
+def registrar_no_cache(db, chave, nome_arquivo):
+    """Aponta a chave para o arquivo; o resultado anterior da chave fica sem chave até ser despejado"""
+    while True:
+        try:
+            db.query(ResultadoCache).filter(ResultadoCache.chave == chave).update(
+                {"chave": None}, synchronize_session=False
+            )
+            stmt = insert(ResultadoCache).values(nome_arquivo=nome_arquivo, chave=chave)
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=[ResultadoCache.nome_arquivo],
+                set_={"chave": chave, "criado_em": func.clock_timestamp(), "acessado_em": func.clock_timestamp()}
+            ))
+            db.commit()
+            break
+        except IntegrityError:
+            # Outro processo registrou a mesma chave ao mesmo tempo: tenta de novo
+            db.rollback()
+    _despejar(db)
@@ -0,0 +1,856 @@
+"""
+Motor genérico de agregação: um conjunto de métricas, uma granularidade de tempo
+e um agrupamento (inversor, usina ou frota) viram uma única consulta.
+
+Quando a granularidade é de um dia ou mais e o período cobre dias inteiros, a
+consulta é feita sobre agregados_diarios (uma linha por inversor e dia), que é
+atualizada antes a partir das marcas de ingestão. Nos demais casos a consulta vai
+direto às medições.
+
+A geração segue as regras de utils.integrate_generation (trapézio, lacunas de até
+24h) e cada intervalo entre medições é dividido nas fronteiras dos períodos e do
+próprio intervalo consultado, com a potência interpolada linearmente. Por isso a
+soma dos períodos é a energia exata entre data_inicio e data_fim.
+"""
+import os
+import numpy as np
+import pandas as pd
+from datetime import datetime, time, timedelta
+from sqlalchemy import func, text, bindparam
+from sqlalchemy.dialects.postgresql import insert
+from app.models import AgregadoDiario, Inversor, Medicao, SketchDiario
+from app.crud.marca_ingestao import get_marcas
+from utils import TDigest
+
+# Consultar agregados_diarios quando possível (0 para sempre ler as medições)
+MOTOR_USA_AGREGADOS = os.getenv("MOTOR_USA_AGREGADOS", "1") == "1"
+
+# Expressão de cada métrica sobre as medições e sobre agregados_diarios
+METRICAS = {
+    "potencia_maxima": ("MAX(potencia_ativa)", "MAX(potencia_maxima)"),
+    "potencia_minima": ("MIN(potencia_ativa)", "MIN(potencia_minima)"),
+    "potencia_media": ("AVG(potencia_ativa)", "SUM(soma_potencia) / NULLIF(SUM(n_potencia), 0)"),
+    "potencia_soma": ("SUM(potencia_ativa)", "SUM(soma_potencia)"),
+    "temperatura_media": ("AVG(temperatura)", "SUM(soma_temperatura) / NULLIF(SUM(n_temperatura), 0)"),
+    "quantidade_medicoes": ("COUNT(*)", "SUM(quantidade_medicoes)"),
+    "geracao": (None, "SUM(geracao)"),
+}
+# Métricas usadas só para preencher agregados_diarios
+_METRICAS_INTERNAS = {
+    "n_potencia": "COUNT(potencia_ativa)",
+    "soma_temperatura": "SUM(temperatura)",
+    "n_temperatura": "COUNT(temperatura)",
+}
+_METRICAS_INTEIRAS = {"quantidade_medicoes", "n_potencia", "n_temperatura"}
+
+# Granularidade -> (unidade do date_trunc, passo em segundos usado para dividir a geração)
+GRANULARIDADES = {
+    "15min": (None, 900),
+    "hora": ("hour", 3600),
+    "dia": ("day", 86400),
+    "semana": ("week", 86400),
+    "mes": ("month", 86400),
+}
+AGRUPAMENTOS = {
+    "inversor": ["inversor_id"],
+    "usina": ["usina_id"],
+    "frota": [],
+}
+
+def _periodo(coluna, granularidade):
+    unidade, passo = GRANULARIDADES[granularidade]
+    if unidade is None:
+        return f"(TIMESTAMP 'epoch' + FLOOR(EXTRACT(EPOCH FROM {coluna}) / {passo}) * INTERVAL '{passo} seconds')"
+    return f"date_trunc('{unidade}', {coluna})"
+
+# Um fim de período a partir deste horário equivale à meia-noite seguinte
+_FIM_DO_DIA = time(23, 59, 59)
+
+def _fim_exclusivo(data_fim):
+    if data_fim.time() >= _FIM_DO_DIA:
+        return datetime.combine(data_fim.date() + timedelta(days=1), datetime.min.time())
+    return data_fim
+
+def validar_consulta(metricas, granularidade, agrupamento):
+    if not metricas:
+        raise ValueError("Informe ao menos uma métrica")
+    desconhecidas = [m for m in metricas if m not in METRICAS]
+    if desconhecidas:
+        raise ValueError(f"Métricas desconhecidas: {desconhecidas}. Disponíveis: {list(METRICAS)}")
+    if granularidade not in GRANULARIDADES:
+        raise ValueError(f"Granularidade desconhecida: {granularidade}. Disponíveis: {list(GRANULARIDADES)}")
+    if agrupamento not in AGRUPAMENTOS:
+        raise ValueError(f"Agrupamento desconhecido: {agrupamento}. Disponíveis: {list(AGRUPAMENTOS)}")
+
+def _sql_medicoes(metricas, granularidade, agrupamento):
+    """Consulta sobre as medições: estatísticas agrupadas e geração dividida por período"""
+    grupo = AGRUPAMENTOS[agrupamento]
+    colunas_grupo = "".join(f"{coluna}, " for coluna in grupo)
+    estatisticas = [m for m in metricas if m != "geracao"]
+    expressoes = {**{m: expr for m, (expr, _) in METRICAS.items()}, **_METRICAS_INTERNAS}
+    ctes = []
+    if estatisticas:
+        ctes.append(f"""
+        estatisticas AS (
+            SELECT {colunas_grupo}{_periodo('m.timestamp', granularidade)} AS periodo,
+                   {', '.join(f'{expressoes[m]} AS {m}' for m in estatisticas)}
+            FROM medicoes m JOIN inversores i ON i.id = m.inversor_id
+            WHERE m.inversor_id IN :inversor_ids
+              AND m.timestamp >= :data_inicio AND m.timestamp <= :data_fim
+            GROUP BY {colunas_grupo}periodo
+        )""")
+    if "geracao" in metricas:
+        _, passo = GRANULARIDADES[granularidade]
+        pedaco = "15min" if passo == 900 else "hora" if passo == 3600 else "dia"
+        # Pares lidos com 24h de folga: intervalos que cruzam data_inicio/data_fim entram pela parte de dentro
+        ctes.append(f"""
+        pares AS (
+            SELECT m.inversor_id, i.usina_id,
+                   LAG(m.timestamp) OVER w AS t0, m.timestamp AS t1,
+                   LAG(m.potencia_ativa) OVER w AS p0, m.potencia_ativa AS p1
+            FROM medicoes m JOIN inversores i ON i.id = m.inversor_id
+            WHERE m.inversor_id IN :inversor_ids
+              AND m.potencia_ativa IS NOT NULL
+              AND m.timestamp >= :inicio_pares AND m.timestamp <= :fim_pares
+            WINDOW w AS (PARTITION BY m.inversor_id ORDER BY m.timestamp, m.id)
+        ), pedacos AS (
+            SELECT inversor_id, usina_id, t0, t1, p0, p1, b.inicio AS bucket,
+                   GREATEST(t0, b.inicio, :data_inicio) AS a,
+                   LEAST(t1, b.inicio + INTERVAL '{passo} seconds', :fim_corte) AS z
+            FROM pares
+            CROSS JOIN LATERAL generate_series({_periodo('t0', pedaco)}, t1, INTERVAL '{passo} seconds') AS b(inicio)
+            WHERE p0 >= 0 AND p1 >= 0 AND t1 > t0 AND t1 - t0 <= INTERVAL '24 hours'
+              AND t1 > :data_inicio AND t0 < :fim_corte
+        ), energia AS (
+            SELECT {colunas_grupo}{_periodo('bucket', granularidade)} AS periodo,
+                   SUM((pa + pz) / 2 * EXTRACT(EPOCH FROM z - a)::float8 / 3600) AS geracao
+            FROM pedacos
+            CROSS JOIN LATERAL (SELECT
+                p0 + (p1 - p0) * EXTRACT(EPOCH FROM a - t0)::float8 / EXTRACT(EPOCH FROM t1 - t0)::float8 AS pa,
+                p0 + (p1 - p0) * EXTRACT(EPOCH FROM z - t0)::float8 / EXTRACT(EPOCH FROM t1 - t0)::float8 AS pz
+            ) interpolacao
+            WHERE z > a
+            GROUP BY {colunas_grupo}periodo
+        )""")
+
+    if estatisticas and "geracao" in metricas:
+        origem = f"estatisticas FULL JOIN energia USING ({colunas_grupo}periodo)"
+    elif estatisticas:
+        origem = "estatisticas"
+    else:
+        origem = "energia"
+    selecao = [
+        f"COALESCE({m}, 0) AS {m}" if m in ("geracao", "quantidade_medicoes") else m
+        for m in metricas
+    ]
+    return f"""
+        WITH {','.join(ctes)}
+        SELECT {colunas_grupo}periodo, {', '.join(selecao)}
+        FROM {origem}
+        ORDER BY {colunas_grupo}periodo
+    """
+
+def _sql_agregados(metricas, granularidade, agrupamento):
+    """Consulta sobre agregados_diarios, combinando os dias na granularidade pedida"""
+    colunas_grupo = "".join(f"{coluna}, " for coluna in AGRUPAMENTOS[agrupamento])
+    selecao = [f"{METRICAS[m][1]} AS {m}" for m in metricas]
+    return f"""
+        SELECT {colunas_grupo}{_periodo('a.dia::timestamp', granularidade)} AS periodo, {', '.join(selecao)}
+        FROM agregados_diarios a JOIN inversores i ON i.id = a.inversor_id
+        WHERE a.inversor_id IN :inversor_ids
+          AND a.dia >= :dia_inicio AND a.dia <= :dia_fim
+        GROUP BY {colunas_grupo}periodo
+        HAVING SUM(a.quantidade_medicoes) > 0 OR SUM(a.geracao) <> 0
+        ORDER BY {colunas_grupo}periodo
+    """
+
+def _executar(db, sql, parametros):
+    return db.execute(text(sql).bindparams(bindparam("inversor_ids", expanding=True)), parametros).mappings().all()
+
+def consultar_medicoes(db, metricas, granularidade, agrupamento, inversor_ids, data_inicio, data_fim):
+    """Executa a consulta direto sobre as medições. Retorna as linhas do banco"""
+    fim_corte = _fim_exclusivo(data_fim)
+    return _executar(db, _sql_medicoes(metricas, granularidade, agrupamento), {
+        "inversor_ids": list(inversor_ids),
+        "data_inicio": data_inicio,
+        "data_fim": data_fim,
+        "fim_corte": fim_corte,
+        "inicio_pares": data_inicio - timedelta(hours=24),
+        "fim_pares": fim_corte + timedelta(hours=24),
+    })
+
+# Métricas calculadas para cada linha de agregados_diarios e a coluna em que são guardadas
+_COLUNAS_AGREGADOS = {
+    "potencia_maxima": "potencia_maxima",
+    "potencia_minima": "potencia_minima",
+    "potencia_soma": "soma_potencia",
+    "n_potencia": "n_potencia",
+    "soma_temperatura": "soma_temperatura",
+    "n_temperatura": "n_temperatura",
+    "quantidade_medicoes": "quantidade_medicoes",
+    "geracao": "geracao",
+}
+
+def recalcular_agregados_diarios(db, inversor_ids, dia_inicio, dia_fim, celulas=None):
+    """
+    Recalcula agregados_diarios dos inversores entre dia_inicio e dia_fim com uma
+    consulta sobre as medições. Com celulas (conjunto de (inversor_id, dia)), grava só
+    essas células, inclusive as que ficaram sem medições. Não faz commit.
+    Retorna a quantidade de células gravadas.
+    """
+    inversor_ids = list(inversor_ids)
+    if not inversor_ids:
+        return 0
+    # As marcas são lidas antes das medições: o que for confirmado durante o cálculo fica marcado como mais novo
+    marcas = get_marcas(db, dia_inicio, dia_fim)
+    linhas = consultar_medicoes(
+        db, list(_COLUNAS_AGREGADOS), "dia", "inversor", inversor_ids,
+        datetime.combine(dia_inicio, datetime.min.time()),
+        datetime.combine(dia_fim, datetime.max.time())
+    )
+    calculadas = {(linha["inversor_id"], linha["periodo"].date()): linha for linha in linhas}
+    if celulas is None:
+        # Recalculo completo do intervalo: células sem medições deixam de existir
+        for modelo in (AgregadoDiario, SketchDiario):
+            db.query(modelo).filter(
+                modelo.inversor_id.in_(inversor_ids),
+                modelo.dia >= dia_inicio,
+                modelo.dia <= dia_fim
+            ).delete(synchronize_session=False)
+        celulas = set(calculadas)
+
+    valores = []
+    for inversor_id, dia in sorted(celulas):
+        linha = calculadas.get((inversor_id, dia), {})
+        valor = {"inversor_id": inversor_id, "dia": dia, "marca_em": marcas.get((inversor_id, dia))}
+        for metrica, coluna in _COLUNAS_AGREGADOS.items():
+            padrao = 0 if metrica in _METRICAS_INTEIRAS or metrica == "geracao" else None
+            valor[coluna] = padrao if linha.get(metrica) is None else linha[metrica]
+        valores.append(valor)
+    if not valores:
+        return 0
+
+    tabela = AgregadoDiario.__table__
+    for inicio in range(0, len(valores), 5000):
+        stmt = insert(AgregadoDiario).values(valores[inicio:inicio + 5000])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[AgregadoDiario.inversor_id, AgregadoDiario.dia],
+            set_={coluna: stmt.excluded[coluna] for coluna in list(_COLUNAS_AGREGADOS.values()) + ["marca_em"]},
+            # Não substitui uma célula calculada com uma marca mais nova
+            where=(tabela.c.marca_em.is_(None)) | (stmt.excluded.marca_em >= tabela.c.marca_em)
+        )
+        db.execute(stmt)
+    _gravar_sketches(db, inversor_ids, dia_inicio, dia_fim, celulas, marcas)
+    return len(valores)
+
+# Variáveis resumidas em sketches_diarios
+VARIAVEIS_SKETCH = ["potencia_ativa", "temperatura"]
+# Compressão dos t-digests: cerca de metade disso em centroides por célula
+SKETCH_COMPRESSAO = int(os.getenv("SKETCH_COMPRESSAO", "200"))
+
+_SQL_VALORES_DIARIOS = """
+    SELECT inversor_id, timestamp::date AS dia,
+           array_agg(potencia_ativa) FILTER (WHERE potencia_ativa IS NOT NULL) AS potencia_ativa,
+           array_agg(temperatura) FILTER (WHERE temperatura IS NOT NULL) AS temperatura
+    FROM medicoes
+    WHERE inversor_id IN :inversor_ids
+      AND timestamp >= :data_inicio AND timestamp <= :data_fim
+    GROUP BY inversor_id, timestamp::date
+"""
+
+def _gravar_sketches(db, inversor_ids, dia_inicio, dia_fim, celulas, marcas):
+    """Calcula os t-digests das células a partir dos valores brutos de cada dia. Não faz commit"""
+    linhas = _executar(db, _SQL_VALORES_DIARIOS, {
+        "inversor_ids": list(inversor_ids),
+        "data_inicio": datetime.combine(dia_inicio, datetime.min.time()),
+        "data_fim": datetime.combine(dia_fim, datetime.max.time()),
+    })
+    valores_dia = {(linha["inversor_id"], linha["dia"]): linha for linha in linhas}
+    valores = []
+    for inversor_id, dia in sorted(celulas):
+        linha = valores_dia.get((inversor_id, dia), {})
+        valor = {"inversor_id": inversor_id, "dia": dia, "marca_em": marcas.get((inversor_id, dia))}
+        for variavel in VARIAVEIS_SKETCH:
+            dados = linha.get(variavel)
+            valor[variavel] = TDigest.from_values(dados, SKETCH_COMPRESSAO).to_bytes() if dados else None
+        valores.append(valor)
+    tabela = SketchDiario.__table__
+    for inicio in range(0, len(valores), 1000):
+        stmt = insert(SketchDiario).values(valores[inicio:inicio + 1000])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[SketchDiario.inversor_id, SketchDiario.dia],
+            set_={coluna: stmt.excluded[coluna] for coluna in VARIAVEIS_SKETCH + ["marca_em"]},
+            where=(tabela.c.marca_em.is_(None)) | (stmt.excluded.marca_em >= tabela.c.marca_em)
+        )
+        db.execute(stmt)
+
+_SQL_CELULAS_DESATUALIZADAS = """
+    SELECT m.inversor_id, m.dia
+    FROM marcas_ingestao m
+    LEFT JOIN agregados_diarios a ON a.inversor_id = m.inversor_id AND a.dia = m.dia
+    WHERE m.inversor_id IN :inversor_ids
+      AND m.dia >= :dia_inicio AND m.dia <= :dia_fim
+      AND (a.marca_em IS NULL OR a.marca_em < m.atualizado_em)
+    UNION
+    -- Células calculadas antes de existirem os sketches
+    SELECT a.inversor_id, a.dia
+    FROM agregados_diarios a
+    LEFT JOIN sketches_diarios s ON s.inversor_id = a.inversor_id AND s.dia = a.dia
+    WHERE a.inversor_id IN :inversor_ids
+      AND a.dia >= :dia_inicio AND a.dia <= :dia_fim
+      AND a.quantidade_medicoes > 0 AND s.inversor_id IS NULL
+"""
+
+# Dias recalculados por vez em atualizar_agregados_diarios: cada bloco lê as medições
+# (e os valores brutos dos sketches) de no máximo inversores x AGREGADOS_DIAS_POR_BLOCO
+AGREGADOS_DIAS_POR_BLOCO = int(os.getenv("AGREGADOS_DIAS_POR_BLOCO", "31"))
+
+def _celulas_desatualizadas(db, inversor_ids, dia_inicio, dia_fim):
+    return {
+        (linha["inversor_id"], linha["dia"])
+        for linha in _executar(db, _SQL_CELULAS_DESATUALIZADAS, {
+            "inversor_ids": list(inversor_ids), "dia_inicio": dia_inicio, "dia_fim": dia_fim
+        })
+    }
+
+def contar_celulas_desatualizadas(db, inversor_ids, dia_inicio, dia_fim):
+    """Quantidade de células (inversor, dia) que atualizar_agregados_diarios recalcularia"""
+    if not inversor_ids:
+        return 0
+    return _executar(db, f"SELECT COUNT(*) AS quantidade FROM ({_SQL_CELULAS_DESATUALIZADAS}) desatualizadas", {
+        "inversor_ids": list(inversor_ids), "dia_inicio": dia_inicio, "dia_fim": dia_fim
+    })[0]["quantidade"]
+
+def atualizar_agregados_diarios(db, inversor_ids, dia_inicio, dia_fim):
+    """
+    Recalcula as células de agregados_diarios (e seus sketches) cuja marca de ingestão
+    é mais nova que o cálculo guardado (ou que ainda não foram calculadas), em blocos de
+    até AGREGADOS_DIAS_POR_BLOCO dias a partir de cada célula desatualizada, com commit
+    a cada bloco. Retorna a quantidade de células recalculadas.
+    """
+    desatualizadas = sorted(_celulas_desatualizadas(db, inversor_ids, dia_inicio, dia_fim), key=lambda c: (c[1], c[0]))
+    gravadas = 0
+    while desatualizadas:
+        # Blocos começam na próxima célula desatualizada: células esparsas não arrastam os dias entre elas
+        bloco_inicio = desatualizadas[0][1]
+        bloco_fim = bloco_inicio + timedelta(days=AGREGADOS_DIAS_POR_BLOCO - 1)
+        bloco = [celula for celula in desatualizadas if celula[1] <= bloco_fim]
+        desatualizadas = desatualizadas[len(bloco):]
+        gravadas += recalcular_agregados_diarios(
+            db, sorted({inversor_id for inversor_id, _ in bloco}), bloco_inicio, bloco[-1][1], set(bloco)
+        )
+        db.commit()
+        print(f"agregados_diarios: {len(bloco)} células recalculadas entre {bloco_inicio} e {bloco[-1][1]}")
+    return gravadas
+
+def recalcular_agregados_em_blocos(db, inversor_ids, dia_inicio, dia_fim, dias_por_bloco=None):
+    """
+    Recálculo completo de agregados_diarios entre dia_inicio e dia_fim, em blocos de
+    dias_por_bloco dias (padrão AGREGADOS_DIAS_POR_BLOCO) com commit a cada bloco.
+    Retorna a quantidade de células gravadas.
+    """
+    dias_por_bloco = dias_por_bloco or AGREGADOS_DIAS_POR_BLOCO
+    total = 0
+    bloco_inicio = dia_inicio
+    while bloco_inicio <= dia_fim:
+        bloco_fim = min(bloco_inicio + timedelta(days=dias_por_bloco - 1), dia_fim)
+        total += recalcular_agregados_diarios(db, inversor_ids, bloco_inicio, bloco_fim)
+        db.commit()
+        print(f"agregados_diarios: {bloco_inicio} a {bloco_fim}: {total} células até agora")
+        bloco_inicio = bloco_fim + timedelta(days=1)
+    return total
+
+def preencher_agregados_vazios(db):
+    """
+    Medições gravadas antes das marcas de ingestão nunca ficariam desatualizadas, e os
+    dias delas sairiam vazios das consultas: com agregados_diarios vazia e medições no
+    banco, calcula a tabela inteira. Retorna a quantidade de células gravadas.
+    """
+    if db.query(AgregadoDiario.inversor_id).first() is not None:
+        return 0
+    primeira, ultima = db.query(func.min(Medicao.timestamp), func.max(Medicao.timestamp)).one()
+    if primeira is None:
+        return 0
+    print("agregados_diarios vazia: calculando a partir das medições")
+    inversor_ids = [linha.id for linha in db.query(Inversor.id).order_by(Inversor.id).all()]
+    return recalcular_agregados_em_blocos(db, inversor_ids, primeira.date(), ultima.date())
+
+def pode_usar_agregados(granularidade, data_inicio, data_fim):
+    """agregados_diarios só responde períodos de dias inteiros em granularidade diária ou maior"""
+    return (
+        MOTOR_USA_AGREGADOS
+        and GRANULARIDADES[granularidade][1] >= 86400
+        and data_inicio.time() == time.min
+        and data_fim.time() >= _FIM_DO_DIA
+    )
+
+def resolver_inversores(db, inversor_ids=None, usina_id=None):
+    """Inversores da consulta: a lista informada, os da usina, ou todos"""
+    if inversor_ids:
+        return sorted(set(inversor_ids))
+    consulta = db.query(Inversor.id)
+    if usina_id is not None:
+        consulta = consulta.filter(Inversor.usina_id == usina_id)
+    return [linha.id for linha in consulta.order_by(Inversor.id).all()]
+
+def _formatar_linha(linha, metricas, agrupamento):
+    item = {coluna: linha[coluna] for coluna in AGRUPAMENTOS[agrupamento]}
+    item["periodo"] = linha["periodo"].isoformat()
+    for metrica in metricas:
+        valor = linha[metrica]
+        if valor is not None:
+            valor = int(valor) if metrica in _METRICAS_INTEIRAS else float(valor)
+        item[metrica] = valor
+    return item
+
+def consultar_metricas(db, metricas, data_inicio, data_fim, granularidade="dia", agrupamento="inversor",
+                       inversor_ids=None, usina_id=None):
+    """
+    Calcula as métricas por período e grupo. Retorna um dicionário com a fonte usada
+    ("agregados_diarios" ou "medicoes") e as linhas, ordenadas por grupo e período.
+    """
+    metricas = list(dict.fromkeys(metricas))
+    validar_consulta(metricas, granularidade, agrupamento)
+    inversor_ids = resolver_inversores(db, inversor_ids, usina_id)
+    resultado = {
+        "metricas": metricas,
+        "granularidade": granularidade,
+        "agrupamento": agrupamento,
+        "fonte": "medicoes",
+        "linhas": []
+    }
+    if not inversor_ids or data_fim < data_inicio:
+        return resultado
+
+    if pode_usar_agregados(granularidade, data_inicio, data_fim):
+        dia_inicio, dia_fim = data_inicio.date(), data_fim.date()
+        atualizar_agregados_diarios(db, inversor_ids, dia_inicio, dia_fim)
+        linhas = _executar(db, _sql_agregados(metricas, granularidade, agrupamento), {
+            "inversor_ids": inversor_ids, "dia_inicio": dia_inicio, "dia_fim": dia_fim
+        })
+        resultado["fonte"] = "agregados_diarios"
+    else:
+        linhas = consultar_medicoes(db, metricas, granularidade, agrupamento, inversor_ids, data_inicio, data_fim)
+    resultado["linhas"] = [_formatar_linha(linha, metricas, agrupamento) for linha in linhas]
+    return resultado
+
+def _chave_percentil(percentil):
+    return f"p{percentil:g}"
+
+def consultar_percentis(db, variaveis, percentis, data_inicio, data_fim, agrupamento="inversor",
+                        inversor_ids=None, usina_id=None):
+    """
+    Percentis (0 a 100) da potência e/ou temperatura nos dias entre data_inicio e data_fim,
+    combinando os sketches diários de cada grupo. Os valores são aproximados (t-digest).
+    """
+    variaveis = list(dict.fromkeys(variaveis))
+    desconhecidas = [v for v in variaveis if v not in VARIAVEIS_SKETCH]
+    if not variaveis or desconhecidas:
+        raise ValueError(f"Variáveis inválidas: {desconhecidas or variaveis}. Disponíveis: {VARIAVEIS_SKETCH}")
+    if not percentis or any(not 0 <= p <= 100 for p in percentis):
+        raise ValueError("Percentis devem estar entre 0 e 100")
+    if agrupamento not in AGRUPAMENTOS:
+        raise ValueError(f"Agrupamento desconhecido: {agrupamento}. Disponíveis: {list(AGRUPAMENTOS)}")
+
+    dia_inicio, dia_fim = data_inicio.date(), data_fim.date()
+    resultado = {
+        "variaveis": variaveis,
+        "percentis": list(percentis),
+        "agrupamento": agrupamento,
+        "dia_inicio": dia_inicio.isoformat(),
+        "dia_fim": dia_fim.isoformat(),
+        "linhas": []
+    }
+    inversor_ids = resolver_inversores(db, inversor_ids, usina_id)
+    if not inversor_ids or dia_fim < dia_inicio:
+        return resultado
+    atualizar_agregados_diarios(db, inversor_ids, dia_inicio, dia_fim)
+
+    colunas_grupo = AGRUPAMENTOS[agrupamento]
+    linhas = _executar(db, f"""
+        SELECT {''.join(f'{coluna}, ' for coluna in colunas_grupo)}{', '.join(f's.{v}' for v in variaveis)}
+        FROM sketches_diarios s JOIN inversores i ON i.id = s.inversor_id
+        WHERE s.inversor_id IN :inversor_ids
+          AND s.dia >= :dia_inicio AND s.dia <= :dia_fim
+        ORDER BY {''.join(f'{coluna}, ' for coluna in colunas_grupo)}s.inversor_id, s.dia
+    """, {"inversor_ids": inversor_ids, "dia_inicio": dia_inicio, "dia_fim": dia_fim})
+
+    grupos = {}
+    for linha in linhas:
+        chave = tuple(linha[coluna] for coluna in colunas_grupo)
+        sketches = grupos.setdefault(chave, {variavel: [] for variavel in variaveis})
+        for variavel in variaveis:
+            if linha[variavel] is not None:
+                sketches[variavel].append(TDigest.from_bytes(linha[variavel]))
+
+    quantis = [p / 100 for p in percentis]
+    for chave, sketches in grupos.items():
+        item = dict(zip(colunas_grupo, chave))
+        for variavel in variaveis:
+            digest = TDigest.merge(sketches[variavel], SKETCH_COMPRESSAO)
+            valores = digest.quantile(quantis) if digest.count else [None] * len(quantis)
+            item[variavel] = {
+                "quantidade": int(digest.count),
+                "minimo": digest.min if digest.count else None,
+                "maximo": digest.max if digest.count else None,
+                **{_chave_percentil(p): (None if v is None else float(v)) for p, v in zip(percentis, valores)}
+            }
+        resultado["linhas"].append(item)
+    return resultado
+
+# Métricas comparadas entre dois períodos: expressão sobre agregados_diarios com o filtro do período
+METRICAS_COMPARATIVO = {
+    "geracao": "SUM(geracao) FILTER (WHERE {filtro})",
+    "potencia_maxima": "MAX(potencia_maxima) FILTER (WHERE {filtro})",
+    "temperatura_media": "SUM(soma_temperatura) FILTER (WHERE {filtro}) / NULLIF(SUM(n_temperatura) FILTER (WHERE {filtro}), 0)",
+}
+
+def _comparar(atual, referencia):
+    delta = None if atual is None or referencia is None else atual - referencia
+    variacao = None if delta is None or not referencia else delta / abs(referencia) * 100
+    return {"atual": atual, "referencia": referencia, "delta": delta, "variacao_percentual": variacao}
+
+def consultar_comparativo(db, periodo_atual, periodo_referencia, agrupamento="usina", inversor_ids=None, usina_id=None):
+    """
+    Compara geração, potência máxima e temperatura média entre dois períodos de dias
+    inteiros (cada um uma tupla (dia_inicio, dia_fim)), por grupo. Os dois períodos saem
+    de uma única leitura de agregados_diarios com agregação condicional.
+    """
+    if agrupamento not in AGRUPAMENTOS:
+        raise ValueError(f"Agrupamento desconhecido: {agrupamento}. Disponíveis: {list(AGRUPAMENTOS)}")
+    for dia_inicio, dia_fim in (periodo_atual, periodo_referencia):
+        if dia_fim < dia_inicio:
+            raise ValueError("O fim de cada período deve ser igual ou posterior ao início")
+
+    resultado = {
+        "agrupamento": agrupamento,
+        "periodo_atual": {"dia_inicio": periodo_atual[0].isoformat(), "dia_fim": periodo_atual[1].isoformat()},
+        "periodo_referencia": {"dia_inicio": periodo_referencia[0].isoformat(), "dia_fim": periodo_referencia[1].isoformat()},
+        "linhas": []
+    }
+    inversor_ids = resolver_inversores(db, inversor_ids, usina_id)
+    if not inversor_ids:
+        return resultado
+    for dia_inicio, dia_fim in (periodo_atual, periodo_referencia):
+        atualizar_agregados_diarios(db, inversor_ids, dia_inicio, dia_fim)
+
+    colunas_grupo = AGRUPAMENTOS[agrupamento]
+    filtros = {
+        "atual": "dia BETWEEN :atual_inicio AND :atual_fim",
+        "referencia": "dia BETWEEN :referencia_inicio AND :referencia_fim",
+    }
+    selecao = [
+        f"{expressao.format(filtro=filtro)} AS {metrica}_{periodo}"
+        for metrica, expressao in METRICAS_COMPARATIVO.items()
+        for periodo, filtro in filtros.items()
+    ]
+    selecao += [f"SUM(quantidade_medicoes) FILTER (WHERE {filtro}) AS quantidade_{periodo}" for periodo, filtro in filtros.items()]
+    grupo = "".join(f"{coluna}, " for coluna in colunas_grupo)
+    linhas = _executar(db, f"""
+        SELECT {grupo}{', '.join(selecao)}
+        FROM agregados_diarios a JOIN inversores i ON i.id = a.inversor_id
+        WHERE a.inversor_id IN :inversor_ids
+          AND ({filtros['atual']} OR {filtros['referencia']})
+        GROUP BY {grupo.rstrip(', ') or '()'}
+        ORDER BY {grupo.rstrip(', ') or '1'}
+    """, {
+        "inversor_ids": inversor_ids,
+        "atual_inicio": periodo_atual[0], "atual_fim": periodo_atual[1],
+        "referencia_inicio": periodo_referencia[0], "referencia_fim": periodo_referencia[1],
+    })
+
+    for linha in linhas:
+        item = {coluna: linha[coluna] for coluna in colunas_grupo}
+        for metrica in METRICAS_COMPARATIVO:
+            valores = [linha[f"{metrica}_{periodo}"] for periodo in filtros]
+            item[metrica] = _comparar(*[None if v is None else float(v) for v in valores])
+        item["quantidade_medicoes"] = {periodo: int(linha[f"quantidade_{periodo}"] or 0) for periodo in filtros}
+        resultado["linhas"].append(item)
+    return resultado
+
+# Calendários aceitos em consultar_janelas -> frequência de período do pandas
+CALENDARIOS = {
+    "dia": "D",
+    "semana": "W-SUN",
+    "mes": "M",
+    "trimestre": "Q",
+    "ano": "Y",
+}
+# Quantidade máxima de janelas em um relatório
+JANELAS_MAX = int(os.getenv("JANELAS_MAX", "1000"))
+
+def expandir_calendario(calendario, dia_inicio, dia_fim):
+    """
+    Janelas (dia_inicio, dia_fim) de cada unidade do calendário entre os dois dias,
+    cortadas nas pontas. Ex.: ("mes", 2025-01-01, 2025-12-31) são os 12 meses de 2025.
+    """
+    if calendario not in CALENDARIOS:
+        raise ValueError(f"Calendário desconhecido: {calendario}. Disponíveis: {list(CALENDARIOS)}")
+    if dia_fim < dia_inicio:
+        raise ValueError("O fim do calendário deve ser igual ou posterior ao início")
+    periodos = pd.period_range(dia_inicio, dia_fim, freq=CALENDARIOS[calendario])
+    return [
+        (max(periodo.start_time.date(), dia_inicio), min(periodo.end_time.date(), dia_fim))
+        for periodo in periodos
+    ]
+
+def consultar_janelas(db, janelas, metricas=("geracao",), agrupamento="usina", inversor_ids=None, usina_id=None):
+    """
+    Métricas de vários períodos de dias inteiros (janelas, tuplas (dia_inicio, dia_fim),
+    que podem se sobrepor) por grupo, em uma única consulta sobre agregados_diarios
+    juntada à lista de janelas. Retorna uma matriz janela × entidade por métrica.
+    """
+    metricas = list(dict.fromkeys(metricas))
+    validar_consulta(metricas, "dia", agrupamento)
+    if not janelas:
+        raise ValueError("Informe ao menos uma janela")
+    if len(janelas) > JANELAS_MAX:
+        raise ValueError(f"No máximo {JANELAS_MAX} janelas por relatório")
+    if any(dia_fim < dia_inicio for dia_inicio, dia_fim in janelas):
+        raise ValueError("O fim de cada janela deve ser igual ou posterior ao início")
+
+    colunas_grupo = AGRUPAMENTOS[agrupamento]
+    resultado = {
+        "metricas": metricas,
+        "agrupamento": agrupamento,
+        "janelas": [{"dia_inicio": inicio.isoformat(), "dia_fim": fim.isoformat()} for inicio, fim in janelas],
+        "entidades": [],
+        "valores": {metrica: [] for metrica in metricas}
+    }
+    inversor_ids = resolver_inversores(db, inversor_ids, usina_id)
+    if not inversor_ids:
+        return resultado
+    atualizar_agregados_diarios(db, inversor_ids, min(j[0] for j in janelas), max(j[1] for j in janelas))
+
+    grupo = "".join(f"{coluna}, " for coluna in colunas_grupo)
+    selecao = [f"{METRICAS[m][1]} AS {m}" for m in metricas]
+    linhas = _executar(db, f"""
+        WITH janelas AS (
+            SELECT indice, inicio, fim
+            FROM unnest(CAST(:inicios AS date[]), CAST(:fins AS date[])) WITH ORDINALITY AS j(inicio, fim, indice)
+        )
+        SELECT {grupo}j.indice, {', '.join(selecao)}
+        FROM janelas j
+        JOIN agregados_diarios a ON a.dia BETWEEN j.inicio AND j.fim
+        JOIN inversores i ON i.id = a.inversor_id
+        WHERE a.inversor_id IN :inversor_ids
+        GROUP BY {grupo}j.indice
+    """, {
+        "inversor_ids": inversor_ids,
+        "inicios": [inicio for inicio, _ in janelas],
+        "fins": [fim for _, fim in janelas],
+    })
+
+    # Entidades na ordem do agrupamento; a frota é uma única entidade
+    if agrupamento == "frota":
+        chaves = [()]
+    else:
+        chaves = sorted({tuple(linha[coluna] for coluna in colunas_grupo) for linha in linhas})
+    posicao = {chave: i for i, chave in enumerate(chaves)}
+    resultado["entidades"] = [dict(zip(colunas_grupo, chave)) for chave in chaves]
+    for metrica in metricas:
+        vazio = 0 if metrica in ("geracao", "quantidade_medicoes") else None
+        resultado["valores"][metrica] = [[vazio] * len(chaves) for _ in janelas]
+    for linha in linhas:
+        i, j = linha["indice"] - 1, posicao[tuple(linha[coluna] for coluna in colunas_grupo)]
+        for metrica in metricas:
+            valor = linha[metrica]
+            if valor is not None:
+                valor = int(valor) if metrica in _METRICAS_INTEIRAS else float(valor)
+            resultado["valores"][metrica][i][j] = valor
+    return resultado
+
+# Quantidade máxima de dias em um mapa de calor
+MAPA_CALOR_DIAS_MAX = int(os.getenv("MAPA_CALOR_DIAS_MAX", "366"))
+
+def consultar_mapa_calor(db, dia_inicio, dia_fim, metrica="geracao", usina_id=None, inversor_ids=None):
+    """
+    Mapa de calor hora do dia × dia por usina: uma métrica agrupada por usina e hora
+    (date_trunc no banco), devolvida em colunas densas, com None nas horas sem dados.
+    """
+    validar_consulta([metrica], "hora", "usina")
+    if dia_fim < dia_inicio:
+        raise ValueError("O fim do período deve ser igual ou posterior ao início")
+    quantidade_dias = (dia_fim - dia_inicio).days + 1
+    if quantidade_dias > MAPA_CALOR_DIAS_MAX:
+        raise ValueError(f"O mapa de calor aceita no máximo {MAPA_CALOR_DIAS_MAX} dias")
+
+    resultado = {
+        "metrica": metrica,
+        "dias": [(dia_inicio + timedelta(days=i)).isoformat() for i in range(quantidade_dias)],
+        "horas": list(range(24)),
+        "usinas": []
+    }
+    inversor_ids = resolver_inversores(db, inversor_ids, usina_id)
+    if not inversor_ids:
+        return resultado
+    linhas = consultar_medicoes(
+        db, [metrica], "hora", "usina", inversor_ids,
+        datetime.combine(dia_inicio, time.min), datetime.combine(dia_fim, time.max)
+    )
+
+    matrizes = {}
+    for linha in linhas:
+        valores = matrizes.setdefault(linha["usina_id"], [[None] * 24 for _ in range(quantidade_dias)])
+        if linha[metrica] is not None:
+            valor = linha[metrica]
+            valores[(linha["periodo"].date() - dia_inicio).days][linha["periodo"].hour] = (
+                int(valor) if metrica in _METRICAS_INTEIRAS else float(valor)
+            )
+    resultado["usinas"] = [{"usina_id": usina, "valores": matrizes[usina]} for usina in sorted(matrizes)]
+    return resultado
+
+# Nível de confiança dos intervalos das consultas aproximadas (z da normal)
+APROXIMADO_Z = 1.96
+_PAR_VALIDO = "p0 >= 0 AND potencia_ativa >= 0 AND horas > 0 AND horas <= 24"
+
+def _sql_amostra(granularidade, agrupamento):
+    """
+    Somas da amostra por grupo, período e página de medicoes (a unidade sorteada).
+    A energia e a duração vêm dos pares de medições consecutivas de um inversor dentro
+    da mesma página, com as regras de utils.integrate_generation.
+    """
+    colunas_grupo = "".join(f"{coluna}, " for coluna in AGRUPAMENTOS[agrupamento])
+    return f"""
+        WITH amostra AS (
+            SELECT m.inversor_id, i.usina_id, m.timestamp, m.potencia_ativa, m.temperatura,
+                   (m.ctid::text::point)[0] AS pagina
+            FROM medicoes m TABLESAMPLE SYSTEM (:percentual)
+            JOIN inversores i ON i.id = m.inversor_id
+            WHERE m.inversor_id IN :inversor_ids
+              AND m.timestamp >= :data_inicio AND m.timestamp <= :data_fim
+        ), pares AS (
+            SELECT *,
+                   LAG(timestamp) OVER w AS t0, LAG(potencia_ativa) OVER w AS p0,
+                   EXTRACT(EPOCH FROM timestamp - LAG(timestamp) OVER w)::float8 / 3600 AS horas
+            FROM amostra
+            WINDOW w AS (PARTITION BY inversor_id, pagina ORDER BY timestamp)
+        )
+        SELECT {colunas_grupo}{_periodo('timestamp', granularidade)} AS periodo, pagina,
+               COUNT(*) AS quantidade,
+               COUNT(potencia_ativa) AS n_potencia, SUM(potencia_ativa) AS soma_potencia,
+               MAX(potencia_ativa) AS potencia_maxima, MIN(potencia_ativa) AS potencia_minima,
+               COUNT(temperatura) AS n_temperatura, SUM(temperatura) AS soma_temperatura,
+               SUM((p0 + potencia_ativa) / 2 * horas) FILTER (WHERE {_PAR_VALIDO}) AS energia,
+               SUM(horas) FILTER (WHERE {_PAR_VALIDO}) AS duracao
+        FROM pares
+        GROUP BY {colunas_grupo}periodo, pagina
+    """
+
+def _fim_do_periodo(inicio, granularidade):
+    if granularidade == "mes":
+        return (inicio.replace(day=1) + timedelta(days=32)).replace(day=1)
+    if granularidade == "semana":
+        return inicio + timedelta(days=7)
+    return inicio + timedelta(seconds=GRANULARIDADES[granularidade][1])
+
+def _total_estimado(valores, fracao):
+    """Total da população a partir das páginas sorteadas e a metade do intervalo de confiança"""
+    return valores.sum() / fracao, APROXIMADO_Z * ((1 - fracao) * np.sum(valores ** 2)) ** 0.5 / fracao
+
+def _media_estimada(somas, quantidades, fracao):
+    """Média (estimador de razão entre páginas) e a metade do intervalo; sem erro com menos de 2 páginas"""
+    total = quantidades.sum()
+    if not total:
+        return None, None
+    media = somas.sum() / total
+    if np.count_nonzero(quantidades) < 2:
+        return media, None
+    residuos = somas - media * quantidades
+    return media, APROXIMADO_Z * ((1 - fracao) * np.sum(residuos ** 2)) ** 0.5 / total
+
+def consultar_metricas_aproximadas(db, metricas, data_inicio, data_fim, granularidade="dia", agrupamento="inversor",
+                                   inversor_ids=None, usina_id=None, percentual=1.0):
+    """
+    Versão rápida de consultar_metricas para períodos longos. Quando agregados_diarios
+    responde a consulta, o resultado é exato. Caso contrário as métricas são estimadas
+    sobre percentual% das páginas de medicoes (TABLESAMPLE SYSTEM) e cada linha traz em
+    "erro" a metade do intervalo de 95% de cada métrica: None quando não há limite
+    (máximo e mínimo da amostra só limitam o valor real por dentro) ou quando a amostra
+    do período tem menos de duas páginas.
+
+    Como a amostra é de páginas, e não de linhas, a variância é calculada entre páginas.
+    A geração é estimada como potência média no tempo (energia sobre duração dos pares
+    de medições de cada página) × duração do período × inversores do grupo, o que supõe
+    que todos os inversores têm medições no período inteiro; o intervalo cobre só o erro
+    da amostra.
+    """
+    metricas = list(dict.fromkeys(metricas))
+    validar_consulta(metricas, granularidade, agrupamento)
+    if not 0 < percentual <= 100:
+        raise ValueError("O percentual da amostra deve estar entre 0 e 100")
+
+    if pode_usar_agregados(granularidade, data_inicio, data_fim):
+        resultado = consultar_metricas(db, metricas, data_inicio, data_fim, granularidade, agrupamento, inversor_ids, usina_id)
+        for linha in resultado["linhas"]:
+            linha["erro"] = {metrica: 0.0 for metrica in metricas}
+        resultado["aproximado"] = False
+        return resultado
+
+    resultado = {
+        "metricas": metricas,
+        "granularidade": granularidade,
+        "agrupamento": agrupamento,
+        "fonte": "amostra",
+        "aproximado": True,
+        "amostra_percentual": percentual,
+        "confianca": 0.95,
+        "linhas": []
+    }
+    inversor_ids = resolver_inversores(db, inversor_ids, usina_id)
+    if not inversor_ids or data_fim < data_inicio:
+        return resultado
+    linhas = _executar(db, _sql_amostra(granularidade, agrupamento), {
+        "inversor_ids": inversor_ids,
+        "percentual": percentual,
+        "data_inicio": data_inicio,
+        "data_fim": data_fim,
+    })
+    colunas_grupo = AGRUPAMENTOS[agrupamento]
+    # Inversores de cada grupo, para levar a potência média à geração do grupo
+    inversores_grupo = {
+        tuple(linha[coluna] for coluna in colunas_grupo): linha["quantidade"]
+        for linha in _executar(db, f"""
+            SELECT {''.join(f'{coluna}, ' for coluna in colunas_grupo)}COUNT(*) AS quantidade
+            FROM (SELECT id AS inversor_id, usina_id FROM inversores WHERE id IN :inversor_ids) i
+            GROUP BY {', '.join(colunas_grupo) or '()'}
+        """, {"inversor_ids": inversor_ids})
+    }
+
+    celulas = {}
+    for linha in linhas:
+        chave = (tuple(linha[coluna] for coluna in colunas_grupo), linha["periodo"])
+        celulas.setdefault(chave, []).append(linha)
+
+    fracao = percentual / 100
+    fim_corte = _fim_exclusivo(data_fim)
+    for (grupo, periodo), paginas in sorted(celulas.items()):
+        coluna = lambda nome: np.array([float(pagina[nome] or 0) for pagina in paginas])
+        n_potencia, soma_potencia = coluna("n_potencia"), coluna("soma_potencia")
+        # Potência média ponderada pelo tempo, a partir da energia dos pares da amostra
+        potencia_no_tempo, erro_no_tempo = _media_estimada(coluna("energia"), coluna("duracao"), fracao)
+        horas = (min(_fim_do_periodo(periodo, granularidade), fim_corte) - max(periodo, data_inicio)).total_seconds() / 3600
+        horas_grupo = horas * inversores_grupo.get(grupo, 0)
+        maximos = [pagina["potencia_maxima"] for pagina in paginas if pagina["potencia_maxima"] is not None]
+        minimos = [pagina["potencia_minima"] for pagina in paginas if pagina["potencia_minima"] is not None]
+        estimativas = {
+            "quantidade_medicoes": _total_estimado(coluna("quantidade"), fracao),
+            "potencia_soma": _total_estimado(soma_potencia, fracao),
+            "potencia_media": _media_estimada(soma_potencia, n_potencia, fracao),
+            "temperatura_media": _media_estimada(coluna("soma_temperatura"), coluna("n_temperatura"), fracao),
+            "potencia_maxima": (max(maximos) if maximos else None, None),
+            "potencia_minima": (min(minimos) if minimos else None, None),
+            "geracao": (
+                None if potencia_no_tempo is None else potencia_no_tempo * horas_grupo,
+                None if erro_no_tempo is None else erro_no_tempo * horas_grupo
+            ),
+        }
+        item = dict(zip(colunas_grupo, grupo))
+        item["periodo"] = periodo.isoformat()
+        item["erro"] = {}
+        for metrica in metricas:
+            valor, erro = estimativas[metrica]
+            item[metrica] = None if valor is None else float(valor)
+            item["erro"][metrica] = None if erro is None else float(erro)
+        resultado["linhas"].append(item)
+    return resultado
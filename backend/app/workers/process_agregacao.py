@@ -1,23 +1,50 @@
-from app.core.database import SessionLocal
-from sqlalchemy import func, and_
+from app.core.database import SessionLocal, engine
+from sqlalchemy import func, and_, text, bindparam, select
 from app.models import Medicao, Inversor, Usina
-from datetime import datetime, timedelta
-from utils import calc_inverters_generation, TimeSeriesValue
+from datetime import date, datetime, timedelta
+from app.crud.marca_ingestao import get_marcas
+from app.crud.versao import versao_consulta
+from app.workers.cache_resultados import buscar_no_cache, chave_cache, registrar_no_cache
+from app.workers.motor_agregacao import (
+    atualizar_agregados_diarios, consultar_metricas, contar_celulas_desatualizadas, pode_usar_agregados, resolver_inversores
+)
+from utils import (
+    GAP_POLICIES, ArrayTimeSeries, DailyGenerationAccumulator, GenerationAccumulator, GenerationQualityAccumulator
+)
+from itertools import groupby
+from concurrent.futures import ProcessPoolExecutor
+import math
 import os
 import json
 import glob
+import hashlib
+import shutil
+import pandas as pd
 from typing import Optional, List, Dict, Any, Union
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 RESULTS_DIR = os.path.join(BASE_DIR, 'results_analises')
 os.makedirs(RESULTS_DIR, exist_ok=True)
 
+def criar_arquivo_resultado(tipo, modo='x'):
+    """
+    Cria um arquivo novo {tipo}_{AAAAMMDD_HHMMSS}.json em results_analises e devolve (nome, arquivo aberto).
+    Nunca sobrescreve (o cache e o estado do dashboard apontam para o arquivo de cada
+    resultado): se o nome já existe, tenta o segundo seguinte.
+    """
+    momento = datetime.now()
+    while True:
+        nome = f"{tipo}_{momento.strftime('%Y%m%d_%H%M%S')}.json"
+        try:
+            return nome, open(os.path.join(RESULTS_DIR, nome), modo, encoding=None if 'b' in modo else 'utf-8')
+        except FileExistsError:
+            momento += timedelta(seconds=1)
+
 def salvar_resultado(tipo, parametros, resultado):
-    nome = f"{tipo}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    caminho = os.path.join(RESULTS_DIR, nome)
-    with open(caminho, 'w', encoding='utf-8') as f:
+    nome, f = criar_arquivo_resultado(tipo)
+    with f:
         json.dump({"tipo": tipo, "parametros": parametros, "resultado": resultado}, f, ensure_ascii=False, indent=2)
-    print(f"Arquivo de análise salvo em: {caminho}")
+    print(f"Arquivo de análise salvo em: {f.name}")
     return nome
 
 def listar_resultados_analises(tipo: Optional[str] = None, usina_id: Optional[int] = None, 
@@ -40,7 +67,8 @@ def listar_resultados_analises(tipo: Optional[str] = None, usina_id: Optional[in
             if usina_id and parametros.get("usina_id") != usina_id:
                 continue
                 
-            if inversor_id and parametros.get("inversor_id") != inversor_id:
+            if inversor_id and parametros.get("inversor_id") != inversor_id \
+                    and inversor_id not in (parametros.get("inversor_ids") or []):
                 continue
                 
             # Adicionar nome do arquivo ao resultado
@@ -57,10 +85,20 @@ def listar_resultados_analises(tipo: Optional[str] = None, usina_id: Optional[in
     resultados.sort(key=lambda x: x["data_analise"], reverse=True)
     return resultados
 
+def obter_caminho_resultado(nome_arquivo: str) -> Optional[str]:
+    """Retorna o caminho de uma análise salva, ou None se o arquivo não existir"""
+    # Impede que o nome informado aponte para fora da pasta de resultados
+    if os.path.basename(nome_arquivo) != nome_arquivo:
+        return None
+    caminho = os.path.join(RESULTS_DIR, nome_arquivo)
+    if os.path.isfile(caminho):
+        return caminho
+    return None
+
 def obter_resultado_analise(nome_arquivo: str) -> Optional[Dict[str, Any]]:
     """Obtém o conteúdo de uma análise específica por nome de arquivo"""
-    caminho = os.path.join(RESULTS_DIR, nome_arquivo)
-    if os.path.exists(caminho):
+    caminho = obter_caminho_resultado(nome_arquivo)
+    if caminho:
         try:
             with open(caminho, 'r', encoding='utf-8') as f:
                 return json.load(f)
@@ -69,523 +107,898 @@ def obter_resultado_analise(nome_arquivo: str) -> Optional[Dict[str, Any]]:
             return None
     return None
 
-def calcular_serie_temporal_geracao(db, inversor_id, data_inicio, data_fim):
+def consultar_medicoes_potencia(db, inversor_ids, data_inicio, data_fim, tamanho_lote=None):
     """
-    Calcula a geração diária de um inversor para o período especificado.
-    Retorna uma lista de dicionários com dia e geração.
+    Medições de potência dos inversores no período, ordenadas por inversor e timestamp,
+    lidas em lotes de tamanho_lote linhas por um cursor no servidor: só um lote fica em memória.
+    Retorna um iterador de lotes.
     """
-    # Primeira abordagem: calcular a geração dia a dia
-    data_atual = data_inicio.date()
-    data_fim_date = data_fim.date()
-    serie_temporal = []
-    
-    while data_atual <= data_fim_date:
-        # Calcular início e fim do dia
-        dia_inicio = datetime.combine(data_atual, datetime.min.time())
-        dia_fim = datetime.combine(data_atual, datetime.max.time())
-        
-        # Buscar medições do dia
-        medicoes = db.query(Medicao).filter(
-            Medicao.inversor_id == inversor_id,
-            Medicao.timestamp >= dia_inicio,
-            Medicao.timestamp <= dia_fim
-        ).order_by(Medicao.timestamp).all()
-        
-        # Calcular geração do dia
-        power = [TimeSeriesValue(value=m.potencia_ativa, date=m.timestamp) for m in medicoes if m.potencia_ativa is not None]
-        
-        if power:
-            entity = type('Entity', (), {'power': power})()
-            geracao_dia = calc_inverters_generation([entity])
-            
-            # Adicionar à série temporal
-            serie_temporal.append({
-                "dia": data_atual.isoformat(),
-                "geracao": geracao_dia
-            })
-        
-        # Avançar para o próximo dia
-        data_atual += timedelta(days=1)
-    
-    return serie_temporal
+    consulta = select(Medicao.inversor_id, Medicao.timestamp, Medicao.potencia_ativa).where(
+        Medicao.inversor_id.in_(list(inversor_ids)),
+        Medicao.potencia_ativa.isnot(None),
+        Medicao.timestamp >= data_inicio,
+        Medicao.timestamp <= data_fim
+    ).order_by(Medicao.inversor_id, Medicao.timestamp, Medicao.id)
+    resultado = db.execute(consulta, execution_options={
+        "stream_results": True,
+        "yield_per": tamanho_lote or GERACAO_TAMANHO_LOTE
+    })
+    return resultado.partitions()
+
+def integrar_lotes(lotes, tipo_acumulador):
+    """Alimenta um acumulador por inversor com os lotes de consultar_medicoes_potencia"""
+    acumuladores = {}
+    for lote in lotes:
+        for inversor_id, linhas in groupby(lote, key=lambda r: r.inversor_id):
+            linhas = list(linhas)
+            acumulador = acumuladores.setdefault(inversor_id, tipo_acumulador())
+            acumulador.add(ArrayTimeSeries.from_arrays(
+                [r.timestamp for r in linhas], [r.potencia_ativa for r in linhas]
+            ))
+    return acumuladores
+
+# Onde a integração da geração é feita: "sql" (no PostgreSQL) ou "python" (numpy sobre as medições)
+GERACAO_MODO = os.getenv("GERACAO_MODO", "sql")
+# Quantidade de medições lidas do banco por vez quando a integração é feita em Python
+GERACAO_TAMANHO_LOTE = int(os.getenv("GERACAO_TAMANHO_LOTE", "50000"))
+
+# Pares de medições consecutivas de cada inversor, com as mesmas regras de utils.integrate_generation:
+# potências negativas, intervalos não positivos e lacunas acima de 24h não entram na integração.
+_SQL_PARES_GERACAO = """
+    WITH pares AS (
+        SELECT inversor_id,
+               LAG(timestamp) OVER w AS t0, timestamp AS t1,
+               LAG(potencia_ativa) OVER w AS p0, potencia_ativa AS p1
+        FROM medicoes
+        WHERE inversor_id IN :inversor_ids
+          AND potencia_ativa IS NOT NULL
+          AND timestamp >= :data_inicio AND timestamp <= :data_fim
+        WINDOW w AS (PARTITION BY inversor_id ORDER BY timestamp, id)
+    ), validos AS (
+        SELECT * FROM pares
+        WHERE p0 >= 0 AND p1 >= 0 AND t1 > t0 AND t1 - t0 <= INTERVAL '24 hours'
+    )
+"""
+
+_SQL_GERACAO_POR_INVERSOR = _SQL_PARES_GERACAO + """
+    SELECT inversor_id,
+           SUM((p0 + p1) / 2 * EXTRACT(EPOCH FROM t1 - t0)::float8 / 3600) AS geracao
+    FROM validos
+    GROUP BY inversor_id
+"""
+
+# Intervalos que cruzam a meia-noite são divididos nela: a potência no corte é interpolada
+# linearmente e cada parte vai para o seu dia, então a soma dos dias é igual ao total do período.
+# Um intervalo que termina exatamente à meia-noite pertence inteiro ao dia anterior.
+_SQL_GERACAO_POR_DIA = _SQL_PARES_GERACAO + """
+    , cortes AS (
+        SELECT inversor_id, t0, t1, p0, p1, c,
+               p0 + (p1 - p0) * EXTRACT(EPOCH FROM c - t0)::float8 / EXTRACT(EPOCH FROM t1 - t0)::float8 AS pc
+        FROM validos
+        CROSS JOIN LATERAL (SELECT GREATEST(t0, date_trunc('day', t1)) AS c) corte
+    )
+    SELECT inversor_id, dia, SUM(geracao) AS geracao
+    FROM (
+        SELECT inversor_id, partes.dia, partes.geracao
+        FROM cortes
+        CROSS JOIN LATERAL (VALUES
+            (t0::date, (p0 + pc) / 2 * EXTRACT(EPOCH FROM c - t0)::float8 / 3600, c > t0),
+            (c::date, (pc + p1) / 2 * EXTRACT(EPOCH FROM t1 - c)::float8 / 3600, t1 > c)
+        ) AS partes(dia, geracao, nao_vazia)
+        WHERE partes.nao_vazia
+        UNION ALL
+        -- Dias com medição aparecem mesmo sem geração
+        SELECT inversor_id, t1::date, 0.0 FROM pares
+    ) partes
+    GROUP BY inversor_id, dia
+    ORDER BY inversor_id, dia
+"""
 
-def calcular_serie_temporal_potencia_temperatura(db, inversor_id, data_inicio, data_fim):
+def calcular_geracao_sql(db, inversor_ids, data_inicio, data_fim, por_dia=False):
     """
-    Calcula a série temporal de potência máxima e temperatura média por dia para um inversor.
+    Integra a potência no próprio PostgreSQL (regra do trapézio com LAG por inversor).
+    Retorna {inversor_id: geracao} ou, com por_dia=True, {inversor_id: {dia: geracao}}.
+    Inversores sem pares válidos no período não aparecem no resultado.
     """
-    resultado = db.query(
-        func.date(Medicao.timestamp).label('dia'),
-        func.max(Medicao.potencia_ativa).label('potencia_maxima'),
-        func.avg(Medicao.temperatura).label('temperatura_media')
-    ).filter(
-        Medicao.inversor_id == inversor_id,
-        Medicao.timestamp >= data_inicio,
-        Medicao.timestamp <= data_fim
-    ).group_by(func.date(Medicao.timestamp)).all()
-    
-    # Formatar o resultado
-    serie_temporal = []
-    for r in resultado:
-        serie_temporal.append({
-            "dia": r.dia.isoformat(),
-            "potencia_maxima": r.potencia_maxima,
-            "temperatura_media": r.temperatura_media
+    inversor_ids = list(inversor_ids)
+    if not inversor_ids:
+        return {}
+    sql = text(_SQL_GERACAO_POR_DIA if por_dia else _SQL_GERACAO_POR_INVERSOR).bindparams(
+        bindparam("inversor_ids", expanding=True)
+    )
+    linhas = db.execute(sql, {
+        "inversor_ids": inversor_ids,
+        "data_inicio": data_inicio,
+        "data_fim": data_fim
+    }).all()
+    if not por_dia:
+        return {r.inversor_id: r.geracao for r in linhas}
+    resultado = {}
+    for r in linhas:
+        resultado.setdefault(r.inversor_id, {})[r.dia] = r.geracao
+    return resultado
+
+def calcular_series_temporais_geracao(db, inversor_ids, data_inicio, data_fim):
+    """
+    Calcula a geração diária de vários inversores para o período especificado,
+    com uma única leitura ordenada das medições (em vez de uma consulta por dia).
+    O período é estendido para dias inteiros. Intervalos entre medições que cruzam
+    a meia-noite são divididos nela (potência interpolada linearmente no corte).
+    Retorna {inversor_id: [{"dia": "AAAA-MM-DD", "geracao": valor}, ...]} apenas com os dias que têm medições.
+    """
+    inversor_ids = list(inversor_ids)
+    inicio = datetime.combine(data_inicio.date(), datetime.min.time())
+    fim = datetime.combine(data_fim.date(), datetime.max.time())
+    series = {inversor_id: [] for inversor_id in inversor_ids}
+    if not inversor_ids:
+        return series
+
+    if GERACAO_MODO == "sql":
+        for inversor_id, dias in calcular_geracao_sql(db, inversor_ids, inicio, fim, por_dia=True).items():
+            series[inversor_id] = [{"dia": dia.isoformat(), "geracao": geracao} for dia, geracao in dias.items()]
+        return series
+
+    # Só um lote de medições fica em memória; de cada inversor guarda-se a geração de cada dia
+    acumuladores = integrar_lotes(
+        consultar_medicoes_potencia(db, inversor_ids, inicio, fim), DailyGenerationAccumulator
+    )
+    for inversor_id, acumulador in acumuladores.items():
+        series[inversor_id] = [
+            {"dia": dia.isoformat(), "geracao": geracao} for dia, geracao in sorted(acumulador.days.items())
+        ]
+    return series
+
+# Limite de custo (inversores x dias) para responder uma agregação na própria requisição.
+# Acima dele a consulta segue para a fila e é processada pelo worker.
+AGREGACAO_SINCRONA_LIMITE = int(os.getenv("AGREGACAO_SINCRONA_LIMITE", "100"))
+
+def _metrica_diaria_inversores(db, metrica, chave, inversor_ids, data_inicio, data_fim):
+    """Uma métrica do motor de agregação, por dia, para vários inversores com uma única consulta"""
+    resultado = consultar_metricas(db, [metrica], data_inicio, data_fim, "dia", "inversor", inversor_ids=inversor_ids)
+    por_inversor = {inversor_id: [] for inversor_id in inversor_ids}
+    for linha in resultado["linhas"]:
+        por_inversor[linha["inversor_id"]].append({"dia": linha["periodo"][:10], chave: linha[metrica]})
+    return por_inversor
+
+def _secoes_por_inversor(por_inversor):
+    return {"por_inversor": [{"inversor_id": inversor_id, "dias": dias} for inversor_id, dias in por_inversor.items()]}
+
+def calcular_potencia_maxima(db, inversor_id, data_inicio, data_fim):
+    """Potência máxima por dia de um inversor"""
+    return _metrica_diaria_inversores(db, "potencia_maxima", "potencia_maxima", [inversor_id], data_inicio, data_fim)[inversor_id]
+
+def calcular_potencia_maxima_inversores(db, inversor_ids, data_inicio, data_fim):
+    """Potência máxima por dia de vários inversores, uma seção por inversor"""
+    return _secoes_por_inversor(
+        _metrica_diaria_inversores(db, "potencia_maxima", "potencia_maxima", inversor_ids, data_inicio, data_fim)
+    )
+
+def calcular_media_temperatura(db, inversor_id, data_inicio, data_fim):
+    """Média de temperatura por dia de um inversor"""
+    return _metrica_diaria_inversores(db, "temperatura_media", "media_temperatura", [inversor_id], data_inicio, data_fim)[inversor_id]
+
+def calcular_media_temperatura_inversores(db, inversor_ids, data_inicio, data_fim):
+    """Média de temperatura por dia de vários inversores, uma seção por inversor"""
+    return _secoes_por_inversor(
+        _metrica_diaria_inversores(db, "temperatura_media", "media_temperatura", inversor_ids, data_inicio, data_fim)
+    )
+
+def calcular_consulta(db, parametros):
+    """Consulta genérica do motor de agregação (ver app.workers.motor_agregacao)"""
+    return consultar_metricas(
+        db, parametros['metricas'],
+        datetime.fromisoformat(parametros['data_inicio']),
+        datetime.fromisoformat(parametros['data_fim']),
+        parametros.get('granularidade', 'dia'),
+        parametros.get('agrupamento', 'inversor'),
+        inversor_ids=parametros.get('inversor_ids'),
+        usina_id=parametros.get('usina_id')
+    )
+
+def estimar_custo_consulta(db, parametros):
+    """
+    Custo em inversores x dias lidos das medições. Quando a consulta é respondida por
+    agregados_diarios, só as células desatualizadas (recalculadas antes) contam.
+    """
+    data_inicio = datetime.fromisoformat(parametros['data_inicio'])
+    data_fim = datetime.fromisoformat(parametros['data_fim'])
+    inversor_ids = resolver_inversores(db, parametros.get('inversor_ids'), parametros.get('usina_id'))
+    if pode_usar_agregados(parametros.get('granularidade', 'dia'), data_inicio, data_fim):
+        return contar_celulas_desatualizadas(db, inversor_ids, data_inicio.date(), data_fim.date())
+    return len(inversor_ids) * max((data_fim.date() - data_inicio.date()).days + 1, 0)
+
+def integrar_geracao_medicoes(db, inversor_ids, data_inicio, data_fim, tamanho_lote=None):
+    """
+    Integra em Python a geração de vários inversores com uma única consulta ordenada
+    por inversor e timestamp. As medições chegam do banco em lotes (cursor no servidor)
+    e cada inversor guarda apenas o último ponto entre um lote e outro.
+    Retorna {inversor_id: geracao}.
+    """
+    inversor_ids = list(inversor_ids)
+    if not inversor_ids:
+        return {}
+    acumuladores = integrar_lotes(
+        consultar_medicoes_potencia(db, inversor_ids, data_inicio, data_fim, tamanho_lote), GenerationAccumulator
+    )
+    return {inversor_id: acumulador.total for inversor_id, acumulador in acumuladores.items()}
+
+# Fuso das usinas em horas (medições em UTC): posiciona a curva de céu limpo (6h às 18h locais) da política clear_sky
+QUALIDADE_FUSO_HORAS = float(os.getenv("QUALIDADE_FUSO_HORAS", "-3"))
+
+def calcular_qualidade_geracao(db, inversor_ids, data_inicio, data_fim, politica="skip", tamanho_lote=None):
+    """
+    Geração de cada inversor com a qualidade dos dados, na mesma leitura em lotes de
+    integrar_geracao_medicoes: cobertura (fração do tempo entre a primeira e a última
+    medição que entrou na integração), lacunas (trechos que ficaram de fora: intervalos
+    acima de 24h ou com potência negativa) e a energia estimada para as lacunas pela
+    política: skip (nenhuma), linear ou clear_sky (curva de céu limpo).
+    """
+    if politica not in GAP_POLICIES:
+        raise ValueError(f"Política de lacunas desconhecida: {politica}. Disponíveis: {list(GAP_POLICIES)}")
+    inversor_ids = list(inversor_ids)
+    acumuladores = integrar_lotes(
+        consultar_medicoes_potencia(db, inversor_ids, data_inicio, data_fim, tamanho_lote) if inversor_ids else [],
+        lambda: GenerationQualityAccumulator(politica, QUALIDADE_FUSO_HORAS)
+    )
+    por_inversor = []
+    for inversor_id in inversor_ids:
+        qualidade = acumuladores.get(inversor_id, GenerationQualityAccumulator(politica, QUALIDADE_FUSO_HORAS)).result()
+        por_inversor.append({
+            "inversor_id": inversor_id,
+            "geracao": qualidade.energy,
+            "geracao_interpolada": qualidade.interpolated_energy,
+            "geracao_total": qualidade.total_energy,
+            "cobertura": qualidade.coverage,
+            "lacunas": qualidade.gap_count,
+            "horas_em_lacuna": qualidade.gap_hours,
+            "maior_lacuna_horas": qualidade.longest_gap_hours
         })
-    
-    return serie_temporal
+    return {
+        "politica": politica,
+        "geracao": float(sum(item["geracao"] for item in por_inversor)),
+        "geracao_total": float(sum(item["geracao_total"] for item in por_inversor)),
+        "por_inversor": por_inversor
+    }
 
-def processa_potencia_maxima(parametros):
+def calcular_geracao_inversores(db, inversor_ids, data_inicio, data_fim):
+    """
+    Geração de vários inversores no período, com uma única consulta,
+    e o total entre eles.
+    """
+    if GERACAO_MODO == "sql":
+        geracoes = calcular_geracao_sql(db, inversor_ids, data_inicio, data_fim)
+    else:
+        geracoes = integrar_geracao_medicoes(db, inversor_ids, data_inicio, data_fim)
+    por_inversor = [
+        {"inversor_id": inversor_id, "geracao": geracoes.get(inversor_id, 0.0)}
+        for inversor_id in inversor_ids
+    ]
+    return {
+        "geracao_total": float(sum(item["geracao"] for item in por_inversor)),
+        "por_inversor": por_inversor
+    }
+
+def calcular_geracao_usina(db, usina_id, data_inicio, data_fim):
+    """
+    Geração total da usina (soma da geração dos seus inversores) no período,
+    com a geração de cada inversor.
+    """
+    return calcular_geracao_inversores(db, resolver_inversores(db, usina_id=usina_id), data_inicio, data_fim)
+
+def calcular_geracao_inversor(db, inversor_id, data_inicio, data_fim):
+    """Geração total de um inversor no período"""
+    if GERACAO_MODO == "sql":
+        return calcular_geracao_sql(db, [inversor_id], data_inicio, data_fim).get(inversor_id, 0.0)
+    return integrar_geracao_medicoes(db, [inversor_id], data_inicio, data_fim).get(inversor_id, 0.0)
+
+# Funções de cálculo por tipo de agregação, o parâmetro de entidade que cada uma recebe
+# e, quando existe, a versão para vários inversores (inversor_ids ou usina_id)
+CALCULOS_AGREGACAO = {
+    'potencia_maxima': (calcular_potencia_maxima, 'inversor_id', calcular_potencia_maxima_inversores),
+    'media_temperatura': (calcular_media_temperatura, 'inversor_id', calcular_media_temperatura_inversores),
+    'geracao_usina': (calcular_geracao_usina, 'usina_id', None),
+    'geracao_inversor': (calcular_geracao_inversor, 'inversor_id', calcular_geracao_inversores),
+}
+
+def calcular_agregacao(db, tipo, parametros):
+    """
+    Executa uma das agregações obrigatórias a partir dos parâmetros da requisição.
+    Usada tanto pelo worker quanto pelas consultas síncronas da API.
+    """
+    calculo, chave, calculo_inversores = CALCULOS_AGREGACAO[tipo]
+    data_inicio = datetime.fromisoformat(parametros['data_inicio'])
+    data_fim = datetime.fromisoformat(parametros['data_fim'])
+    if parametros.get(chave) is not None or calculo_inversores is None:
+        return calculo(db, parametros[chave], data_inicio, data_fim)
+    # Lote: todos os inversores em uma consulta, com um único resultado dividido por inversor
+    inversor_ids = resolver_inversores(db, parametros.get('inversor_ids'), parametros.get('usina_id'))
+    return calculo_inversores(db, inversor_ids, data_inicio, data_fim)
+
+def estimar_custo_agregacao(db, tipo, parametros):
+    """
+    Estima o custo de uma agregação em inversores x dias do período.
+    É uma conta barata (no máximo uma contagem de inversores) usada para decidir
+    se a consulta pode ser respondida de forma síncrona.
+    """
+    data_inicio = datetime.fromisoformat(parametros['data_inicio'])
+    data_fim = datetime.fromisoformat(parametros['data_fim'])
+    dias = max((data_fim.date() - data_inicio.date()).days + 1, 0)
+    if parametros.get('inversor_ids'):
+        inversores = len(set(parametros['inversor_ids']))
+    elif parametros.get('usina_id') is not None:
+        inversores = db.query(func.count(Inversor.id)).filter(Inversor.usina_id == parametros['usina_id']).scalar()
+    else:
+        inversores = 1
+    return inversores * dias
+
+# Mensagem exibida no log do worker para o resultado de cada tipo de agregação
+MENSAGENS_AGREGACAO = {
+    'potencia_maxima': lambda resultado: f"Potência máxima por dia: {resultado}",
+    'media_temperatura': lambda resultado: f"Média de temperatura por dia: {resultado}",
+    'geracao_usina': lambda resultado: f"Geração total da usina (kWh): {resultado['geracao_total']}",
+    'geracao_inversor': lambda resultado: (
+        f"Geração total dos inversores (kWh): {resultado['geracao_total']}" if isinstance(resultado, dict)
+        else f"Geração total do inversor (kWh): {resultado}"
+    ),
+}
+
+def processa_agregacao(tipo, parametros):
+    """
+    Calcula e salva uma agregação, a menos que o mesmo tipo e parâmetros já tenham
+    sido calculados sem que as medições envolvidas mudassem desde então.
+    Retorna o nome do arquivo com o resultado.
+    """
     db = SessionLocal()
     try:
-        inversor_id = parametros['inversor_id']
-        data_inicio = datetime.fromisoformat(parametros['data_inicio'])
-        data_fim = datetime.fromisoformat(parametros['data_fim'])
-        result = db.query(
-            func.date(Medicao.timestamp).label('dia'),
-            func.max(Medicao.potencia_ativa).label('potencia_maxima')
-        ).filter(
-            Medicao.inversor_id == inversor_id,
-            Medicao.timestamp >= data_inicio,
-            Medicao.timestamp <= data_fim
-        ).group_by(func.date(Medicao.timestamp)).all()
-        print(f"Potência máxima por dia: {result}")
-        salvar_resultado('potencia_maxima', parametros, [dict(dia=str(r.dia), potencia_maxima=r.potencia_maxima) for r in result])
+        # A chave é lida antes do cálculo: medições que chegarem durante ele mudam
+        # a chave, e a próxima solicitação recalcula
+        chave = chave_cache(db, tipo, parametros)
+        nome_arquivo = buscar_no_cache(db, chave)
+        if nome_arquivo:
+            print(f"Resultado de {tipo} reaproveitado do cache: {nome_arquivo}")
+            return nome_arquivo
+        resultado = calcular_agregacao(db, tipo, parametros)
+        print(MENSAGENS_AGREGACAO[tipo](resultado))
+        nome_arquivo = salvar_resultado(tipo, parametros, resultado)
+        registrar_no_cache(db, chave, nome_arquivo)
+        return nome_arquivo
     finally:
         db.close()
 
-def processa_media_temperatura(parametros):
+def processa_consulta(parametros):
     db = SessionLocal()
     try:
-        inversor_id = parametros['inversor_id']
-        data_inicio = datetime.fromisoformat(parametros['data_inicio'])
-        data_fim = datetime.fromisoformat(parametros['data_fim'])
-        result = db.query(
-            func.date(Medicao.timestamp).label('dia'),
-            func.avg(Medicao.temperatura).label('media_temperatura')
-        ).filter(
-            Medicao.inversor_id == inversor_id,
-            Medicao.timestamp >= data_inicio,
-            Medicao.timestamp <= data_fim
-        ).group_by(func.date(Medicao.timestamp)).all()
-        print(f"Média de temperatura por dia: {result}")
-        salvar_resultado('media_temperatura', parametros, [dict(dia=str(r.dia), media_temperatura=r.media_temperatura) for r in result])
+        resultado = calcular_consulta(db, parametros)
+        print(f"Consulta com {len(resultado['linhas'])} linhas (fonte: {resultado['fonte']})")
+        return salvar_resultado('consulta', parametros, resultado)
     finally:
         db.close()
 
-def processa_geracao_usina(parametros):
+def processa_atualizar_agregados(parametros):
+    """
+    Atualiza agregados_diarios nos períodos pedidos ([dia_inicio, dia_fim] em ISO), para que
+    as consultas que só leem os agregados (percentis, comparativo, janelas) voltem a ser imediatas
+    """
     db = SessionLocal()
     try:
-        usina_id = parametros['usina_id']
-        data_inicio = datetime.fromisoformat(parametros['data_inicio'])
-        data_fim = datetime.fromisoformat(parametros['data_fim'])
-        inversores = db.query(Inversor.id).filter(Inversor.usina_id == usina_id).all()
-        inversor_ids = [inv.id for inv in inversores]
-        entities_with_power = []
-        for inversor_id in inversor_ids:
-            medicoes = db.query(Medicao).filter(
-                Medicao.inversor_id == inversor_id,
-                Medicao.timestamp >= data_inicio,
-                Medicao.timestamp <= data_fim
-            ).order_by(Medicao.timestamp).all()
-            power = [TimeSeriesValue(value=m.potencia_ativa, date=m.timestamp) for m in medicoes if m.potencia_ativa is not None]
-            if power:
-                entities_with_power.append(type('Entity', (), {'power': power})())
-        geracao_total = calc_inverters_generation(entities_with_power)
-        print(f"Geração total da usina (kWh): {geracao_total}")
-        salvar_resultado('geracao_usina', parametros, geracao_total)
+        for dia_inicio, dia_fim in parametros['periodos']:
+            atualizar_agregados_diarios(
+                db, parametros['inversor_ids'], date.fromisoformat(dia_inicio), date.fromisoformat(dia_fim)
+            )
     finally:
         db.close()
 
+def processa_potencia_maxima(parametros):
+    return processa_agregacao('potencia_maxima', parametros)
+
+def processa_media_temperatura(parametros):
+    return processa_agregacao('media_temperatura', parametros)
+
+def processa_geracao_usina(parametros):
+    return processa_agregacao('geracao_usina', parametros)
+
 def processa_geracao_inversor(parametros):
-    db = SessionLocal()
-    try:
-        inversor_id = parametros['inversor_id']
-        data_inicio = datetime.fromisoformat(parametros['data_inicio'])
-        data_fim = datetime.fromisoformat(parametros['data_fim'])
-        medicoes = db.query(Medicao).filter(
-            Medicao.inversor_id == inversor_id,
-            Medicao.timestamp >= data_inicio,
-            Medicao.timestamp <= data_fim
-        ).order_by(Medicao.timestamp).all()
-        power = [TimeSeriesValue(value=m.potencia_ativa, date=m.timestamp) for m in medicoes if m.potencia_ativa is not None]
-        entity = type('Entity', (), {'power': power})()
-        geracao_total = calc_inverters_generation([entity])
-        print(f"Geração total do inversor (kWh): {geracao_total}")
-        salvar_resultado('geracao_inversor', parametros, geracao_total)
-    finally:
-        db.close()
+    return processa_agregacao('geracao_inversor', parametros)
 
-def normalizar_serie_temporal(serie_temporal, data_inicio, data_fim, chaves_valores=None):
+def obter_caminho_dash_mais_recente() -> Optional[str]:
     """
-    Normaliza uma série temporal, garantindo que todos os dias no intervalo estejam presentes.
-    Para dias sem dados, os valores são preenchidos com zeros ou valores padrão.
-    
-    Args:
-        serie_temporal: Lista de dicionários com chave 'dia' e outras chaves de valores
-        data_inicio: Data de início no formato string 'YYYY-MM-DD'
-        data_fim: Data de fim no formato string 'YYYY-MM-DD'
-        chaves_valores: Dicionário com chaves e valores padrão para dias sem dados
-        
-    Returns:
-        Lista normalizada de dicionários, um para cada dia no intervalo
+    Obtém o caminho do arquivo do dashboard mais recente
     """
-    # Converter datas para objetos date
-    try:
-        inicio = datetime.fromisoformat(data_inicio).date()
-        fim = datetime.fromisoformat(data_fim).date()
-    except ValueError:
-        # Tenta converter apenas a parte da data
-        inicio = datetime.fromisoformat(data_inicio.split('T')[0]).date()
-        fim = datetime.fromisoformat(data_fim.split('T')[0]).date()
+    # Só dashboards de fato (dash_AAAAMMDD_HHMMSS.json): dash_error_* viria antes na ordenação
+    arquivos = glob.glob(os.path.join(RESULTS_DIR, "dash_[0-9]*.json"))
     
-    # Valores padrão se não fornecidos
-    if chaves_valores is None:
-        chaves_valores = {"geracao": 0, "potencia_maxima": 0, "temperatura_media": 0}
-    
-    # Criar dicionário com os dados existentes indexados por dia
-    dados_por_dia = {}
-    for item in serie_temporal:
-        dia = item.get('dia')
-        # Converter para formato ISO padrão se for uma data
-        if isinstance(dia, datetime):
-            dia = dia.date().isoformat()
-        elif isinstance(dia, str):
-            # Remover parte de hora se existir
-            dia = dia.split('T')[0] if 'T' in dia else dia
-        
-        dados_por_dia[dia] = item
-    
-    # Criar série normalizada
-    serie_normalizada = []
-    data_atual = inicio
-    
-    while data_atual <= fim:
-        dia_str = data_atual.isoformat()
-        if dia_str in dados_por_dia:
-            # Se o dia existe na série original, usar esses dados
-            serie_normalizada.append(dados_por_dia[dia_str])
-        else:
-            # Se o dia não existe, criar um item com valores padrão
-            item_padrao = {"dia": dia_str}
-            for chave, valor in chaves_valores.items():
-                item_padrao[chave] = valor
-            serie_normalizada.append(item_padrao)
-        
-        # Avançar para o próximo dia
-        data_atual += timedelta(days=1)
+    if not arquivos:
+        return None
     
-    return serie_normalizada
+    # Ordenar por data mais recente (baseado no nome do arquivo)
+    arquivos.sort(reverse=True)
+    return arquivos[0]
 
 def obter_dash_mais_recente():
     """
     Obtém os dados do dashboard mais recente
     """
-    arquivos = glob.glob(os.path.join(RESULTS_DIR, "dash_*.json"))
-    
-    if not arquivos:
+    caminho = obter_caminho_dash_mais_recente()
+    if not caminho:
         return None
     
-    # Ordenar por data mais recente (baseado no nome do arquivo)
-    arquivos.sort(reverse=True)
-    
     try:
-        with open(arquivos[0], 'r', encoding='utf-8') as f:
+        with open(caminho, 'r', encoding='utf-8') as f:
             return json.load(f)
     except Exception as e:
-        print(f"Erro ao ler arquivo {arquivos[0]}: {str(e)}")
+        print(f"Erro ao ler arquivo {caminho}: {str(e)}")
         return None
 
+def consultar_entidades_dash(db):
+    """Usinas e inversores que entram no dashboard, ordenados por id"""
+    usinas = db.query(Usina.id, Usina.nome, Usina.localizacao).order_by(Usina.id).all()
+    inversores = db.query(
+        Inversor.id, Inversor.nome, Inversor.modelo, Inversor.usina_id
+    ).order_by(Inversor.id).all()
+    return usinas, inversores
+
+# Colunas das células (inversor, dia) usadas para montar o dashboard
+COLUNAS_CELULAS_DASH = [
+    "inversor_id", "dia", "potencia_maxima", "soma_temperatura", "n_temperatura",
+    "tem_medicao", "geracao", "tem_geracao"
+]
+
+def calcular_celulas_dash(db, inversor_ids, data_inicio, data_fim, dia_min=None, dia_max=None) -> pd.DataFrame:
+    """
+    Calcula as métricas do dashboard por célula (inversor, dia) com consultas agrupadas:
+    uma para potência máxima e soma/contagem de temperatura (período exato) e outra
+    para a geração diária (dias inteiros, ver calcular_series_temporais_geracao).
+    As métricas do período, da usina e da frota são derivadas destas células.
+    Com dia_min/dia_max, calcula só as células desses dias, com os mesmos valores
+    que elas teriam no cálculo do período inteiro.
+    """
+    inversor_ids = list(inversor_ids)
+    if not inversor_ids:
+        return pd.DataFrame(columns=COLUNAS_CELULAS_DASH)
+
+    # A geração de um dia depende dos pontos vizinhos (intervalos de até 24h): lê um dia a mais de cada lado
+    inicio_geracao, fim_geracao = data_inicio, data_fim
+    if dia_min is not None:
+        data_inicio = max(data_inicio, datetime.combine(dia_min, datetime.min.time()))
+        inicio_geracao = max(inicio_geracao, datetime.combine(dia_min - timedelta(days=1), datetime.min.time()))
+    if dia_max is not None:
+        data_fim = min(data_fim, datetime.combine(dia_max, datetime.max.time()))
+        fim_geracao = min(fim_geracao, datetime.combine(dia_max + timedelta(days=1), datetime.max.time()))
+
+    dia = func.date(Medicao.timestamp)
+    linhas = db.query(
+        Medicao.inversor_id,
+        dia.label('dia'),
+        func.max(Medicao.potencia_ativa).label('potencia_maxima'),
+        func.sum(Medicao.temperatura).label('soma_temperatura'),
+        func.count(Medicao.temperatura).label('n_temperatura')
+    ).filter(
+        Medicao.inversor_id.in_(inversor_ids),
+        Medicao.timestamp >= data_inicio,
+        Medicao.timestamp <= data_fim
+    ).group_by(Medicao.inversor_id, dia).all()
+    potencia_temperatura = pd.DataFrame(
+        [(r.inversor_id, r.dia.isoformat(), r.potencia_maxima, r.soma_temperatura, r.n_temperatura) for r in linhas],
+        columns=["inversor_id", "dia", "potencia_maxima", "soma_temperatura", "n_temperatura"]
+    )
+    potencia_temperatura["tem_medicao"] = True
+
+    series = calcular_series_temporais_geracao(db, inversor_ids, inicio_geracao, fim_geracao)
+    geracao = pd.DataFrame(
+        [(inversor_id, item["dia"], item["geracao"]) for inversor_id, serie in series.items() for item in serie],
+        columns=["inversor_id", "dia", "geracao"]
+    )
+    geracao["tem_geracao"] = True
+    if dia_min is not None:
+        geracao = geracao[geracao["dia"] >= dia_min.isoformat()]
+    if dia_max is not None:
+        geracao = geracao[geracao["dia"] <= dia_max.isoformat()]
+
+    celulas = potencia_temperatura.merge(geracao, on=["inversor_id", "dia"], how="outer")
+    celulas["tem_medicao"] = celulas["tem_medicao"].eq(True)
+    celulas["tem_geracao"] = celulas["tem_geracao"].eq(True)
+    return celulas[COLUNAS_CELULAS_DASH]
+
+# Número de processos usados para calcular as células do dashboard (1 = no próprio worker)
+DASH_PARALELISMO = int(os.getenv("DASH_PARALELISMO", "1"))
+
+def _inicializar_processo_dash():
+    # As conexões do pool herdadas do processo pai não podem ser usadas no filho
+    engine.dispose(close=False)
+
+def _calcular_celulas_lote(argumentos):
+    """Executado em um processo do pool, com sua própria sessão"""
+    inversor_ids, data_inicio, data_fim, dia_min, dia_max = argumentos
+    db = SessionLocal()
+    try:
+        return calcular_celulas_dash(db, inversor_ids, data_inicio, data_fim, dia_min, dia_max)
+    finally:
+        db.close()
+
+def dividir_inversores_dash(inversores, paralelismo):
+    """
+    Divide os inversores em lotes por usina. Usinas com mais inversores que a
+    parte de cada processo são quebradas em mais de um lote, para equilibrar a carga.
+    """
+    tamanho_maximo = max(1, math.ceil(len(inversores) / max(paralelismo, 1)))
+    por_usina = {}
+    for inversor in inversores:
+        por_usina.setdefault(inversor.usina_id, []).append(inversor.id)
+    lotes = []
+    for inversor_ids in por_usina.values():
+        lotes.extend(inversor_ids[i:i + tamanho_maximo] for i in range(0, len(inversor_ids), tamanho_maximo))
+    return lotes
+
+def calcular_celulas_dash_paralelo(db, inversores, data_inicio, data_fim, dia_min=None, dia_max=None, paralelismo=None):
+    """
+    Calcula as células do dashboard distribuindo os lotes de inversores entre
+    DASH_PARALELISMO processos, cada um com sua sessão de banco. Com paralelismo 1
+    (ou um único lote) o cálculo é feito na sessão recebida.
+    """
+    paralelismo = paralelismo or DASH_PARALELISMO
+    lotes = dividir_inversores_dash(inversores, paralelismo)
+    if paralelismo <= 1 or len(lotes) <= 1:
+        return calcular_celulas_dash(db, [inv.id for inv in inversores], data_inicio, data_fim, dia_min, dia_max)
+
+    print(f"Calculando {len(lotes)} lotes de inversores em {min(paralelismo, len(lotes))} processos")
+    with ProcessPoolExecutor(max_workers=min(paralelismo, len(lotes)), initializer=_inicializar_processo_dash) as executor:
+        partes = list(executor.map(
+            _calcular_celulas_lote,
+            [(lote, data_inicio, data_fim, dia_min, dia_max) for lote in lotes]
+        ))
+    partes = [parte for parte in partes if not parte.empty]
+    if not partes:
+        return pd.DataFrame(columns=COLUNAS_CELULAS_DASH)
+    return pd.concat(partes, ignore_index=True)
+
+def _valor_ou_none(valor):
+    return None if pd.isna(valor) else float(valor)
+
+def _item_serie_inversor(celula):
+    """Item diário da série de um inversor, com as mesmas chaves da versão por inversor"""
+    if celula.tem_medicao:
+        item = {
+            "dia": celula.dia,
+            "potencia_maxima": _valor_ou_none(celula.potencia_maxima),
+            "temperatura_media": _valor_ou_none(celula.temperatura_media)
+        }
+        if celula.tem_geracao:
+            item["geracao"] = float(celula.geracao)
+        return item
+    if celula.tem_geracao:
+        return {"dia": celula.dia, "geracao": float(celula.geracao)}
+    return {"dia": celula.dia, "geracao": 0, "potencia_maxima": 0, "temperatura_media": 0}
+
+def _temperatura_media_dia(tabela):
+    return (tabela["temperatura_positiva"] / tabela["com_temperatura"]).where(tabela["com_temperatura"] > 0, 0.0)
+
+def montar_resultado_dash(parametros, usinas, inversores, celulas: pd.DataFrame):
+    """
+    Monta a estrutura do dashboard a partir das células (inversor, dia).
+    As séries e métricas de usina e da frota saem de agrupamentos em memória.
+    """
+    data_inicio = datetime.fromisoformat(parametros['data_inicio'])
+    data_fim = datetime.fromisoformat(parametros['data_fim'])
+    dias = pd.date_range(data_inicio.date(), data_fim.date(), freq='D').strftime('%Y-%m-%d').tolist()
+
+    resultado_dash = {
+        "periodo": {
+            "data_inicio": parametros['data_inicio'],
+            "data_fim": parametros['data_fim']
+        },
+        "geracao_timestamp": datetime.now().isoformat(),
+        "metricas_globais": {
+            "geracao_total": 0,
+            "potencia_maxima_total": 0,
+            "temperatura_media_global": 0,
+            "media_diaria_geracao": 0,
+            "media_diaria_potencia": 0
+        },
+        "usinas": [],
+        "serie_temporal_total": [],
+        "serie_temporal_usinas": {}
+    }
+
+    # Grade completa inversor x dia: dias sem medição entram com valores zerados
+    usina_do_inversor = {inv.id: inv.usina_id for inv in inversores}
+    grade = pd.MultiIndex.from_product(
+        [list(usina_do_inversor), dias], names=["inversor_id", "dia"]
+    ).to_frame(index=False)
+    grade["usina_id"] = grade["inversor_id"].map(usina_do_inversor)
+    grade = grade.merge(celulas, on=["inversor_id", "dia"], how="left")
+    grade["tem_medicao"] = grade["tem_medicao"].eq(True)
+    grade["tem_geracao"] = grade["tem_geracao"].eq(True)
+    for coluna in ["potencia_maxima", "soma_temperatura", "n_temperatura", "geracao"]:
+        grade[coluna] = pd.to_numeric(grade[coluna], errors="coerce").astype(float)
+    grade["temperatura_media"] = grade["soma_temperatura"] / grade["n_temperatura"].where(grade["n_temperatura"] > 0)
+
+    # Nas séries de usina e da frota só entram valores positivos
+    grade["geracao_positiva"] = grade["geracao"].where(grade["geracao"] > 0, 0.0)
+    grade["potencia_positiva"] = grade["potencia_maxima"].where(grade["potencia_maxima"] > 0, 0.0)
+    grade["temperatura_positiva"] = grade["temperatura_media"].where(grade["temperatura_media"] > 0, 0.0)
+    grade["com_temperatura"] = (grade["temperatura_media"] > 0).astype(int)
+    somas = ["geracao_positiva", "potencia_positiva", "temperatura_positiva", "com_temperatura"]
+    por_usina_dia = grade.groupby(["usina_id", "dia"], sort=True)[somas].sum()
+    por_usina_dia["temperatura_media"] = _temperatura_media_dia(por_usina_dia)
+    por_dia = grade.groupby("dia", sort=True)[somas].sum()
+    por_dia["temperatura_media"] = _temperatura_media_dia(por_dia)
+
+    # Métricas de cada inversor no período
+    por_inversor = grade.groupby("inversor_id").agg(
+        potencia_maxima=("potencia_maxima", "max"),
+        soma_temperatura=("soma_temperatura", "sum"),
+        n_temperatura=("n_temperatura", "sum"),
+        geracao_total=("geracao", "sum")
+    ).reindex(list(usina_do_inversor))
+    por_inversor["potencia_maxima"] = por_inversor["potencia_maxima"].fillna(0.0)
+    por_inversor["geracao_total"] = por_inversor["geracao_total"].fillna(0.0)
+    por_inversor["temperatura_media"] = (
+        por_inversor["soma_temperatura"] / por_inversor["n_temperatura"].where(por_inversor["n_temperatura"] > 0)
+    ).fillna(0.0)
+    series_inversores = {
+        inversor_id: [_item_serie_inversor(c) for c in celulas_inversor.itertuples(index=False)]
+        for inversor_id, celulas_inversor in grade.groupby("inversor_id", sort=False)
+    }
+    series_usinas = {
+        usina_id: serie.droplevel(0) for usina_id, serie in por_usina_dia.groupby(level=0)
+    }
+
+    inversores_por_usina = {}
+    for inversor in inversores:
+        inversores_por_usina.setdefault(inversor.usina_id, []).append(inversor)
+
+    temperaturas_global = []
+    usinas_por_dia = {}
+    for usina in usinas:
+        print(f"Processando usina {usina.id} - {usina.nome}")
+        dados_usina = {
+            "id": usina.id,
+            "nome": usina.nome,
+            "localizacao": usina.localizacao,
+            "metricas": {
+                "geracao_total": 0,
+                "potencia_maxima_total": 0,
+                "temperatura_media": 0,
+                "media_diaria_geracao": 0
+            },
+            "inversores": []
+        }
+        resultado_dash["serie_temporal_usinas"][str(usina.id)] = []
+
+        inversores_usina = inversores_por_usina.get(usina.id, [])
+        if not inversores_usina:
+            print(f"Nenhum inversor encontrado para a usina {usina.id}")
+            dados_usina["erro"] = "Nenhum inversor encontrado"
+            resultado_dash["usinas"].append(dados_usina)
+            continue
+
+        temperaturas_usina = []
+        for inversor in inversores_usina:
+            metricas = por_inversor.loc[inversor.id]
+            temperatura = float(metricas["temperatura_media"])
+            dados_usina["inversores"].append({
+                "id": inversor.id,
+                "nome": inversor.nome,
+                "modelo": inversor.modelo,
+                "metricas": {
+                    "potencia_maxima": float(metricas["potencia_maxima"]),
+                    "temperatura_media": temperatura,
+                    "geracao_total": float(metricas["geracao_total"])
+                },
+                "serie_temporal": series_inversores.get(inversor.id, [])
+            })
+            dados_usina["metricas"]["potencia_maxima_total"] += float(metricas["potencia_maxima"])
+            dados_usina["metricas"]["geracao_total"] += float(metricas["geracao_total"])
+            if temperatura:
+                temperaturas_usina.append(temperatura)
+                temperaturas_global.append(temperatura)
+
+        if temperaturas_usina:
+            dados_usina["metricas"]["temperatura_media"] = sum(temperaturas_usina) / len(temperaturas_usina)
+
+        serie_usina = series_usinas.get(usina.id, por_usina_dia.iloc[:0])
+        serie_temporal_usina = [
+            {
+                "dia": dia,
+                "geracao": float(linha.geracao_positiva),
+                "potencia_maxima": float(linha.potencia_positiva),
+                "temperatura_media": float(linha.temperatura_media)
+            }
+            for dia, linha in zip(serie_usina.index, serie_usina.itertuples(index=False))
+        ]
+        for item in serie_temporal_usina:
+            usinas_por_dia.setdefault(item["dia"], {})[str(usina.id)] = {
+                "geracao": item["geracao"],
+                "potencia_maxima": item["potencia_maxima"],
+                "temperatura_media": 0,
+                "nome": usina.nome
+            }
+
+        total_dias_com_geracao = int((serie_usina["geracao_positiva"] > 0).sum())
+        if total_dias_com_geracao > 0:
+            dados_usina["metricas"]["media_diaria_geracao"] = dados_usina["metricas"]["geracao_total"] / total_dias_com_geracao
+
+        resultado_dash["serie_temporal_usinas"][str(usina.id)] = serie_temporal_usina
+        resultado_dash["metricas_globais"]["geracao_total"] += dados_usina["metricas"]["geracao_total"]
+        resultado_dash["metricas_globais"]["potencia_maxima_total"] += dados_usina["metricas"]["potencia_maxima_total"]
+        resultado_dash["usinas"].append(dados_usina)
+
+    if temperaturas_global:
+        resultado_dash["metricas_globais"]["temperatura_media_global"] = sum(temperaturas_global) / len(temperaturas_global)
+
+    # Série temporal global (apenas dias cobertos por usinas com inversores)
+    resultado_dash["serie_temporal_total"] = [
+        {
+            "dia": dia,
+            "geracao": float(linha.geracao_positiva),
+            "potencia_maxima": float(linha.potencia_positiva),
+            "temperatura_media": float(linha.temperatura_media),
+            "usinas": usinas_por_dia[dia]
+        }
+        for dia, linha in zip(por_dia.index, por_dia.itertuples(index=False))
+        if dia in usinas_por_dia
+    ]
+
+    total_dias_com_geracao = int((por_dia["geracao_positiva"] > 0).sum())
+    if total_dias_com_geracao > 0:
+        resultado_dash["metricas_globais"]["media_diaria_geracao"] = resultado_dash["metricas_globais"]["geracao_total"] / total_dias_com_geracao
+        resultado_dash["metricas_globais"]["media_diaria_potencia"] = resultado_dash["metricas_globais"]["potencia_maxima_total"] / total_dias_com_geracao
+
+    return resultado_dash
+
+# Estado do último dashboard de cada período: células (inversor, dia), marcas de ingestão
+# e versão das usinas/inversores. Permite recalcular só o que mudou desde então.
+DASH_ESTADO_DIR = os.path.join(RESULTS_DIR, 'dash_estado')
+os.makedirs(DASH_ESTADO_DIR, exist_ok=True)
+
+def caminho_estado_dash(parametros):
+    periodo = "|".join(
+        datetime.fromisoformat(parametros[chave]).isoformat() for chave in ('data_inicio', 'data_fim')
+    )
+    return os.path.join(DASH_ESTADO_DIR, f"dash_{hashlib.sha1(periodo.encode()).hexdigest()}.pkl")
+
+def carregar_estado_dash(parametros):
+    caminho = caminho_estado_dash(parametros)
+    if not os.path.isfile(caminho):
+        return None
+    try:
+        return pd.read_pickle(caminho)
+    except Exception as e:
+        print(f"Erro ao ler estado do dashboard {caminho}: {str(e)}")
+        return None
+
+def salvar_estado_dash(parametros, estado):
+    caminho = caminho_estado_dash(parametros)
+    temporario = f"{caminho}.tmp"
+    pd.to_pickle(estado, temporario)
+    os.replace(temporario, caminho)
+
+def versao_entidades_dash(db):
+    """Muda quando usinas ou inversores são criados, alterados ou removidos"""
+    return [versao_consulta(db, db.query(Usina), Usina), versao_consulta(db, db.query(Inversor), Inversor)]
+
+def celulas_alteradas(marcas_anteriores, marcas):
+    """Células (inversor, dia) cuja marca de ingestão mudou, apareceu ou sumiu"""
+    alteradas = {celula for celula, marca in marcas.items() if marcas_anteriores.get(celula) != marca}
+    return alteradas | (set(marcas_anteriores) - set(marcas))
+
+def atualizar_celulas_dash(db, estado, marcas, inversores, data_inicio, data_fim):
+    """
+    Parte das células do dashboard anterior e recalcula apenas as células alteradas
+    (entre o menor e o maior dia alterado) e as dos inversores que não existiam antes.
+    """
+    inversor_ids = {inv.id for inv in inversores}
+    celulas = estado["celulas"]
+    celulas = celulas[celulas["inversor_id"].isin(inversor_ids)]
+    partes = []
+
+    alteradas = [(inversor_id, dia) for inversor_id, dia in celulas_alteradas(estado["marcas"], marcas)
+                 if inversor_id in inversor_ids]
+    if alteradas:
+        inversores_alterados = sorted({inversor_id for inversor_id, _ in alteradas})
+        dia_min = min(dia for _, dia in alteradas)
+        dia_max = max(dia for _, dia in alteradas)
+        print(f"Recalculando {len(alteradas)} células de {len(inversores_alterados)} inversores entre {dia_min} e {dia_max}")
+        substituidas = (
+            celulas["inversor_id"].isin(inversores_alterados)
+            & (celulas["dia"] >= dia_min.isoformat())
+            & (celulas["dia"] <= dia_max.isoformat())
+        )
+        celulas = celulas[~substituidas]
+        partes.append(calcular_celulas_dash_paralelo(
+            db, [inv for inv in inversores if inv.id in inversores_alterados], data_inicio, data_fim, dia_min, dia_max
+        ))
+
+    anteriores = set(estado["inversor_ids"])
+    novos = [inv for inv in inversores if inv.id not in anteriores]
+    if novos:
+        print(f"Calculando {len(novos)} inversores novos")
+        partes.append(calcular_celulas_dash_paralelo(db, novos, data_inicio, data_fim))
+
+    partes = [parte for parte in [celulas] + partes if not parte.empty]
+    if not partes:
+        return celulas
+    return pd.concat(partes, ignore_index=True)
+
+def gerar_resultado_dash(db, parametros, estado=None, marcas=None):
+    """
+    Calcula o dashboard do período com um número fixo de consultas agrupadas,
+    independente da quantidade de usinas, inversores e dias.
+    Com o estado de um dashboard anterior do mesmo período (e as marcas de ingestão atuais),
+    só as células alteradas desde então são recalculadas.
+    Retorna (resultado_dash, celulas); resultado_dash é None quando não há usinas cadastradas.
+    """
+    data_inicio = datetime.fromisoformat(parametros['data_inicio'])
+    data_fim = datetime.fromisoformat(parametros['data_fim'])
+    usinas, inversores = consultar_entidades_dash(db)
+    if not usinas:
+        return None, None
+    if estado is not None and marcas is not None:
+        celulas = atualizar_celulas_dash(db, estado, marcas, inversores, data_inicio, data_fim)
+    else:
+        celulas = calcular_celulas_dash_paralelo(db, inversores, data_inicio, data_fim)
+    return montar_resultado_dash(parametros, usinas, inversores, celulas), celulas
+
+def reaproveitar_dash(nome_arquivo):
+    """
+    Devolve o dashboard já salvo, sem recalcular. Se ele não é mais o mais recente,
+    é copiado com um nome novo para que /agregacao/dash volte a servi-lo.
+    """
+    caminho = obter_caminho_resultado(nome_arquivo)
+    if not caminho:
+        return None
+    if caminho == obter_caminho_dash_mais_recente():
+        return nome_arquivo
+    novo_nome, destino = criar_arquivo_resultado('dash', 'xb')
+    with open(caminho, 'rb') as origem, destino:
+        shutil.copyfileobj(origem, destino)
+    return novo_nome
+
 def processa_gerar_dash(parametros):
     """
     Processa a geração de todos os dados necessários para o dashboard em um único arquivo.
-    Este processo é mais pesado, mas gera todos os dados de uma só vez.
+    Todas as métricas saem de poucas consultas agrupadas por (inversor, dia). Se o mesmo
+    período já foi calculado, só as células com novas medições são recalculadas, e se
+    nada mudou o dashboard anterior é devolvido como está.
     """
     print(f"Iniciando processamento do dashboard para o período: {parametros}")
     db = SessionLocal()
     try:
         data_inicio = datetime.fromisoformat(parametros['data_inicio'])
         data_fim = datetime.fromisoformat(parametros['data_fim'])
-        
-        # Estrutura para armazenar o resultado completo
-        resultado_dash = {
-            "periodo": {
-                "data_inicio": parametros['data_inicio'],
-                "data_fim": parametros['data_fim']
-            },
-            "geracao_timestamp": datetime.now().isoformat(),
-            "metricas_globais": {
-                "geracao_total": 0,
-                "potencia_maxima_total": 0,
-                "temperatura_media_global": 0,
-                "media_diaria_geracao": 0,
-                "media_diaria_potencia": 0
-            },
-            "usinas": [],
-            "serie_temporal_total": [],
-            "serie_temporal_usinas": {}
-        }
-        
-        # Buscar todas as usinas
-        usinas = db.query(Usina).all()
-        if not usinas:
+        estado = None if parametros.get('recalcular_tudo') else carregar_estado_dash(parametros)
+
+        # As marcas são lidas antes das medições: dados confirmados durante o cálculo
+        # deixam a marca diferente da salva e são recalculados na próxima vez
+        marcas = get_marcas(db, data_inicio.date(), data_fim.date())
+        versao_entidades = versao_entidades_dash(db)
+        if estado and estado["marcas"] == marcas and estado["versao_entidades"] == versao_entidades:
+            nome_arquivo = reaproveitar_dash(estado["nome_arquivo"])
+            if nome_arquivo:
+                print(f"Nenhuma alteração desde o último dashboard do período: {nome_arquivo}")
+                return nome_arquivo
+
+        resultado_dash, celulas = gerar_resultado_dash(db, parametros, estado, marcas)
+        if resultado_dash is None:
             print("Nenhuma usina encontrada!")
             return salvar_resultado('dash', parametros, {
                 "erro": "Nenhuma usina encontrada"
             })
-            
-        # Dicionário para acumular dados diários globais
-        dados_diarios_global = {}
-        total_inversores_com_temp = 0
-        soma_temp_global = 0
-        
-        # Processar cada usina
-        for usina in usinas:
-            print(f"Processando usina {usina.id} - {usina.nome}")
-            
-            # Dados da usina
-            dados_usina = {
-                "id": usina.id,
-                "nome": usina.nome,
-                "localizacao": usina.localizacao,
-                "metricas": {
-                    "geracao_total": 0,
-                    "potencia_maxima_total": 0,
-                    "temperatura_media": 0,
-                    "media_diaria_geracao": 0
-                },
-                "inversores": []
-            }
-            
-            # Inicializar série temporal da usina
-            resultado_dash["serie_temporal_usinas"][str(usina.id)] = []
-            
-            # Buscar inversores da usina
-            inversores = db.query(Inversor).filter(Inversor.usina_id == usina.id).all()
-            if not inversores:
-                print(f"Nenhum inversor encontrado para a usina {usina.id}")
-                dados_usina["erro"] = "Nenhum inversor encontrado"
-                resultado_dash["usinas"].append(dados_usina)
-                continue
-                
-            # Dicionário para acumular dados diários da usina
-            dados_diarios_usina = {}
-            inversores_com_temp = 0
-            soma_temp_usina = 0
-            
-            # Processar cada inversor
-            for inversor in inversores:
-                print(f"Processando inversor {inversor.id} - {inversor.nome}")
-                
-                # Dados do inversor
-                dados_inversor = {
-                    "id": inversor.id,
-                    "nome": inversor.nome,
-                    "modelo": inversor.modelo,
-                    "metricas": {}
-                }
-                
-                # 1. Potência máxima
-                potencia_max = db.query(func.max(Medicao.potencia_ativa).label('max_pot')).filter(
-                    Medicao.inversor_id == inversor.id,
-                    Medicao.timestamp >= data_inicio,
-                    Medicao.timestamp <= data_fim
-                ).scalar() or 0
-                dados_inversor["metricas"]["potencia_maxima"] = potencia_max
-                dados_usina["metricas"]["potencia_maxima_total"] += potencia_max
-                
-                # 2. Temperatura média
-                temp_media = db.query(func.avg(Medicao.temperatura).label('avg_temp')).filter(
-                    Medicao.inversor_id == inversor.id,
-                    Medicao.timestamp >= data_inicio,
-                    Medicao.timestamp <= data_fim
-                ).scalar() or 0
-                
-                if temp_media:
-                    dados_inversor["metricas"]["temperatura_media"] = temp_media
-                    soma_temp_usina += temp_media
-                    inversores_com_temp += 1
-                    
-                    soma_temp_global += temp_media
-                    total_inversores_com_temp += 1
-                else:
-                    dados_inversor["metricas"]["temperatura_media"] = 0
-                
-                # 3. Geração total (soma da geração diária)
-                serie_temporal_geracao = calcular_serie_temporal_geracao(
-                    db, inversor.id, data_inicio, data_fim
-                )
-                geracao_total_inversor = sum(item["geracao"] for item in serie_temporal_geracao)
-                dados_inversor["metricas"]["geracao_total"] = geracao_total_inversor
-                dados_usina["metricas"]["geracao_total"] += geracao_total_inversor
-                
-                # 4. Série temporal de potência e temperatura
-                serie_temporal_pot_temp = calcular_serie_temporal_potencia_temperatura(
-                    db, inversor.id, data_inicio, data_fim
-                )
-                
-                # 5. Combinar e normalizar séries temporais
-                serie_combinada = []
-                dias_combinados = set()
-                
-                for item in serie_temporal_pot_temp:
-                    dia = item['dia']
-                    dias_combinados.add(dia)
-                    item_combinado = {"dia": dia}
-                    item_combinado.update(item)
-                    serie_combinada.append(item_combinado)
-                
-                for item in serie_temporal_geracao:
-                    dia = item['dia']
-                    if dia in dias_combinados:
-                        # Atualizar item existente
-                        for i, item_existente in enumerate(serie_combinada):
-                            if item_existente['dia'] == dia:
-                                serie_combinada[i].update(item)
-                                break
-                    else:
-                        # Adicionar novo item
-                        item_combinado = {"dia": dia, "geracao": item['geracao']}
-                        serie_combinada.append(item_combinado)
-                
-                # Normalizar a série (incluir todos os dias do período)
-                serie_normalizada = normalizar_serie_temporal(
-                    serie_combinada,
-                    parametros['data_inicio'],
-                    parametros['data_fim'],
-                    {"geracao": 0, "potencia_maxima": 0, "temperatura_media": 0}
-                )
-                
-                dados_inversor["serie_temporal"] = serie_normalizada
-                
-                # 6. Acumular dados diários para usina e global
-                for item in serie_normalizada:
-                    dia = item['dia']
-                    
-                    # Acumular para usina
-                    if dia not in dados_diarios_usina:
-                        dados_diarios_usina[dia] = {
-                            "geracao": 0,
-                            "potencia_maxima": 0,
-                            "temperaturas": [],
-                            "inversores_com_temp": 0
-                        }
-                    
-                    # Acumular para global
-                    if dia not in dados_diarios_global:
-                        dados_diarios_global[dia] = {
-                            "geracao": 0,
-                            "potencia_maxima": 0,
-                            "temperaturas": [],
-                            "inversores_com_temp": 0,
-                            "usinas": {}
-                        }
-                    
-                    # Inicializar contagem para esta usina no global
-                    if str(usina.id) not in dados_diarios_global[dia]["usinas"]:
-                        dados_diarios_global[dia]["usinas"][str(usina.id)] = {
-                            "geracao": 0,
-                            "potencia_maxima": 0,
-                            "temperatura_media": 0,
-                            "nome": usina.nome
-                        }
-                    
-                    # Transferir dados de geração
-                    if 'geracao' in item and item['geracao'] > 0:
-                        dados_diarios_usina[dia]["geracao"] += item['geracao']
-                        dados_diarios_global[dia]["geracao"] += item['geracao']
-                        dados_diarios_global[dia]["usinas"][str(usina.id)]["geracao"] += item['geracao']
-                    
-                    # Transferir dados de potência
-                    if 'potencia_maxima' in item and item['potencia_maxima'] > 0:
-                        dados_diarios_usina[dia]["potencia_maxima"] += item['potencia_maxima']
-                        dados_diarios_global[dia]["potencia_maxima"] += item['potencia_maxima']
-                        dados_diarios_global[dia]["usinas"][str(usina.id)]["potencia_maxima"] += item['potencia_maxima']
-                    
-                    # Transferir dados de temperatura
-                    if 'temperatura_media' in item and item['temperatura_media'] > 0:
-                        dados_diarios_usina[dia]["temperaturas"].append(item['temperatura_media'])
-                        dados_diarios_usina[dia]["inversores_com_temp"] += 1
-                        
-                        dados_diarios_global[dia]["temperaturas"].append(item['temperatura_media'])
-                        dados_diarios_global[dia]["inversores_com_temp"] += 1
-                
-                # Adicionar dados deste inversor à usina
-                dados_usina["inversores"].append(dados_inversor)
-            
-            # Calcular temperatura média da usina
-            if inversores_com_temp > 0:
-                dados_usina["metricas"]["temperatura_media"] = soma_temp_usina / inversores_com_temp
-            
-            # Gerar série temporal da usina
-            serie_temporal_usina = []
-            for dia, dados in sorted(dados_diarios_usina.items()):
-                temp_media_dia = 0
-                if dados["inversores_com_temp"] > 0:
-                    temp_media_dia = sum(dados["temperaturas"]) / dados["inversores_com_temp"]
-                
-                # Adicionar à série temporal da usina
-                serie_temporal_usina.append({
-                    "dia": dia,
-                    "geracao": dados["geracao"],
-                    "potencia_maxima": dados["potencia_maxima"],
-                    "temperatura_media": temp_media_dia
-                })
-            
-            # Ordenar série temporal da usina
-            serie_temporal_usina.sort(key=lambda x: x['dia'])
-            
-            # Calcular média diária da usina
-            total_dias_com_geracao = len([d for d in serie_temporal_usina if d["geracao"] > 0])
-            if total_dias_com_geracao > 0:
-                dados_usina["metricas"]["media_diaria_geracao"] = dados_usina["metricas"]["geracao_total"] / total_dias_com_geracao
-            
-            # Adicionar série temporal à usina
-            resultado_dash["serie_temporal_usinas"][str(usina.id)] = serie_temporal_usina
-            
-            # Atualizar totais globais
-            resultado_dash["metricas_globais"]["geracao_total"] += dados_usina["metricas"]["geracao_total"]
-            resultado_dash["metricas_globais"]["potencia_maxima_total"] += dados_usina["metricas"]["potencia_maxima_total"]
-            
-            # Adicionar dados desta usina ao resultado final
-            resultado_dash["usinas"].append(dados_usina)
-        
-        # Calcular temperatura média global
-        if total_inversores_com_temp > 0:
-            resultado_dash["metricas_globais"]["temperatura_media_global"] = soma_temp_global / total_inversores_com_temp
-        
-        # Gerar série temporal global
-        serie_temporal_global = []
-        for dia, dados in sorted(dados_diarios_global.items()):
-            temp_media_dia = 0
-            if dados["inversores_com_temp"] > 0:
-                temp_media_dia = sum(dados["temperaturas"]) / dados["inversores_com_temp"]
-            
-            # Adicionar à série temporal global
-            serie_temporal_global.append({
-                "dia": dia,
-                "geracao": dados["geracao"],
-                "potencia_maxima": dados["potencia_maxima"],
-                "temperatura_media": temp_media_dia,
-                "usinas": dados["usinas"]
-            })
-        
-        # Ordenar série temporal global
-        serie_temporal_global.sort(key=lambda x: x['dia'])
-        resultado_dash["serie_temporal_total"] = serie_temporal_global
-        
-        # Calcular médias diárias globais
-        total_dias_com_geracao = len([d for d in serie_temporal_global if d["geracao"] > 0])
-        if total_dias_com_geracao > 0:
-            resultado_dash["metricas_globais"]["media_diaria_geracao"] = resultado_dash["metricas_globais"]["geracao_total"] / total_dias_com_geracao
-            resultado_dash["metricas_globais"]["media_diaria_potencia"] = resultado_dash["metricas_globais"]["potencia_maxima_total"] / total_dias_com_geracao
         
         # Salvar o resultado final
         print(f"Dashboard gerado com sucesso para o período {parametros['data_inicio']} a {parametros['data_fim']}")
-        nome_arquivo = f"dash_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        caminho = os.path.join(RESULTS_DIR, nome_arquivo)
-        with open(caminho, 'w', encoding='utf-8') as f:
+        nome_arquivo, f = criar_arquivo_resultado('dash')
+        with f:
             json.dump(resultado_dash, f, ensure_ascii=False, indent=2)
-        print(f"Dashboard salvo em: {caminho}")
+        print(f"Dashboard salvo em: {f.name}")
+
+        salvar_estado_dash(parametros, {
+            "marcas": marcas,
+            "versao_entidades": versao_entidades,
+            "inversor_ids": [inversor["id"] for usina in resultado_dash["usinas"] for inversor in usina["inversores"]],
+            "celulas": celulas,
+            "nome_arquivo": nome_arquivo
+        })
         
         return nome_arquivo
     except Exception as e:
@@ -595,4 +1008,4 @@ def processa_gerar_dash(parametros):
         salvar_resultado('dash_error', parametros, {"erro": str(e)})
         return None
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
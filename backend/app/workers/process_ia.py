@@ -1,6 +1,6 @@
 from app.core.database import SessionLocal
 from sqlalchemy import func, and_
-from app.models import Medicao, Inversor, Usina
+from app.models import Medicao, Inversor, Usina, UltimaMedicao
 from datetime import datetime, timedelta
 import os
 import json
@@ -12,7 +12,7 @@ from typing import Optional, List, Dict, Any, Union
 from sklearn.ensemble import RandomForestRegressor, RandomForestClassifier, IsolationForest
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import mean_absolute_error, r2_score, accuracy_score, f1_score, precision_score, recall_score
-from utils import calc_inverters_generation, TimeSeriesValue
+from app.workers.process_agregacao import calcular_series_temporais_geracao
 
 # Diretório para armazenar modelos e resultados
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -67,30 +67,16 @@ def preparar_dados_geracao(db, data_inicio, data_fim):
     df['dia_semana'] = df['dia_date'].dt.dayofweek
     df['mes'] = df['dia_date'].dt.month
     
-    # Calcular geração diária usando a implementação completa de calc_inverters_generation
-    geracoes = []
-    for _, row in df.iterrows():
-        inversor_id = row['inversor_id']
-        dia_inicio = datetime.combine(row['dia_date'].date(), datetime.min.time())
-        dia_fim = datetime.combine(row['dia_date'].date(), datetime.max.time())
-        
-        # Buscar todas as medições do dia para este inversor
-        medicoes_detalhadas = db.query(Medicao).filter(
-            Medicao.inversor_id == inversor_id,
-            Medicao.timestamp >= dia_inicio,
-            Medicao.timestamp <= dia_fim
-        ).order_by(Medicao.timestamp).all()
-        
-        # Converter para o formato esperado por calc_inverters_generation
-        power = [TimeSeriesValue(value=m.potencia_ativa, date=m.timestamp) 
-                 for m in medicoes_detalhadas if m.potencia_ativa is not None]
-        
-        if power:
-            entity = type('Entity', (), {'power': power})()
-            geracao_dia = calc_inverters_generation([entity])
-            geracoes.append(geracao_dia)
-        else:
-            geracoes.append(0)
+    # Calcular geração diária usando a mesma integração das agregações (uma leitura para todos os inversores)
+    series_geracao = calcular_series_temporais_geracao(
+        db, df['inversor_id'].unique().tolist(), data_inicio, data_fim
+    )
+    geracao_por_dia = {
+        (inversor_id, item['dia']): item['geracao']
+        for inversor_id, serie in series_geracao.items()
+        for item in serie
+    }
+    geracoes = [geracao_por_dia.get((row.inversor_id, row.dia), 0) for row in df.itertuples()]
     
     # Adicionar coluna de geração ao dataframe
     df['geracao'] = geracoes
@@ -639,8 +625,16 @@ def prever_geracao(usina_id, dias=7):
             print(f"Nenhum inversor encontrado para a usina {usina_id}")
             return None
         
-        # Obter dados mais recentes
-        ultimo_dia = db.query(func.max(Medicao.timestamp)).scalar()
+        # Obter dados mais recentes (última medição dos inversores da usina)
+        inversor_ids = [inversor.id for inversor in inversores]
+        ultimo_dia = db.query(func.max(UltimaMedicao.timestamp)).filter(
+            UltimaMedicao.inversor_id.in_(inversor_ids)
+        ).scalar()
+        if not ultimo_dia:
+            # Bancos populados antes de ultimas_medicoes: consulta as medições
+            ultimo_dia = db.query(func.max(Medicao.timestamp)).filter(
+                Medicao.inversor_id.in_(inversor_ids)
+            ).scalar()
         if not ultimo_dia:
             print("Nenhuma medição encontrada")
             return None
@@ -1,6 +1,8 @@
 from datetime import datetime
 from app.core.database import SessionLocal, ajustar_sequencias
 from app.models import Medicao, Inversor, Usina
+from app.crud.marca_ingestao import marcar_medicoes
+from app.crud.ultima_medicao import atualizar_ultimas_medicoes
 
 def processa_ingestao(dados):
     db = SessionLocal()
@@ -48,6 +50,8 @@ def processa_ingestao(dados):
                 temperatura=m.get('temperatura_celsius')
             ))
         db.bulk_save_objects(medicoes)
+        marcar_medicoes(db, [(m.inversor_id, m.timestamp) for m in medicoes])
+        atualizar_ultimas_medicoes(db, medicoes)
         db.commit()
         # Ajustar sequências após ingestão
         ajustar_sequencias()
@@ -1,7 +1,8 @@
 import pika
 import json
 import os
-from app.core.database import create_tables
+from app.core.database import SessionLocal, create_tables
+from app.crud.tarefa import atualizar_status_tarefa
 from app.workers.process_ingestao import processa_ingestao
 from app.workers.process_processamento import processa_processamento
 from app.workers.process_ia import processa_treinar_modelos
@@ -10,7 +11,9 @@ from app.workers.process_agregacao import (
     processa_media_temperatura,
     processa_geracao_usina,
     processa_geracao_inversor,
-    processa_gerar_dash
+    processa_gerar_dash,
+    processa_consulta,
+    processa_atualizar_agregados
 )
 
 def inicializar_ambiente():
@@ -26,30 +29,58 @@ def inicializar_ambiente():
     
     print("[Worker] Ambiente de trabalho inicializado com sucesso!")
 
+def executa_mensagem(mensagem):
+    """Executa a mensagem e retorna o nome do arquivo de resultado, quando houver"""
+    tipo = mensagem.get('tipo')
+    if tipo == 'ingestao':
+        return processa_ingestao(mensagem['dados'])
+    elif tipo == 'processamento':
+        return processa_processamento(mensagem)
+    elif tipo == 'treinar_modelos':
+        return processa_treinar_modelos(mensagem['parametros'])
+    elif tipo == 'potencia_maxima':
+        return processa_potencia_maxima(mensagem['parametros'])
+    elif tipo == 'media_temperatura':
+        return processa_media_temperatura(mensagem['parametros'])
+    elif tipo == 'geracao_usina':
+        return processa_geracao_usina(mensagem['parametros'])
+    elif tipo == 'geracao_inversor':
+        return processa_geracao_inversor(mensagem['parametros'])
+    elif tipo == 'consulta':
+        return processa_consulta(mensagem['parametros'])
+    elif tipo == 'atualizar_agregados':
+        return processa_atualizar_agregados(mensagem['parametros'])
+    elif tipo == 'gerar_dash':
+        nome_arquivo = processa_gerar_dash(mensagem['parametros'])
+        if nome_arquivo is None:
+            raise RuntimeError("Erro ao gerar dashboard")
+        return nome_arquivo
+    else:
+        print(f"Tipo de mensagem não suportado: {tipo}")
+
+def atualiza_tarefa(tarefa_id, status, nome_arquivo=None, erro=None):
+    """Registra a situação da tarefa para a API; solicitações sem tarefa são ignoradas"""
+    if not tarefa_id:
+        return
+    db = SessionLocal()
+    try:
+        atualizar_status_tarefa(db, tarefa_id, status, nome_arquivo, erro)
+    except Exception as e:
+        print(f"Erro ao atualizar tarefa {tarefa_id}: {e}")
+    finally:
+        db.close()
+
 def processa_mensagem(ch, method, properties, body):
+    tarefa_id = None
     try:
         mensagem = json.loads(body)
-        tipo = mensagem.get('tipo')
-        if tipo == 'ingestao':
-            processa_ingestao(mensagem['dados'])
-        elif tipo == 'processamento':
-            processa_processamento(mensagem)
-        elif tipo == 'treinar_modelos':
-            processa_treinar_modelos(mensagem['parametros'])
-        elif tipo == 'potencia_maxima':
-            processa_potencia_maxima(mensagem['parametros'])
-        elif tipo == 'media_temperatura':
-            processa_media_temperatura(mensagem['parametros'])
-        elif tipo == 'geracao_usina':
-            processa_geracao_usina(mensagem['parametros'])
-        elif tipo == 'geracao_inversor':
-            processa_geracao_inversor(mensagem['parametros'])
-        elif tipo == 'gerar_dash':
-            processa_gerar_dash(mensagem['parametros'])
-        else:
-            print(f"Tipo de mensagem não suportado: {tipo}")
+        tarefa_id = mensagem.get('tarefa_id')
+        atualiza_tarefa(tarefa_id, "executando")
+        nome_arquivo = executa_mensagem(mensagem)
+        atualiza_tarefa(tarefa_id, "concluida", nome_arquivo if isinstance(nome_arquivo, str) else None)
     except Exception as e:
         print(f"Erro ao processar mensagem: {e}")
+        atualiza_tarefa(tarefa_id, "erro", erro=str(e))
     ch.basic_ack(delivery_tag=method.delivery_tag)
 
 def main():
@@ -0,0 +1,77 @@
+"""
+Mede quantas consultas e quanto tempo a geração do dashboard leva conforme
+cresce o número de inversores e de dias do período.
+
+Para cada combinação, o dashboard é montado apenas com os N primeiros inversores
+e os D primeiros dias a partir da primeira medição do banco. A coluna
+"consultas (antes)" mostra quantas consultas a versão por inversor/dia faria:
+1 de usinas + 1 de inversores por usina + (3 + dias) por inversor.
+
+Uso:
+    cd backend
+    python -m scripts.benchmark_dash --inversores 1,2,4,8 --dias 1,2,4,8
+
+Com --paralelismo N as células são calculadas em N processos (DASH_PARALELISMO);
+nesse caso a contagem de consultas inclui só as feitas no processo principal.
+"""
+import argparse
+import time
+from datetime import timedelta
+from sqlalchemy import event, func
+from app.core.database import SessionLocal, engine
+from app.models import Medicao
+from app.workers.process_agregacao import calcular_celulas_dash_paralelo, consultar_entidades_dash, montar_resultado_dash
+
+class ContadorConsultas:
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, *args):
+        self.total += 1
+
+def lista_inteiros(valor):
+    return [int(v) for v in valor.split(",") if v]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da geração do dashboard")
+    parser.add_argument("--inversores", type=lista_inteiros, default=[1, 2, 4, 8])
+    parser.add_argument("--dias", type=lista_inteiros, default=[1, 2, 4, 8])
+    parser.add_argument("--paralelismo", type=int, default=1)
+    args = parser.parse_args()
+
+    contador = ContadorConsultas()
+    event.listen(engine, "before_cursor_execute", contador)
+    db = SessionLocal()
+    try:
+        primeira_medicao = db.query(func.min(Medicao.timestamp)).scalar()
+        if primeira_medicao is None:
+            print("Nenhuma medição no banco. Rode antes: python -m scripts.popula_banco")
+            return
+        inicio = primeira_medicao.replace(hour=0, minute=0, second=0, microsecond=0)
+        usinas, todos_inversores = consultar_entidades_dash(db)
+
+        print(f"{'inversores':>10} {'dias':>5} {'células':>8} {'consultas':>10} {'consultas (antes)':>18} {'tempo (s)':>10}")
+        for n_inversores in args.inversores:
+            inversores = todos_inversores[:n_inversores]
+            usinas_usadas = [u for u in usinas if any(i.usina_id == u.id for i in inversores)]
+            for n_dias in args.dias:
+                fim = inicio + timedelta(days=n_dias) - timedelta(microseconds=1)
+                parametros = {"data_inicio": inicio.isoformat(), "data_fim": fim.isoformat()}
+
+                contador.total = 0
+                t0 = time.perf_counter()
+                celulas = calcular_celulas_dash_paralelo(db, inversores, inicio, fim, paralelismo=args.paralelismo)
+                montar_resultado_dash(parametros, usinas_usadas, inversores, celulas)
+                tempo = time.perf_counter() - t0
+
+                # As 2 consultas de usinas/inversores (feitas uma vez acima) também fazem parte do dashboard
+                consultas = contador.total + 2
+                consultas_antes = 1 + len(usinas_usadas) + len(inversores) * (3 + n_dias)
+                print(f"{len(inversores):>10} {n_dias:>5} {len(inversores) * n_dias:>8} "
+                      f"{consultas:>10} {consultas_antes:>18} {tempo:>10.3f}")
+    finally:
+        event.remove(engine, "before_cursor_execute", contador)
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,8 @@ from datetime import datetime
 from sqlalchemy.orm import Session
 from app.core.database import engine, SessionLocal, create_tables
 from app.models import Usina, Inversor, Medicao
+from app.crud.marca_ingestao import marcar_medicoes
+from app.crud.ultima_medicao import atualizar_ultimas_medicoes
 
 # Caminho do arquivo de métricas
 METRICS_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../sample/metrics.json'))
@@ -45,6 +47,8 @@ def main():
                 temperatura=m.get('temperatura_celsius')
             ))
         db.bulk_save_objects(medicoes)
+        marcar_medicoes(db, [(m.inversor_id, m.timestamp) for m in medicoes])
+        atualizar_ultimas_medicoes(db, medicoes)
         db.commit()
         print(f"População concluída: {len(medicoes)} medições inseridas.")
     finally:
@@ -0,0 +1,46 @@
+"""
+Recalcula a tabela agregados_diarios a partir das medições.
+
+A tabela é mantida pelas marcas de ingestão: células com medições novas são
+recalculadas quando consultadas. Medições gravadas antes de existirem as marcas
+não têm marca; create_tables (na subida do worker) calcula a tabela quando ela
+ainda está vazia. Este script recalcula tudo (ou um período) a qualquer momento,
+por exemplo depois de medições inseridas direto no banco.
+O cálculo é feito em blocos de dias para limitar a memória.
+
+Uso:
+    cd backend
+    python -m scripts.recalcula_agregados [--inicio AAAA-MM-DD] [--fim AAAA-MM-DD] [--dias-por-bloco 31]
+"""
+import argparse
+from datetime import date
+from sqlalchemy import func
+from app.core.database import SessionLocal, create_tables
+from app.models import Inversor, Medicao
+from app.workers.motor_agregacao import recalcular_agregados_em_blocos
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalcula agregados_diarios")
+    parser.add_argument("--inicio", type=date.fromisoformat)
+    parser.add_argument("--fim", type=date.fromisoformat)
+    parser.add_argument("--dias-por-bloco", type=int, help="padrão: AGREGADOS_DIAS_POR_BLOCO (31)")
+    args = parser.parse_args()
+
+    create_tables(preencher_agregados=False)
+    db = SessionLocal()
+    try:
+        primeira, ultima = db.query(func.min(Medicao.timestamp), func.max(Medicao.timestamp)).one()
+        if primeira is None:
+            print("Nenhuma medição no banco.")
+            return
+        inicio = args.inicio or primeira.date()
+        fim = args.fim or ultima.date()
+        inversor_ids = [linha.id for linha in db.query(Inversor.id).order_by(Inversor.id).all()]
+
+        total = recalcular_agregados_em_blocos(db, inversor_ids, inicio, fim, args.dias_por_bloco)
+        print(f"agregados_diarios recalculada: {total} células")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
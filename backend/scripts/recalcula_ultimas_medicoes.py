@@ -0,0 +1,28 @@
+"""
+Recalcula a tabela ultimas_medicoes (medição mais recente de cada inversor) a partir das medições.
+
+A tabela é mantida pela gravação das medições (CRUD, ingestão e popula_banco). Bancos
+populados antes dela existir (ou medições inseridas direto no banco) precisam deste
+script uma vez; ele pode ser rodado de novo a qualquer momento.
+
+Uso:
+    cd backend
+    python -m scripts.recalcula_ultimas_medicoes
+"""
+from app.core.database import SessionLocal, create_tables
+from app.crud.ultima_medicao import recalcular_ultimas_medicoes
+from app.models import Inversor
+
+def main():
+    create_tables()
+    db = SessionLocal()
+    try:
+        inversor_ids = [linha.id for linha in db.query(Inversor.id).order_by(Inversor.id).all()]
+        recalcular_ultimas_medicoes(db, inversor_ids)
+        db.commit()
+        print(f"ultimas_medicoes recalculada: {len(inversor_ids)} inversores")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Verifica se a integração da geração feita no PostgreSQL (calcular_geracao_sql)
+bate com calc_inverters_generation, a implementação de referência em Python.
+
+Compara o total por inversor e a geração por dia (com o corte à meia-noite,
+em SQL e em numpy) para os inversores existentes no banco e para uma série
+sintética com os casos de borda (potência negativa, nula, timestamps repetidos, lacunas acima de 24h
+e intervalos cruzando a meia-noite). A série sintética é criada dentro de uma
+transação que é desfeita no final.
+
+Uso:
+    cd backend
+    python -m scripts.verifica_paridade_geracao
+"""
+import math
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from sqlalchemy import func
+from app.core.database import SessionLocal
+from app.models import Inversor, Medicao, Usina
+from app.workers.process_agregacao import calcular_geracao_sql
+from utils import ArrayTimeSeries, TimeSeriesValue, calc_inverters_generation, integrate_generation_by_day
+
+TOLERANCIA = 1e-6
+
+def medicoes_do_inversor(db, inversor_id, data_inicio, data_fim):
+    return db.query(Medicao.timestamp, Medicao.potencia_ativa).filter(
+        Medicao.inversor_id == inversor_id,
+        Medicao.potencia_ativa.isnot(None),
+        Medicao.timestamp >= data_inicio,
+        Medicao.timestamp <= data_fim
+    ).order_by(Medicao.timestamp, Medicao.id).all()
+
+def geracao_referencia(linhas):
+    power = [TimeSeriesValue(value=p, date=t) for t, p in linhas]
+    return calc_inverters_generation([SimpleNamespace(power=power)])
+
+def geracao_referencia_por_dia(linhas):
+    """Mesma regra do trapézio, dividindo na meia-noite os intervalos que a cruzam"""
+    por_dia = defaultdict(float)
+    for (t0, p0), (t1, p1) in zip(linhas, linhas[1:]):
+        horas = (t1 - t0).total_seconds() / 3600
+        if p0 < 0 or p1 < 0 or horas <= 0 or horas > 24:
+            continue
+        corte = max(t0, datetime.combine(t1.date(), datetime.min.time()))
+        pc = p0 + (p1 - p0) * (corte - t0).total_seconds() / (t1 - t0).total_seconds()
+        if corte > t0:
+            por_dia[t0.date()] += (p0 + pc) / 2 * (corte - t0).total_seconds() / 3600
+        if t1 > corte:
+            por_dia[corte.date()] += (pc + p1) / 2 * (t1 - corte).total_seconds() / 3600
+    return dict(por_dia)
+
+def iguais(a, b):
+    return math.isclose(a, b, rel_tol=TOLERANCIA, abs_tol=TOLERANCIA)
+
+def comparar(db, inversor_ids, data_inicio, data_fim):
+    falhas = 0
+    totais = calcular_geracao_sql(db, inversor_ids, data_inicio, data_fim)
+    dias = calcular_geracao_sql(db, inversor_ids, data_inicio, data_fim, por_dia=True)
+    for inversor_id in inversor_ids:
+        linhas = medicoes_do_inversor(db, inversor_id, data_inicio, data_fim)
+        esperado = geracao_referencia(linhas)
+        obtido = totais.get(inversor_id, 0.0)
+        ok = iguais(esperado, obtido)
+        print(f"Inversor {inversor_id}: python={esperado:.6f} sql={obtido:.6f} {'OK' if ok else 'DIVERGENTE'}")
+        falhas += not ok
+
+        esperado_dias = geracao_referencia_por_dia(linhas)
+        dias_numpy, geracoes_numpy = integrate_generation_by_day(ArrayTimeSeries.from_rows(linhas))
+        implementacoes = {
+            "sql": dias.get(inversor_id, {}),
+            "numpy": {dia.item(): float(g) for dia, g in zip(dias_numpy, geracoes_numpy)}
+        }
+        for nome, obtido_dias in implementacoes.items():
+            for dia in sorted(set(esperado_dias) | set(obtido_dias)):
+                if not iguais(esperado_dias.get(dia, 0.0), obtido_dias.get(dia, 0.0)):
+                    print(f"  {dia}: python={esperado_dias.get(dia, 0.0):.6f} {nome}={obtido_dias.get(dia, 0.0):.6f} DIVERGENTE")
+                    falhas += 1
+            if set(obtido_dias) != {t.date() for t, _ in linhas}:
+                print(f"  Dias retornados por {nome} diferentes dos dias com medição")
+                falhas += 1
+        obtido_dias = implementacoes["sql"]
+        if not iguais(sum(obtido_dias.values()), obtido):
+            print(f"  Soma dos dias ({sum(obtido_dias.values()):.6f}) diferente do total ({obtido:.6f})")
+            falhas += 1
+    return falhas
+
+def criar_serie_sintetica(db):
+    usina = Usina(nome='Paridade', localizacao='-')
+    db.add(usina)
+    db.flush()
+    inversor = Inversor(nome='Paridade', modelo='-', usina_id=usina.id)
+    db.add(inversor)
+    db.flush()
+    inicio = datetime(2020, 3, 1, 22, 0)
+    pontos = [
+        (inicio, 10.0),
+        (inicio + timedelta(minutes=90), 30.0),             # cruza a meia-noite
+        (inicio + timedelta(minutes=90), 40.0),             # timestamp repetido
+        (inicio + timedelta(hours=3), -5.0),                # potência negativa
+        (inicio + timedelta(hours=4), None),                # potência nula (ignorada)
+        (inicio + timedelta(hours=5), 20.0),
+        (inicio + timedelta(hours=30), 25.0),               # lacuna acima de 24h
+        (inicio + timedelta(hours=50), 15.0),               # 20h, cruza a meia-noite
+        (datetime(2020, 3, 5), 12.0),                       # termina exatamente à meia-noite
+        (datetime(2020, 3, 5, 0, 5), 14.0),
+    ]
+    db.add_all([
+        Medicao(inversor_id=inversor.id, timestamp=t, potencia_ativa=p, temperatura=None)
+        for t, p in pontos
+    ])
+    db.flush()
+    return inversor.id, inicio, datetime(2020, 3, 6)
+
+def main():
+    db = SessionLocal()
+    try:
+        falhas = 0
+        periodo = db.query(func.min(Medicao.timestamp), func.max(Medicao.timestamp)).one()
+        inversor_ids = [i.id for i in db.query(Inversor.id).order_by(Inversor.id).all()]
+        if periodo[0] and inversor_ids:
+            print(f"Dados do banco: {periodo[0]} a {periodo[1]}")
+            falhas += comparar(db, inversor_ids, periodo[0], periodo[1])
+
+        print("Série sintética:")
+        inversor_id, data_inicio, data_fim = criar_serie_sintetica(db)
+        falhas += comparar(db, [inversor_id], data_inicio, data_fim)
+    finally:
+        db.rollback()
+        db.close()
+
+    if falhas:
+        print(f"{falhas} divergência(s) encontrada(s)")
+        sys.exit(1)
+    print("Geração em SQL e em Python são equivalentes")
+
+if __name__ == "__main__":
+    main()
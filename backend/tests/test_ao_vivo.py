@@ -0,0 +1,114 @@
+"""
+Buffers das medições ao vivo (app.core.ao_vivo), sem banco: ordem depois de dar a volta
+no buffer, corte do preencher, energia da última hora e agrupamento da sparkline.
+"""
+import math
+import os
+import numpy as np
+import pytest
+
+# O módulo importa app.core.database, que monta a URL do banco ao ser importado (sem conectar)
+for variavel, padrao in {"POSTGRES_HOST": "localhost", "POSTGRES_PORT": "5432"}.items():
+    os.environ.setdefault(variavel, padrao)
+
+from app.core import ao_vivo
+from app.core.ao_vivo import BufferCircular
+from utils import ArrayTimeSeries, integrate_generation
+
+INICIO = np.datetime64("2025-01-01T09:00", "us")
+
+def minutos(quantidade, passo=5):
+    return INICIO + np.arange(quantidade) * np.timedelta64(passo, "m")
+
+def cheio_por_adicionar(capacidade, quantidade):
+    buffer = BufferCircular(capacidade)
+    for i, timestamp in enumerate(minutos(quantidade)):
+        assert buffer.adicionar(timestamp, float(i), 20.0 + i)
+    return buffer
+
+@pytest.mark.parametrize("quantidade", [3, 10, 11, 25, 37])
+def test_adicionar_alem_da_capacidade_mantem_as_mais_novas_em_ordem(quantidade):
+    buffer = cheio_por_adicionar(10, quantidade)
+    timestamps, potencia, temperatura = buffer.arrays()
+    esperadas = np.arange(max(quantidade - 10, 0), quantidade)
+    assert buffer.tamanho == len(esperadas)
+    assert np.array_equal(timestamps, minutos(quantidade)[esperadas])
+    assert np.array_equal(potencia, esperadas.astype(float))
+    assert np.array_equal(temperatura, 20.0 + esperadas)
+    # arrays() devolve cópias: alterar não muda o buffer
+    potencia[:] = -1
+    assert np.array_equal(buffer.arrays()[1], esperadas.astype(float))
+
+def test_adicionar_ignora_medicao_que_nao_e_mais_nova():
+    buffer = cheio_por_adicionar(4, 6)
+    ultima = buffer.arrays()[0][-1]
+    assert not buffer.adicionar(ultima, 99.0, None)
+    assert not buffer.adicionar(ultima - np.timedelta64(1, "m"), 99.0, None)
+    assert buffer.adicionar(ultima + np.timedelta64(1, "m"), None, None)
+    timestamps, potencia, temperatura = buffer.arrays()
+    assert len(timestamps) == 4 and timestamps[-1] == ultima + np.timedelta64(1, "m")
+    assert np.isnan(potencia[-1]) and np.isnan(temperatura[-1])
+
+def test_preencher_corta_as_mais_antigas_e_continua_com_adicionar():
+    buffer = cheio_por_adicionar(5, 8)
+    timestamps = minutos(12)
+    buffer.preencher(timestamps, np.arange(12.0), np.arange(12.0) + 30)
+    assert buffer.inicio == 0 and buffer.tamanho == 5
+    assert np.array_equal(buffer.arrays()[0], timestamps[7:])
+    assert np.array_equal(buffer.arrays()[1], np.arange(7.0, 12.0))
+    # Menos medições que a capacidade: o resto do buffer fica de fora
+    buffer.preencher(timestamps[:2], [1.0, 2.0], [3.0, 4.0])
+    assert buffer.tamanho == 2 and np.array_equal(buffer.arrays()[1], [1.0, 2.0])
+    novas = minutos(6, passo=60)[2:]
+    for i, timestamp in enumerate(novas[:3]):
+        assert buffer.adicionar(timestamp, 10.0 + i, None)
+    assert np.array_equal(buffer.arrays()[1], [1.0, 2.0, 10.0, 11.0, 12.0])
+    # Cheio de novo: a próxima medição dá a volta a partir da posição 0
+    assert buffer.adicionar(novas[3], 13.0, None)
+    assert buffer.inicio == 1
+    assert np.array_equal(buffer.arrays()[1], [2.0, 10.0, 11.0, 12.0, 13.0])
+
+@pytest.fixture
+def buffers(monkeypatch):
+    monkeypatch.setattr(ao_vivo, "_buffers", {})
+    return ao_vivo._buffers
+
+def test_resumo_energia_da_ultima_hora(buffers):
+    # Deu a volta no buffer: a última hora é contada a partir da medição mais nova
+    buffer = cheio_por_adicionar(30, 100)
+    buffers[1] = buffer
+    timestamps, potencia, _ = buffer.arrays()
+    resumo = ao_vivo.resumo_inversor(1)
+    ultima_hora = timestamps >= timestamps[-1] - np.timedelta64(1, "h")
+    assert ultima_hora.sum() == 13
+    esperada = integrate_generation(ArrayTimeSeries.from_arrays(timestamps[ultima_hora], potencia[ultima_hora]))
+    # Potência i na i-ésima medição: trapézio de 12 intervalos de 5 minutos entre 87 e 99
+    assert math.isclose(esperada, (87 + 99) / 2)
+    assert math.isclose(resumo["energia_ultima_hora"], esperada)
+    assert resumo["ultima_medicao"] == {
+        "timestamp": timestamps[-1].item().isoformat(), "potencia_ativa": 99.0, "temperatura": 119.0
+    }
+    assert resumo["janela"]["medicoes"] == 30
+    assert resumo["janela"]["inicio"] == timestamps[0].item().isoformat()
+
+def test_resumo_sparkline_agrupa_medicoes_consecutivas(buffers):
+    buffers[1] = cheio_por_adicionar(30, 100)
+    timestamps = buffers[1].arrays()[0]
+    sparkline = ao_vivo.resumo_inversor(1, pontos=4)["sparkline"]
+    # 30 medições (potências 70 a 99) em 4 grupos de 8, 8, 7 e 7, marcados pelo último timestamp
+    assert sparkline["potencia_ativa"] == [73.5, 81.5, 89.0, 96.0]
+    assert sparkline["timestamps"] == [timestamps[i].item().isoformat() for i in (7, 15, 22, 29)]
+    # Mais pontos que medições: uma por ponto
+    assert len(ao_vivo.resumo_inversor(1, pontos=500)["sparkline"]["potencia_ativa"]) == 30
+
+def test_resumo_grupo_sem_potencia_e_inversor_sem_buffer(buffers):
+    buffer = BufferCircular(4)
+    for i, potencia in enumerate([None, None, 5.0, 7.0]):
+        buffer.adicionar(INICIO + np.timedelta64(i, "m"), potencia, None)
+    buffers[2] = buffer
+    resumo = ao_vivo.resumo_inversor(2, pontos=2)
+    assert resumo["sparkline"]["potencia_ativa"] == [None, 6.0]
+    assert resumo["ultima_medicao"]["temperatura"] is None
+    assert ao_vivo.resumo_inversor(3) is None
+    buffers[3] = BufferCircular(4)
+    assert ao_vivo.resumo_inversor(3) is None
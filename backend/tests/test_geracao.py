@@ -0,0 +1,72 @@
+"""
+Integração da geração em Python (utils), sem banco: a geração por dia somada e os
+acumuladores em lotes devem bater com calc_inverters_generation, a implementação de referência.
+"""
+import math
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from utils import (
+    ArrayTimeSeries, DailyGenerationAccumulator, GenerationAccumulator, TimeSeriesValue,
+    calc_inverters_generation, integrate_generation, integrate_generation_by_day
+)
+
+INICIO = datetime(2020, 3, 1, 22, 0)
+# Casos de borda: meia-noite, timestamp repetido, potência negativa e nula, lacuna acima de 24h
+PONTOS = [
+    (INICIO, 10.0),
+    (INICIO + timedelta(minutes=90), 30.0),
+    (INICIO + timedelta(minutes=90), 40.0),
+    (INICIO + timedelta(hours=3), -5.0),
+    (INICIO + timedelta(hours=4), None),
+    (INICIO + timedelta(hours=5), 20.0),
+    (INICIO + timedelta(hours=30), 25.0),
+    (INICIO + timedelta(hours=50), 15.0),
+    (datetime(2020, 3, 5), 12.0),
+    (datetime(2020, 3, 5, 0, 5), 14.0),
+]
+
+def referencia(pontos):
+    return calc_inverters_generation([SimpleNamespace(power=[TimeSeriesValue(value=p, date=t) for t, p in pontos])])
+
+def serie_aleatoria(gerador, tamanho):
+    passos = gerador.choice([0, 5, 15, 60, 26 * 60], size=tamanho, p=[0.05, 0.5, 0.3, 0.1, 0.05])
+    timestamps = np.datetime64("2024-06-01T00:00", "us") + np.cumsum(passos).astype("timedelta64[m]")
+    potencias = gerador.uniform(-20, 500, size=tamanho)
+    potencias[gerador.random(tamanho) < 0.05] = np.nan
+    return ArrayTimeSeries.from_arrays(timestamps, potencias)
+
+def lotes(serie, tamanho):
+    for inicio in range(0, len(serie), tamanho):
+        yield ArrayTimeSeries(serie.timestamps[inicio:inicio + tamanho], serie.values[inicio:inicio + tamanho])
+
+def test_geracao_por_dia_somada_igual_a_referencia():
+    esperado = referencia(PONTOS)
+    serie = ArrayTimeSeries.from_rows(PONTOS)
+    dias, geracoes = integrate_generation_by_day(serie)
+    assert esperado > 0
+    assert math.isclose(geracoes.sum(), esperado)
+    assert math.isclose(integrate_generation(serie), esperado)
+    assert set(dias.tolist()) == {t.date() for t, p in PONTOS if p is not None}
+
+@pytest.mark.parametrize("semente", range(20))
+def test_geracao_por_dia_aleatoria_igual_a_referencia(semente):
+    serie = serie_aleatoria(np.random.default_rng(semente), 300)
+    pontos = [(t.item(), None if np.isnan(p) else float(p)) for t, p in zip(serie.timestamps.view("datetime64[us]"), serie.values)]
+    assert math.isclose(integrate_generation_by_day(serie)[1].sum(), referencia(pontos), rel_tol=1e-9, abs_tol=1e-9)
+
+@pytest.mark.parametrize("tamanho_lote", [1, 2, 7, 64, 1000])
+def test_acumuladores_em_lotes_iguais_ao_calculo_inteiro(tamanho_lote):
+    serie = serie_aleatoria(np.random.default_rng(42), 500)
+    dias, geracoes = integrate_generation_by_day(serie)
+    total, por_dia = GenerationAccumulator(), DailyGenerationAccumulator()
+    for lote in lotes(serie, tamanho_lote):
+        total.add(lote)
+        por_dia.add(lote)
+    assert math.isclose(total.total, integrate_generation(serie), rel_tol=1e-9)
+    assert math.isclose(por_dia.total, total.total, rel_tol=1e-9)
+    esperado = dict(zip(dias.tolist(), geracoes.tolist()))
+    assert set(por_dia.days) == set(esperado)
+    for dia, geracao in esperado.items():
+        assert math.isclose(por_dia.days[dia], geracao, rel_tol=1e-9, abs_tol=1e-9), dia
@@ -0,0 +1,95 @@
+"""
+utils.GenerationQualityAccumulator, sem banco: lacunas que atravessam lotes, lacuna
+aberta no fim da série e as energias estimadas pelas políticas linear e clear_sky.
+"""
+import math
+from dataclasses import asdict
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from utils import ArrayTimeSeries, GAP_POLICIES, GenerationQualityAccumulator, generation_quality, integrate_generation
+from tests.test_geracao import lotes, serie_aleatoria
+
+DIA = datetime(2025, 1, 1)
+P = 100.0
+
+def serie(pontos):
+    return ArrayTimeSeries.from_rows([(DIA + timedelta(hours=horas), potencia) for horas, potencia in pontos])
+
+# Um dia inteiro válido (potência constante, de hora em hora), o começo do dia seguinte
+# até 09h UTC e uma lacuna de 09h às 16h UTC, aberta pela potência negativa das 12h
+PONTOS_COM_LACUNA = [(h, P) for h in range(25)] + [(33, P), (36, -1.0), (40, P)]
+
+def test_linear_preenche_com_trapezio_entre_as_medicoes_da_lacuna():
+    qualidade = generation_quality(serie(PONTOS_COM_LACUNA), "linear")
+    assert math.isclose(qualidade.energy, 33 * P)
+    assert math.isclose(qualidade.interpolated_energy, 7 * P)
+    assert qualidade.gap_count == 1
+    assert math.isclose(qualidade.gap_hours, 7) and math.isclose(qualidade.longest_gap_hours, 7)
+    assert math.isclose(qualidade.coverage, 33 / 40)
+
+@pytest.mark.parametrize("fuso", [0, -3])
+def test_clear_sky_escala_a_curva_pela_energia_dos_intervalos_validos(fuso):
+    # Curva de 6h às 18h locais: a integral de 0 a h horas de luz é 12/pi * (1 - cos(pi * h / 12))
+    def curva(h):
+        return 12 / math.pi * (1 - math.cos(math.pi * min(max(h, 0), 12) / 12))
+    nascer_utc = 6 - fuso
+    # Intervalos válidos: o primeiro dia inteiro e o segundo até 09h UTC
+    curva_valida = curva(12) + curva(9 - nascer_utc)
+    curva_lacuna = curva(16 - nascer_utc) - curva(9 - nascer_utc)
+    qualidade = generation_quality(serie(PONTOS_COM_LACUNA), "clear_sky", utc_offset_hours=fuso)
+    assert math.isclose(qualidade.interpolated_energy, 33 * P / curva_valida * curva_lacuna)
+    assert math.isclose(qualidade.total_energy, qualidade.energy + qualidade.interpolated_energy)
+
+def test_clear_sky_fuso_desloca_a_janela_de_luz():
+    # Lacuna de 09h às 21h UTC: é o dia de luz inteiro em UTC-3, mas só metade dele em UTC
+    pontos = [(h, P) for h in range(25)] + [(33, P), (39, -1.0), (45, P)]
+    em_utc = generation_quality(serie(pontos), "clear_sky")
+    em_brasilia = generation_quality(serie(pontos), "clear_sky", utc_offset_hours=-3)
+    assert em_brasilia.interpolated_energy > em_utc.interpolated_energy
+    assert em_brasilia.energy == em_utc.energy
+
+def test_lacuna_aberta_no_fim_e_continuada_no_proximo_lote():
+    acumulador = GenerationQualityAccumulator("linear")
+    acumulador.add(serie([(0, P), (1, P), (2, -1.0)]))
+    aberta = acumulador.result()
+    assert aberta.gap_count == 1
+    assert math.isclose(aberta.gap_hours, 1)
+    # A potência negativa do fim da lacuna conta como zero
+    assert math.isclose(aberta.interpolated_energy, P / 2)
+    # result() não fecha a lacuna: ela continua no lote seguinte
+    acumulador.add(serie([(3, -1.0), (4, P), (5, P)]))
+    fechada = acumulador.result()
+    assert fechada.gap_count == 1
+    assert math.isclose(fechada.gap_hours, 3)
+    assert math.isclose(fechada.interpolated_energy, 3 * P)
+    assert math.isclose(fechada.energy, 2 * P)
+    assert asdict(fechada) == asdict(acumulador.result())
+
+def test_lacuna_atravessando_lotes_de_uma_medicao():
+    pontos = [(0, P), (1, -1.0), (2, -1.0), (3, -1.0), (4, P), (5, P), (30, P), (31, P)]
+    inteira = generation_quality(serie(pontos), "linear")
+    acumulador = GenerationQualityAccumulator("linear")
+    for lote in lotes(serie(pontos), 1):
+        acumulador.add(lote)
+    assert asdict(acumulador.result()) == pytest.approx(asdict(inteira))
+    # Duas lacunas: a das potências negativas (4h) e o intervalo acima de 24h (25h)
+    assert inteira.gap_count == 2
+    assert math.isclose(inteira.gap_hours, 29) and math.isclose(inteira.longest_gap_hours, 25)
+
+@pytest.mark.parametrize("politica", GAP_POLICIES)
+@pytest.mark.parametrize("tamanho_lote", [1, 2, 7, 64])
+def test_lotes_iguais_ao_calculo_inteiro(politica, tamanho_lote):
+    serie_inteira = serie_aleatoria(np.random.default_rng(3), 500)
+    inteira = generation_quality(serie_inteira, politica, utc_offset_hours=-3)
+    acumulador = GenerationQualityAccumulator(politica, utc_offset_hours=-3)
+    for lote in lotes(serie_inteira, tamanho_lote):
+        acumulador.add(lote)
+    em_lotes = asdict(acumulador.result())
+    politica_lotes = em_lotes.pop("policy")
+    assert politica_lotes == politica
+    esperado = asdict(inteira)
+    esperado.pop("policy")
+    assert em_lotes == pytest.approx(esperado, rel=1e-9, abs=1e-9)
+    assert math.isclose(inteira.energy, integrate_generation(serie_inteira), rel_tol=1e-9, abs_tol=1e-9)
+    assert inteira.gap_count > 0
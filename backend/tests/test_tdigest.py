@@ -0,0 +1,75 @@
+"""
+utils.TDigest, sem banco: precisão dos quantis contra np.percentile (medida em posição
+na distribuição), combinação de digests de vários dias, serialização e casos vazios.
+"""
+import numpy as np
+import pytest
+from utils import TDigest
+
+QUANTIS = [0.0, 0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99, 1.0]
+
+def valores_aleatorios(semente, tamanho=20000):
+    gerador = np.random.default_rng(semente)
+    # Potência de um dia: metade da noite em zero, o resto numa curva assimétrica
+    return np.where(gerador.random(tamanho) < 0.5, 0.0, gerador.gamma(2.0, 150.0, size=tamanho))
+
+def erro_de_posicao(valores, estimativas, quantis):
+    """Distância entre o quantil pedido e a posição (fração de valores) do valor estimado"""
+    ordenados = np.sort(valores)
+    abaixo = np.searchsorted(ordenados, estimativas, side="left") / len(ordenados)
+    ate = np.searchsorted(ordenados, estimativas, side="right") / len(ordenados)
+    quantis = np.asarray(quantis)
+    return np.where((quantis >= abaixo) & (quantis <= ate), 0.0, np.minimum(abs(quantis - abaixo), abs(quantis - ate)))
+
+@pytest.mark.parametrize("semente", range(5))
+def test_quantis_proximos_de_np_percentile(semente):
+    valores = valores_aleatorios(semente)
+    digest = TDigest.from_values(valores)
+    estimativas = digest.quantile(QUANTIS)
+    assert digest.count == len(valores)
+    assert len(digest.means) < len(valores) / 20
+    assert estimativas[0] == valores.min() and estimativas[-1] == valores.max()
+    assert erro_de_posicao(valores, estimativas, QUANTIS).max() < 0.005
+
+@pytest.mark.parametrize("semente", range(5))
+def test_quantis_de_distribuicao_continua_proximos_em_valor(semente):
+    # Sem o degrau dos zeros da noite, o valor estimado também fica perto de np.percentile
+    valores = np.random.default_rng(semente).gamma(2.0, 150.0, size=20000)
+    estimativas = TDigest.from_values(valores).quantile(QUANTIS)
+    assert np.allclose(estimativas, np.percentile(valores, np.array(QUANTIS) * 100), rtol=0.02)
+
+def test_combinar_dias_igual_ao_digest_de_todos_os_valores():
+    dias = [valores_aleatorios(semente, 2000) for semente in range(30)]
+    todos = np.concatenate(dias)
+    combinado = TDigest.merge(TDigest.from_values(dia) for dia in dias)
+    direto = TDigest.from_values(todos)
+    assert combinado.count == direto.count == len(todos)
+    assert combinado.min == todos.min() and combinado.max == todos.max()
+    assert erro_de_posicao(todos, combinado.quantile(QUANTIS), QUANTIS).max() < 0.005
+    # Combinar de novo um resultado combinado não perde precisão
+    metades = [TDigest.merge(TDigest.from_values(dia) for dia in parte) for parte in (dias[:15], dias[15:])]
+    em_dois_niveis = TDigest.merge(metades)
+    assert erro_de_posicao(todos, em_dois_niveis.quantile(QUANTIS), QUANTIS).max() < 0.005
+
+def test_serializacao_ida_e_volta():
+    digest = TDigest.from_values(valores_aleatorios(7), compression=100)
+    lido = TDigest.from_bytes(digest.to_bytes())
+    assert lido.compression == 100
+    assert lido.min == digest.min and lido.max == digest.max
+    assert np.array_equal(lido.means, digest.means) and np.array_equal(lido.weights, digest.weights)
+    assert np.array_equal(lido.quantile(QUANTIS), digest.quantile(QUANTIS))
+
+@pytest.mark.parametrize("valores", [[], [np.nan, np.nan]], ids=["vazio", "so_nan"])
+def test_digest_vazio(valores):
+    digest = TDigest.from_values(valores)
+    assert digest.count == 0
+    assert np.isnan(digest.quantile(QUANTIS)).all()
+    lido = TDigest.from_bytes(digest.to_bytes())
+    assert lido.count == 0 and np.isnan(lido.min) and np.isnan(lido.max)
+    # Digests vazios são ignorados na combinação
+    assert TDigest.merge([digest, lido]).count == 0
+    assert TDigest.merge([digest, TDigest.from_values([3.0, np.nan, 1.0])]).quantile([0.0, 1.0]).tolist() == [1.0, 3.0]
+
+def test_valor_unico():
+    digest = TDigest.from_values([42.0] * 10)
+    assert digest.quantile(QUANTIS).tolist() == [42.0] * len(QUANTIS)
@@ -1,6 +1,20 @@
 from dataclasses import dataclass
-from datetime import datetime
-from typing import Protocol
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional, Protocol
+
+import numpy as np
+import pandas as pd
+
+# Microseconds in one hour, used to turn epoch deltas into hours
+_US_PER_HOUR = 3_600_000_000
+_US_PER_DAY = 24 * _US_PER_HOUR
+# Pairs further apart than this are treated as a gap and not integrated
+MAX_GAP_HOURS = 24
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ONE_US = timedelta(microseconds=1)
+_MISSING_TIMESTAMP = np.iinfo(np.int64).min
 
 
 @dataclass
@@ -13,35 +27,430 @@ class EntityWithPower(Protocol):
     power: list[TimeSeriesValue]
 
 
+@dataclass
+class ArrayTimeSeries:
+    """
+    Array-backed time series: epoch microseconds (int64) and values (float64).
+
+    Points with a missing value or date are kept as NaN so that both pairs
+    touching them are skipped by the integrator, as in the list-based version.
+    """
+    timestamps: np.ndarray
+    values: np.ndarray
+
+    @classmethod
+    def from_arrays(cls, dates, values) -> "ArrayTimeSeries":
+        """Accepts a datetime64 array or any sequence of datetimes (None allowed)."""
+        if not (isinstance(dates, np.ndarray) and dates.dtype.kind == "M"):
+            try:
+                # Much faster than letting numpy parse each datetime object
+                dates = pd.DatetimeIndex(dates).values
+            except (TypeError, ValueError):
+                # Mixed naive/aware dates or non-date objects: convert one by one
+                dates = np.fromiter(map(_epoch_us, dates), dtype=np.int64, count=len(dates)).view("datetime64[us]")
+        # NaT is stored as the minimum int64 in any unit
+        timestamps = dates.astype("datetime64[us]").view(np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        invalid_date = timestamps == _MISSING_TIMESTAMP
+        if invalid_date.any():
+            timestamps = np.where(invalid_date, 0, timestamps)
+            values = np.where(invalid_date, np.nan, values)
+        return cls(timestamps=timestamps, values=values)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[tuple[Optional[datetime], Optional[float]]]) -> "ArrayTimeSeries":
+        """Builds a series from (date, value) rows, e.g. the result of a SQL query."""
+        rows = list(rows)
+        return cls.from_arrays([r[0] for r in rows], [r[1] for r in rows])
+
+    @classmethod
+    def from_values(cls, points: Iterable[TimeSeriesValue]) -> "ArrayTimeSeries":
+        points = list(points)
+        dates = [getattr(p, "date", None) for p in points]
+        values = [getattr(p, "value", None) for p in points]
+        try:
+            values = np.asarray(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            values = [_as_float(v) for v in values]
+        return cls.from_arrays(dates, values)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+def _epoch_us(date) -> int:
+    try:
+        epoch = _EPOCH if date.tzinfo is None else _EPOCH_UTC
+        return (date - epoch) // _ONE_US
+    except (AttributeError, TypeError):
+        return _MISSING_TIMESTAMP
+
+
+def _as_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _valid_pairs(series: ArrayTimeSeries):
+    """Consecutive pairs (t0, t1, p0, p1) that enter the integration."""
+    t0, t1 = series.timestamps[:-1], series.timestamps[1:]
+    p0, p1 = series.values[:-1], series.values[1:]
+    delta_time = (t1 - t0) / _US_PER_HOUR
+
+    # Comparisons with NaN are False, so missing values are dropped here too
+    valid = (
+        (p0 >= 0)
+        & (p1 >= 0)
+        & (delta_time > 0)
+        & (delta_time <= MAX_GAP_HOURS)
+    )
+    return t0[valid], t1[valid], p0[valid], p1[valid]
+
+
+def integrate_generation(series: ArrayTimeSeries) -> float:
+    """
+    Trapezoidal integration of power over time (power unit x hours).
+
+    A pair of consecutive points is skipped when either value is negative or
+    missing, or when the time delta is not positive or exceeds MAX_GAP_HOURS.
+    """
+    if len(series) < 2:
+        return 0.0
+
+    t0, t1, p0, p1 = _valid_pairs(series)
+    return float(np.sum((p0 + p1) / 2 * (t1 - t0) / _US_PER_HOUR))
+
+
+def integrate_generation_by_day(series: ArrayTimeSeries) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Same integration as integrate_generation, bucketed into calendar days.
+
+    Intervals that cross midnight are split there, with the power at the cut
+    linearly interpolated, so the daily values add up to the total. An interval
+    ending exactly at midnight belongs to the previous day. Returns the days
+    (datetime64[D]) that have at least one valid reading and their energy.
+    """
+    readings = series.timestamps[~np.isnan(series.values)]
+    days = np.unique(readings // _US_PER_DAY)
+    energy = np.zeros(len(days))
+    if len(series) < 2 or not len(days):
+        return days.astype("datetime64[D]"), energy
+
+    t0, t1, p0, p1 = _valid_pairs(series)
+    cut = np.maximum(t0, t1 // _US_PER_DAY * _US_PER_DAY)
+    p_cut = p0 + (p1 - p0) * (cut - t0) / (t1 - t0)
+
+    before = cut > t0
+    after = t1 > cut
+    part_days = np.concatenate((t0[before] // _US_PER_DAY, cut[after] // _US_PER_DAY))
+    part_energy = np.concatenate((
+        ((p0 + p_cut) / 2 * (cut - t0) / _US_PER_HOUR)[before],
+        ((p_cut + p1) / 2 * (t1 - cut) / _US_PER_HOUR)[after],
+    ))
+    np.add.at(energy, np.searchsorted(days, part_days), part_energy)
+    return days.astype("datetime64[D]"), energy
+
+
+class GenerationAccumulator:
+    """
+    Integrates one series fed in consecutive chunks, keeping only the last point
+    between them so that memory does not grow with the length of the series.
+    """
+
+    def __init__(self) -> None:
+        self.total = 0.0
+        self._last: Optional[tuple[int, float]] = None
+
+    def add(self, chunk: ArrayTimeSeries) -> None:
+        if not len(chunk):
+            return
+        chunk = self._with_last(chunk)
+        self.total += integrate_generation(chunk)
+
+    def _with_last(self, chunk: ArrayTimeSeries) -> ArrayTimeSeries:
+        """Prepends the last point of the previous chunk, so the pair between them is integrated."""
+        if self._last is not None:
+            chunk = ArrayTimeSeries(
+                timestamps=np.concatenate(([self._last[0]], chunk.timestamps)),
+                values=np.concatenate(([self._last[1]], chunk.values)),
+            )
+        self._last = (chunk.timestamps[-1], chunk.values[-1])
+        return chunk
+
+
+class DailyGenerationAccumulator(GenerationAccumulator):
+    """
+    Chunked version of integrate_generation_by_day. Memory grows with the number
+    of days in the series, not with the number of readings.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.days: dict = {}
+
+    def add(self, chunk: ArrayTimeSeries) -> None:
+        if not len(chunk):
+            return
+        chunk = self._with_last(chunk)
+        days, energy = integrate_generation_by_day(chunk)
+        for day, value in zip(days.tolist(), energy.tolist()):
+            self.days[day] = self.days.get(day, 0.0) + value
+        self.total += float(energy.sum())
+
+
+# How intervals left out of the integration are filled in generation_quality
+GAP_POLICIES = ("skip", "linear", "clear_sky")
+# Daylight window (local hours of the day) of the clear-sky shape, a half sine wave
+CLEAR_SKY_SUNRISE_HOUR = 6
+CLEAR_SKY_SUNSET_HOUR = 18
+
+
+def _clear_sky_cumulative(timestamps: np.ndarray, utc_offset_hours: float = 0.0) -> np.ndarray:
+    """
+    Integral (peak x hours) of the clear-sky shape from the epoch up to each timestamp.
+    Timestamps are UTC; utc_offset_hours moves the daylight window to local time
+    (e.g. -3 puts 06-18 local at 09-21 UTC).
+    """
+    day_length = CLEAR_SKY_SUNSET_HOUR - CLEAR_SKY_SUNRISE_HOUR
+    local = np.asarray(timestamps, dtype=np.int64) + int(round(utc_offset_hours * _US_PER_HOUR))
+    days, rest = np.divmod(local, _US_PER_DAY)
+    hours = np.clip(rest / _US_PER_HOUR - CLEAR_SKY_SUNRISE_HOUR, 0, day_length)
+    return days * (2 * day_length / np.pi) + day_length / np.pi * (1 - np.cos(np.pi * hours / day_length))
+
+
+@dataclass
+class GenerationQuality:
+    """
+    Integrated energy (same value as integrate_generation) and how much of the
+    series it actually covers. A gap is a run of consecutive pairs left out of the
+    integration; interpolated_energy is the estimate for the gaps under the policy.
+    """
+    energy: float
+    interpolated_energy: float
+    coverage: float
+    gap_count: int
+    gap_hours: float
+    longest_gap_hours: float
+    policy: str
+
+    @property
+    def total_energy(self) -> float:
+        return self.energy + self.interpolated_energy
+
+
+class GenerationQualityAccumulator(GenerationAccumulator):
+    """
+    Chunked generation with coverage and gap metrics, computed from the same pairs
+    as the energy. Gap policies: "skip" (gaps add nothing), "linear" (a trapezoid
+    between the readings around the gap, negative or missing ones counted as zero)
+    and "clear_sky" (the clear-sky shape over the gap, scaled by the ratio between
+    the measured energy and the shape over the valid intervals). utc_offset_hours
+    places the shape's daylight window in the plant's local time.
+    """
+
+    def __init__(self, gap_policy: str = "skip", utc_offset_hours: float = 0.0) -> None:
+        if gap_policy not in GAP_POLICIES:
+            raise ValueError(f"Unknown gap policy: {gap_policy}. Available: {GAP_POLICIES}")
+        super().__init__()
+        self.gap_policy = gap_policy
+        self.utc_offset_hours = utc_offset_hours
+        self._covered_us = 0
+        self._span_us = 0
+        self._gap_count = 0
+        self._gap_us = 0
+        self._longest_gap_us = 0
+        self._linear_fill = 0.0
+        self._valid_shape = 0.0
+        self._gap_shape = 0.0
+        # Start and end (timestamp, value, timestamp, value) of a gap still open at the end of the last chunk
+        self._open_gap: Optional[tuple[int, float, int, float]] = None
+
+    def add(self, chunk: ArrayTimeSeries) -> None:
+        if not len(chunk):
+            return
+        chunk = self._with_last(chunk)
+        t0, t1 = chunk.timestamps[:-1], chunk.timestamps[1:]
+        p0, p1 = chunk.values[:-1], chunk.values[1:]
+        # Pairs with no time between them neither cover the series nor open a gap
+        forward = t1 > t0
+        t0, t1, p0, p1 = t0[forward], t1[forward], p0[forward], p1[forward]
+        if not len(t0):
+            return
+        delta = t1 - t0
+        valid = (p0 >= 0) & (p1 >= 0) & (delta <= MAX_GAP_HOURS * _US_PER_HOUR)
+
+        self.total += float(np.sum(((p0 + p1) / 2 * delta / _US_PER_HOUR)[valid]))
+        self._covered_us += int(delta[valid].sum())
+        self._span_us += int(delta.sum())
+        if self.gap_policy == "clear_sky":
+            shape = self._clear_sky(t1[valid]) - self._clear_sky(t0[valid])
+            self._valid_shape += float(shape.sum())
+
+        # Runs of consecutive invalid pairs: first and last pair of each run
+        edges = np.diff(np.concatenate(([0], (~valid).astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1) - 1
+        start_t, start_p = t0[starts], p0[starts]
+        if self._open_gap is not None:
+            if len(starts) and starts[0] == 0:
+                # The gap open in the previous chunk goes on in this one
+                start_t[0], start_p[0] = self._open_gap[:2]
+            else:
+                self._record_gaps(*(np.array([value]) for value in self._open_gap))
+            self._open_gap = None
+        if len(ends) and ends[-1] == len(valid) - 1:
+            # A gap reaching the end of the chunk may continue in the next one
+            self._open_gap = (start_t[-1], start_p[-1], t1[-1], p1[-1])
+            start_t, start_p, ends = start_t[:-1], start_p[:-1], ends[:-1]
+        self._record_gaps(start_t, start_p, t1[ends], p1[ends])
+
+    def _record_gaps(self, start_t, start_p, end_t, end_p) -> None:
+        if not len(start_t):
+            return
+        duration = end_t - start_t
+        self._gap_count += len(duration)
+        self._gap_us += int(duration.sum())
+        self._longest_gap_us = max(self._longest_gap_us, int(duration.max()))
+        if self.gap_policy == "linear":
+            # Comparisons with NaN are False, so missing readings count as zero too
+            start_p = np.where(start_p >= 0, start_p, 0.0)
+            end_p = np.where(end_p >= 0, end_p, 0.0)
+            self._linear_fill += float(np.sum((start_p + end_p) / 2 * duration / _US_PER_HOUR))
+        elif self.gap_policy == "clear_sky":
+            self._gap_shape += float(np.sum(self._clear_sky(end_t) - self._clear_sky(start_t)))
+
+    def _clear_sky(self, timestamps) -> np.ndarray:
+        return _clear_sky_cumulative(timestamps, self.utc_offset_hours)
+
+    def result(self) -> GenerationQuality:
+        gap_count, gap_us, longest_gap_us = self._gap_count, self._gap_us, self._longest_gap_us
+        linear_fill, gap_shape = self._linear_fill, self._gap_shape
+        if self._open_gap is not None:
+            # Closes the trailing gap without changing the accumulator, which may still get chunks
+            start_t, start_p, end_t, end_p = self._open_gap
+            duration = int(end_t - start_t)
+            gap_count += 1
+            gap_us += duration
+            longest_gap_us = max(longest_gap_us, duration)
+            start_p = start_p if start_p >= 0 else 0.0
+            end_p = end_p if end_p >= 0 else 0.0
+            linear_fill += (start_p + end_p) / 2 * duration / _US_PER_HOUR
+            gap_shape += float(np.diff(self._clear_sky(np.array([start_t, end_t])))[0])
+
+        if self.gap_policy == "linear":
+            interpolated = linear_fill
+        elif self.gap_policy == "clear_sky" and self._valid_shape > 0:
+            interpolated = self.total / self._valid_shape * gap_shape
+        else:
+            interpolated = 0.0
+        return GenerationQuality(
+            energy=self.total,
+            interpolated_energy=float(interpolated),
+            coverage=self._covered_us / self._span_us if self._span_us else 0.0,
+            gap_count=gap_count,
+            gap_hours=gap_us / _US_PER_HOUR,
+            longest_gap_hours=longest_gap_us / _US_PER_HOUR,
+            policy=self.gap_policy,
+        )
+
+
+def generation_quality(series: ArrayTimeSeries, gap_policy: str = "skip", utc_offset_hours: float = 0.0) -> GenerationQuality:
+    """integrate_generation plus coverage, gaps and gap-filled energy, in one pass over the pairs."""
+    accumulator = GenerationQualityAccumulator(gap_policy, utc_offset_hours)
+    accumulator.add(series)
+    return accumulator.result()
+
+
+def calc_series_generation(series_list: Iterable[ArrayTimeSeries]) -> float:
+    return float(sum(integrate_generation(series) for series in series_list))
+
+
 def calc_inverters_generation(entities_with_power: list[EntityWithPower]) -> float:
+    """Compatibility wrapper over integrate_generation for lists of TimeSeriesValue."""
     if not entities_with_power:
         return 0.0
 
-    total_generation = 0.0
+    return calc_series_generation(
+        ArrayTimeSeries.from_values(entity.power) for entity in entities_with_power
+    )
 
-    for entity in entities_with_power:
-        if len(entity.power) < 2:
-            continue
 
-        for i in range(len(entity.power) - 1):
-            try:
-                cur_power = entity.power[i].value
-                next_power = entity.power[i + 1].value
+class TDigest:
+    """
+    Mergeable quantile sketch (merging t-digest with the k1 scale function).
+
+    Values are summarised as centroids (mean, weight) that are small near the
+    tails and large around the median, so extreme quantiles stay accurate.
+    Digests built on different days or inverters can be merged exactly as if
+    they had been built from all the values at once, up to the compression.
+    """
+
+    def __init__(self, means=None, weights=None, minimum=np.nan, maximum=np.nan, compression: int = 200) -> None:
+        self.means = np.asarray(means if means is not None else [], dtype=np.float64)
+        self.weights = np.asarray(weights if weights is not None else [], dtype=np.float64)
+        self.min = float(minimum)
+        self.max = float(maximum)
+        self.compression = compression
+
+    @classmethod
+    def from_values(cls, values, compression: int = 200) -> "TDigest":
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return cls(compression=compression)
+        digest = cls(values, np.ones(len(values)), values.min(), values.max(), compression)
+        return digest._compress()
 
-                if cur_power < 0 or next_power < 0:
-                    continue
+    @classmethod
+    def merge(cls, digests: Iterable["TDigest"], compression: int = 200) -> "TDigest":
+        digests = [d for d in digests if d.count]
+        if not digests:
+            return cls(compression=compression)
+        merged = cls(
+            np.concatenate([d.means for d in digests]),
+            np.concatenate([d.weights for d in digests]),
+            min(d.min for d in digests),
+            max(d.max for d in digests),
+            compression,
+        )
+        return merged._compress()
 
-                delta_time = (
-                    entity.power[i + 1].date - entity.power[i].date
-                ).total_seconds() / 3600
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
 
-                if delta_time <= 0 or delta_time > 24:
-                    continue
+    def _compress(self) -> "TDigest":
+        order = np.argsort(self.means, kind="stable")
+        means, weights = self.means[order], self.weights[order]
+        total = weights.sum()
+        # Position of each centroid on the k1 scale; centroids in the same unit interval are merged
+        q_mid = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q_mid - 1)
+        groups = np.floor(k - k.min()).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        merged_weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / merged_weights
+        self.weights = merged_weights
+        return self
 
-                generation = (cur_power + next_power) / 2 * delta_time
-                total_generation += generation
+    def quantile(self, q) -> np.ndarray:
+        """Quantiles (0..1) interpolated between centroid midpoints, the minimum and the maximum."""
+        q = np.asarray(q, dtype=np.float64)
+        if not self.count:
+            return np.full(q.shape, np.nan)
+        positions = np.cumsum(self.weights) - self.weights / 2
+        xp = np.concatenate(([0.0], positions, [self.count]))
+        fp = np.concatenate(([self.min], self.means, [self.max]))
+        return np.interp(q * self.count, xp, fp)
 
-            except (AttributeError, TypeError):
-                continue
+    def to_bytes(self) -> bytes:
+        header = np.array([len(self.means), self.min, self.max, self.compression], dtype=np.float64)
+        return np.concatenate((header, self.means, self.weights)).tobytes()
 
-    return total_generation
\ No newline at end of file
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TDigest":
+        array = np.frombuffer(data, dtype=np.float64)
+        size = int(array[0])
+        return cls(array[4:4 + size], array[4 + size:4 + 2 * size], array[1], array[2], int(array[3]))
@@ -4,6 +4,8 @@ from datetime import date
 import os
 import json
 import re
+import numpy as np
+import matplotlib.pyplot as plt
 
 API_URL = "http://localhost:8000"
 
@@ -12,7 +14,8 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__fil
 RESULTS_DIR = os.path.join(BASE_DIR, "backend", "app", "workers", "results_analises")
 
 def requisicao_agregacao(endpoint, payload):
-    resp = requests.post(f"{API_URL}/agregacao/{endpoint}", json=payload)
+    # Períodos pequenos são respondidos na hora (200); os maiores vão para a fila (202)
+    resp = requests.get(f"{API_URL}/agregacao/{endpoint}", params=payload)
     if resp.status_code == 202:
         return None, resp.json().get("msg", "Processamento assíncrono iniciado.")
     elif resp.ok:
@@ -20,6 +23,71 @@ def requisicao_agregacao(endpoint, payload):
     else:
         return None, f"Erro: {resp.text}"
 
+def exibir_agregacao(endpoint, payload):
+    dado, msg = requisicao_agregacao(endpoint, payload)
+    if dado is None:
+        st.info(msg or "Aguardando processamento")
+        return
+    st.write("**Resultado:**")
+    exibir_resultado(dado['resultado'])
+
+def exibir_resultado(resultado):
+    if isinstance(resultado, list) and resultado and isinstance(resultado[0], dict):
+        st.dataframe(resultado)
+    elif isinstance(resultado, dict) and 'geracao_total' in resultado:
+        # Geração da usina ou de um lote de inversores: total e detalhamento por inversor
+        st.write(f"Geração total: {resultado['geracao_total']}")
+        st.dataframe(resultado['por_inversor'])
+    elif isinstance(resultado, dict) and 'por_inversor' in resultado:
+        # Lote de inversores: uma tabela por dia com uma linha para cada inversor
+        st.dataframe([
+            {"inversor_id": secao["inversor_id"], **dia}
+            for secao in resultado['por_inversor'] for dia in secao['dias']
+        ])
+    else:
+        st.write(resultado)
+
+def exibir_comparativo(payload):
+    resp = requests.post(f"{API_URL}/agregacao/comparativo", json=payload)
+    if not resp.ok:
+        st.error(f"Erro: {resp.text}")
+        return
+    linhas = []
+    for linha in resp.json()["linhas"]:
+        item = {chave: valor for chave, valor in linha.items() if not isinstance(valor, dict)}
+        for metrica in ("geracao", "potencia_maxima", "temperatura_media"):
+            for campo in ("atual", "referencia", "delta", "variacao_percentual"):
+                item[f"{metrica} ({campo})"] = linha[metrica][campo]
+        linhas.append(item)
+    if linhas:
+        st.dataframe(linhas)
+    else:
+        st.info("Nenhum dado encontrado nos períodos.")
+
+def exibir_mapa_calor(payload):
+    resp = requests.get(f"{API_URL}/agregacao/mapa_calor", params=payload)
+    if not resp.ok:
+        st.error(f"Erro: {resp.text}")
+        return
+    mapa = resp.json()
+    if not mapa["usinas"]:
+        st.info("Nenhum dado encontrado no período.")
+    for usina in mapa["usinas"]:
+        # Horas sem medições (None) ficam em branco
+        valores = np.array(usina["valores"], dtype=float).T
+        fig, ax = plt.subplots(figsize=(10, 4))
+        imagem = ax.imshow(valores, aspect="auto", origin="lower", cmap="viridis")
+        ax.set_title(f"Usina {usina['usina_id']} - {mapa['metrica']}")
+        ax.set_xlabel("Dia")
+        ax.set_ylabel("Hora do dia")
+        passo = max(len(mapa["dias"]) // 10, 1)
+        ax.set_xticks(range(0, len(mapa["dias"]), passo))
+        ax.set_xticklabels(mapa["dias"][::passo], rotation=45, ha="right")
+        fig.colorbar(imagem, ax=ax)
+        fig.tight_layout()
+        st.pyplot(fig)
+        plt.close(fig)
+
 def extrai_data_nome_arquivo(nome):
     # Espera formato: tipo_YYYYMMDD_HHMMSS.json
     m = re.search(r'_(\d{8}_\d{6})', nome)
@@ -34,7 +102,9 @@ def render_analises():
         "Potência máxima por dia",
         "Média da temperatura por dia",
         "Geração da usina por período",
-        "Geração do inversor por período"
+        "Geração do inversor por período",
+        "Comparativo entre períodos",
+        "Mapa de calor por hora"
     ])
 
     data_inicio = st.date_input("Data início", value=date.today().replace(day=1))
@@ -48,8 +118,7 @@ def render_analises():
                 "data_inicio": data_inicio.isoformat(),
                 "data_fim": data_fim.isoformat()
             }
-            _, msg = requisicao_agregacao("potencia_maxima", payload)
-            st.info(msg or "Aguardando processamento")
+            exibir_agregacao("potencia_maxima", payload)
 
     elif tipo_analise == "Média da temperatura por dia":
         inversor_id = st.number_input("ID do Inversor", min_value=1, step=1, key="inv_temp")
@@ -59,8 +128,7 @@ def render_analises():
                 "data_inicio": data_inicio.isoformat(),
                 "data_fim": data_fim.isoformat()
             }
-            _, msg = requisicao_agregacao("media_temperatura", payload)
-            st.info(msg or "Aguardando processamento")
+            exibir_agregacao("media_temperatura", payload)
 
     elif tipo_analise == "Geração da usina por período":
         usina_id = st.number_input("ID da Usina", min_value=1, step=1, key="usina_ger")
@@ -70,8 +138,7 @@ def render_analises():
                 "data_inicio": data_inicio.isoformat(),
                 "data_fim": data_fim.isoformat()
             }
-            _, msg = requisicao_agregacao("geracao_usina", payload)
-            st.info(msg or "Aguardando processamento")
+            exibir_agregacao("geracao_usina", payload)
 
     elif tipo_analise == "Geração do inversor por período":
         inversor_id = st.number_input("ID do Inversor", min_value=1, step=1, key="inv_ger")
@@ -81,8 +148,33 @@ def render_analises():
                 "data_inicio": data_inicio.isoformat(),
                 "data_fim": data_fim.isoformat()
             }
-            _, msg = requisicao_agregacao("geracao_inversor", payload)
-            st.info(msg or "Aguardando processamento")
+            exibir_agregacao("geracao_inversor", payload)
+
+    elif tipo_analise == "Comparativo entre períodos":
+        referencia_inicio = st.date_input("Referência início", value=date.today().replace(day=1), key="ref_ini")
+        referencia_fim = st.date_input("Referência fim", value=date.today(), key="ref_fim")
+        agrupamento = st.selectbox("Agrupar por", ["usina", "inversor", "frota"])
+        if st.button("Comparar", key="comparativo"):
+            exibir_comparativo({
+                "data_inicio": data_inicio.isoformat(),
+                "data_fim": data_fim.isoformat(),
+                "referencia_inicio": referencia_inicio.isoformat(),
+                "referencia_fim": referencia_fim.isoformat(),
+                "agrupamento": agrupamento
+            })
+
+    elif tipo_analise == "Mapa de calor por hora":
+        metrica = st.selectbox("Métrica", ["geracao", "potencia_media", "potencia_maxima", "temperatura_media"])
+        usina_id = st.number_input("ID da Usina (0 para todas)", min_value=0, step=1, key="usina_mapa")
+        if st.button("Consultar", key="mapa_calor"):
+            payload = {
+                "data_inicio": data_inicio.isoformat(),
+                "data_fim": data_fim.isoformat(),
+                "metrica": metrica
+            }
+            if usina_id:
+                payload["usina_id"] = int(usina_id)
+            exibir_mapa_calor(payload)
 
     st.markdown("---")
     st.header("Resultados das Análises")
@@ -106,10 +198,7 @@ def render_analises():
                         for k, v in dado['parametros'].items():
                             st.write(f"{k}: {v}")
                         st.write("**Resultado:**")
-                        if isinstance(dado['resultado'], list) and dado['resultado'] and isinstance(dado['resultado'][0], dict):
-                            st.dataframe(dado['resultado'])
-                        else:
-                            st.write(dado['resultado'])
+                        exibir_resultado(dado['resultado'])
                 except Exception as e:
                     # Ignorar silenciosamente quaisquer erros e continuar
                     continue
@@ -14,12 +14,36 @@ API_URL = "http://localhost:8000"
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 RESULTS_DIR = os.path.join(BASE_DIR, "backend", "app", "workers", "results_analises")
 
+# Respostas GET já recebidas, indexadas por URL e parâmetros: {chave: (etag, dados)}
+# Ficam em memória enquanto o processo do Streamlit estiver ativo
+_cache_respostas = {}
+
+# Função auxiliar para requisições GET condicionais (If-None-Match)
+def requisicao_get_cache(url, params=None):
+    """
+    Faz um GET reaproveitando a última resposta quando a API indica que nada mudou (304).
+    Retorna a resposta e os dados JSON (None se a requisição falhar).
+    """
+    chave = (url, tuple(sorted((params or {}).items())))
+    em_cache = _cache_respostas.get(chave)
+    headers = {"If-None-Match": em_cache[0]} if em_cache else {}
+    resp = requests.get(url, params=params, headers=headers)
+    if resp.status_code == 304 and em_cache:
+        return resp, em_cache[1]
+    if resp.status_code != 200:
+        return resp, None
+    dados = resp.json()
+    etag = resp.headers.get("ETag")
+    if etag:
+        _cache_respostas[chave] = (etag, dados)
+    return resp, dados
+
 # Função para obter todas as usinas da API
 def obter_usinas():
     try:
-        resp = requests.get(f"{API_URL}/usinas/")
-        if resp.ok:
-            return resp.json()
+        resp, dados = requisicao_get_cache(f"{API_URL}/usinas/")
+        if dados is not None:
+            return dados
         else:
             st.error(f"Erro ao obter usinas: {resp.text}")
             return []
@@ -30,9 +54,9 @@ def obter_usinas():
 # Função para obter todos os inversores da API
 def obter_inversores():
     try:
-        resp = requests.get(f"{API_URL}/inversores/")
-        if resp.ok:
-            return resp.json()
+        resp, dados = requisicao_get_cache(f"{API_URL}/inversores/")
+        if dados is not None:
+            return dados
         else:
             st.error(f"Erro ao obter inversores: {resp.text}")
             return []
@@ -46,8 +70,9 @@ def obter_inversores_por_usina(usina_id):
     Retorna todos os inversores associados a uma usina específica consultando a API.
     """
     try:
-        inversores = obter_inversores()
-        if not inversores:
+        # A API já filtra pela usina: não é preciso baixar todos os inversores
+        resp, inversores_da_usina = requisicao_get_cache(f"{API_URL}/usinas/{usina_id}/inversores")
+        if inversores_da_usina is None:
             st.warning(f"Não foi possível obter inversores da API. Usando valores padrão para usina {usina_id}.")
             if usina_id == 1:
                 return [{"id": i} for i in range(1, 5)]
@@ -55,9 +80,6 @@ def obter_inversores_por_usina(usina_id):
                 return [{"id": i} for i in range(5, 9)]
             return []
         
-        # Filtrar inversores pela usina_id
-        inversores_da_usina = [inv for inv in inversores if inv.get("usina_id") == usina_id]
-        
         if not inversores_da_usina:
             st.warning(f"Nenhum inversor encontrado para a usina {usina_id}.")
         
@@ -106,9 +128,9 @@ def obter_resultado_analise(nome_arquivo):
     Obtém um resultado específico de análise pelo nome do arquivo.
     """
     try:
-        resp = requests.get(f"{API_URL}/agregacao/resultado/{nome_arquivo}")
-        if resp.ok:
-            return resp.json()
+        resp, dados = requisicao_get_cache(f"{API_URL}/agregacao/resultado/{nome_arquivo}")
+        if dados is not None:
+            return dados
         else:
             st.error(f"Erro ao obter resultado: {resp.text}")
             return None
@@ -183,9 +205,9 @@ def obter_dashboard():
     Obtém os dados mais recentes do dashboard.
     """
     try:
-        resp = requests.get(f"{API_URL}/agregacao/dash")
-        if resp.ok:
-            return resp.json()
+        resp, dados = requisicao_get_cache(f"{API_URL}/agregacao/dash")
+        if dados is not None:
+            return dados
         elif resp.status_code == 404:
             return None
         else: